@@ -1,58 +1,192 @@
 from fastapi import FastAPI
-from pydantic import BaseModel, Field
-import uvicorn
+from fastapi.responses import PlainTextResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+import time
+import os
+import numpy as np
 import pandas as pd
 import util as util
-import data_pipeline as data_pipeline
-import preprocessing as preprocessing
+import instrument as instrument
+import model_cache as model_cache
+import batcher as batcher
+import registry as registry
 
-config_data = util.load_config()
-model_data = util.pickle_load(config_data["production_model_path"])
+config_data = util.get_params()
+
+# Production model watched in the background, alongside an LRU cache of the reference data
+production_cache = model_cache.ModelCache(
+    config_data["model_registry_dir"], "production",
+    config_data["model_poll_interval_s"], config_data["reference_cache_size"]
+)
+
+# Per-ticker models of the multi-target mode, loaded on first request and checked on use instead of polled
+ticker_caches = dict()
+ticker_batchers = dict()
 
 
 class api_data(BaseModel):
-    stasiun : str
-    pm10 : int
-    pm25 : int
-    so2 : int
-    co : int
-    o3 : int
-    no2 : int
+    # Either a batch of feature return rows, or a date range to predict from stored prices
+    rows : Optional[List[Dict[str, float]]] = None
+    start_date : Optional[str] = None
+    end_date : Optional[str] = None
+    ticker : Optional[str] = None
+
+
+def known_ticker(ticker: str) -> bool:
+    # The ticker ends up in a stage file path, so it has to be a plain file name
+    if not ticker or ticker in (".", "..") or os.path.basename(ticker) != ticker:
+        return False
+
+    # Only tickers with a promoted stage get a cache, so unknown tickers never grow memory
+    return ticker in ticker_caches or registry.read_stage(config_data["model_registry_dir"], registry.target_stage(ticker)) is not None
+
+def ticker_cache(ticker: str) -> model_cache.ModelCache:
+    # Cache of the production stage of one target ticker, sharing the reference data cache
+    if ticker not in ticker_caches:
+        cache = model_cache.ModelCache(config_data["model_registry_dir"], registry.target_stage(ticker), 0)
+        cache.reference = production_cache.reference
+        ticker_caches.setdefault(ticker, cache)
+
+    return ticker_caches[ticker]
+
+def get_model(ticker: str = None) -> dict:
+    # Current production model, swapped atomically when a new one is promoted
+    if ticker is None:
+        return production_cache.get()
+
+    return ticker_cache(ticker).get(max_age=config_data["model_poll_interval_s"])
+
+def model_features(model: dict) -> list:
+    # Correlated features the production model has been trained on
+    return list(model["model_data"]["model_object"].feature_names_in_)
+
+def rows_to_frame(rows: list, features: list) -> pd.DataFrame:
+    # Build the whole batch at once, missing features become NaN
+    return pd.DataFrame.from_records(rows, columns=features)
+
+def range_to_frame(start_date: str, end_date: str, features: list) -> pd.DataFrame:
+    # Feature engineering is only needed for date range requests
+    import preprocessing as preprocessing
+
+    # Feature returns are cached until the price store is rewritten
+    path = config_data["clean_dataset_path"]
+    key = (path, tuple(features), util.artifact_mtime(path))
+
+    # Read only the feature columns from the price store and turn them into returns
+    returns = production_cache.reference.get(
+        key, lambda: preprocessing.compute_stock_return(util.pickle_load(path, columns=features))
+    )
+
+    # Keep requested date range
+    return returns.loc[start_date:end_date]
+
+def predict_frame(data: pd.DataFrame, ticker: str = None) -> np.ndarray:
+    # Predict every row in one estimator call
+    with instrument.span("predict", config_data.get("trace_api_sample_rate", 0.01), ticker=ticker, **instrument.shape(data)):
+        return get_model(ticker)["model_data"]["model_object"].predict(data)
+
+def get_batcher(ticker: str = None) -> batcher.MicroBatcher:
+    # Requests are only merged with requests for the same model
+    if ticker is None:
+        return predict_batcher
 
+    if ticker not in ticker_batchers:
+        ticker_batchers.setdefault(ticker, batcher.MicroBatcher(
+            lambda data: predict_frame(data, ticker), config_data["predict_max_batch_size"], config_data["predict_max_wait_ms"]
+        ))
+
+    return ticker_batchers[ticker]
+
+def validate_batch(data: pd.DataFrame) -> str:
+    # An empty batch, e.g. a date range without stored prices, has nothing to predict
+    if len(data) == 0:
+        return "No rows to predict, the request has no rows or its date range matches no stored dates."
+
+    # Check every row of the batch at once
+    invalid = ~np.isfinite(data.to_numpy(dtype="float64")).all(axis=1)
+    if invalid.any():
+        rows = np.flatnonzero(invalid)
+        return "{} of {} row(s) have missing or non-finite features, first rows: {}".format(
+            len(rows), len(data), data.index[rows[:10]].astype(str).tolist())
+
+    return ""
+
+
+# Concurrent requests share one predict call of up to max batch size rows or max wait milliseconds
+predict_batcher = batcher.MicroBatcher(predict_frame, config_data["predict_max_batch_size"], config_data["predict_max_wait_ms"])
 
 app = FastAPI()
 
+@app.on_event("startup")
+def start_model_cache():
+    # Load the production model and watch its pointer in the background
+    production_cache.start()
+
 @app.get("/")
 def home():
     return "Hello, FastAPI up!"
 
+@app.get("/model/status")
+def model_status():
+    # Current version, swap latency and request latency around the last swap
+    return production_cache.status()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Span timings of this process in the Prometheus text format
+    return instrument.metrics_text()
+
+@app.post("/model/rollback")
+def model_rollback():
+    # Swap back to the previous production model
+    try:
+        return {"model_uid": production_cache.rollback(), "error_msg": ""}
+    except RuntimeError as re:
+        return {"model_uid": None, "error_msg": str(re)}
+
 @app.post("/predict/")
-def predict(data: api_data):    
-    # Convert data api to dataframe
-    data = pd.DataFrame(data).set_index(0).T.reset_index(drop = True)
-
-    # Convert dtype
-    data = pd.concat(
-        [
-            data[config_data["predictors"][0]],
-            data[config_data["predictors"][1:]].astype(int)
-        ],
-        axis = 1
-    )
+async def predict(data: api_data):
+    request_time = time.perf_counter()
 
-    # Check range data
+    # Define model and its input features, the model of one target ticker in multi-target mode
+    ticker = data.ticker
+    if ticker is not None and not await run_in_threadpool(known_ticker, ticker):
+        return JSONResponse(status_code=404, content={"res": [], "dates": None, "error_msg": "No model has been promoted for ticker {}.".format(ticker)})
     try:
-        data_pipeline.check_data(data, config_data, True)
-    except AssertionError as ae:
-        return {"res": [], "error_msg": str(ae)}
-    
-    # Predict data
-    y_pred = model_data["model_data"]["model_object"].predict(data)
+        model = await run_in_threadpool(get_model, ticker)
+    except RuntimeError as re:
+        return {"res": [], "dates": None, "error_msg": str(re)}
+    features = model_features(model)
 
-    # Inverse tranform
-    #y_pred = list(le_encoder.inverse_transform(y_pred))[0] 
+    # Convert request into one feature frame
+    if data.rows is not None:
+        data = rows_to_frame(data.rows, features)
+        dates = None
+    elif data.start_date is not None:
+        data = await run_in_threadpool(range_to_frame, data.start_date, data.end_date, features)
+        dates = data.index.strftime("%Y-%m-%d").tolist()
+    else:
+        return {"res": [], "dates": None, "error_msg": "Either rows or start_date has to be given."}
 
-    return {"res" : y_pred, "error_msg": ""}
+    # Check range data
+    error_msg = validate_batch(data)
+    if error_msg:
+        return {"res": [], "dates": dates, "error_msg": error_msg}
+
+    # Predict the whole batch in one estimator call, merged with other concurrent requests when batching
+    if config_data["predict_batching"]:
+        y_pred = await get_batcher(ticker).submit(data)
+    else:
+        y_pred = await run_in_threadpool(predict_frame, data, ticker)
+
+    # Record request latency for the model status endpoint
+    production_cache.record_latency(time.perf_counter() - request_time)
+
+    return {"res" : y_pred.tolist(), "dates": dates, "error_msg": ""}
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("api:app", host = "0.0.0.0", port = 8080)
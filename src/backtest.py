@@ -0,0 +1,98 @@
+from sklearn.metrics import mean_squared_error, mean_absolute_error
+from sklearn.base import clone
+import pandas as pd
+import numpy as np
+import util as util
+import parallel as parallel
+
+
+def walk_forward_splits(n_samples: int, min_train_size: int, refit_every: int, window: str = "expanding",
+                        train_size: int = None, gap: int = 0) -> list:
+    # Variabel to store (train start, train end, test start, test end) of every fold
+    splits = []
+
+    # The model is refit every `refit_every` rows and predicts the rows until the next refit
+    test_start = min_train_size + gap
+    while test_start < n_samples:
+        # Leave `gap` rows out between train and test, their target overlaps the test period
+        train_end = test_start - gap
+        if window == "expanding":
+            train_start = 0
+        elif window == "sliding":
+            train_start = max(0, train_end - (train_size or min_train_size))
+        else:
+            raise ValueError("Unknown window type: {}".format(window))
+
+        test_end = min(test_start + refit_every, n_samples)
+        splits.append((train_start, train_end, test_start, test_end))
+        test_start = test_end
+
+    return splits
+
+def evaluate_fold(model_object, x: np.ndarray, y: np.ndarray, split: tuple, feature_names: list) -> dict:
+    # Slice the precomputed features by index, contiguous slices are views, not copies
+    train_start, train_end, test_start, test_end = split
+    x_train = pd.DataFrame(x[train_start:train_end], columns=feature_names)
+    x_test = pd.DataFrame(x[test_start:test_end], columns=feature_names)
+    y_test = y[test_start:test_end]
+
+    # Refit a fresh copy of the model on the fold and predict its test rows
+    model_object = clone(model_object)
+    model_object.fit(x_train, y[train_start:train_end])
+    y_pred = model_object.predict(x_test)
+
+    return {
+        "train_start": train_start,
+        "train_end": train_end,
+        "test_start": test_start,
+        "test_end": test_end,
+        "mse": mean_squared_error(y_test, y_pred),
+        "mae": mean_absolute_error(y_test, y_pred),
+        "directional_accuracy": float(np.mean(np.sign(y_pred) == np.sign(y_test))),
+    }
+
+def backtest_splits(params: dict, n_samples: int) -> list:
+    # Walk-forward splits defined in config, the gap covers the D+2 target horizon
+    return walk_forward_splits(
+        n_samples,
+        params["backtest_min_train_size"],
+        params["backtest_refit_every"],
+        params["backtest_window"],
+        params.get("backtest_train_size"),
+        params["backtest_horizon"],
+    )
+
+def evaluate_fold_task(task: dict) -> dict:
+    # Fold evaluation on the arrays shared with every worker
+    arrays = parallel.shared_arrays()
+    return evaluate_fold(task["model_object"], arrays["x"], arrays["y"], task["split"], task["feature_names"])
+
+def run_backtest(model_object, x: pd.DataFrame, y: pd.Series, params: dict, workers: int = None) -> pd.DataFrame:
+    # Define every fold on the full history
+    splits = backtest_splits(params, len(x))
+    feature_names = list(x.columns)
+
+    # Debug message
+    util.print_debug("Backtesting {} on {} folds.".format(model_object.__class__.__name__, len(splits)))
+
+    # Evaluate folds in parallel, features are shared once and only sliced per fold
+    tasks = [{"model_object": model_object, "split": split, "feature_names": feature_names} for split in splits]
+    arrays = {"x": x.to_numpy(dtype="float64"), "y": y.to_numpy(dtype="float64")}
+    folds = pd.DataFrame(parallel.run_tasks(evaluate_fold_task, tasks, workers or params.get("backtest_workers", 1), arrays))
+
+    # Add fold dates
+    folds.insert(0, "fold", range(len(folds)))
+    folds["test_start_date"] = x.index[folds["test_start"]]
+    folds["test_end_date"] = x.index[folds["test_end"] - 1]
+
+    return folds
+
+def aggregate_folds(folds: pd.DataFrame) -> dict:
+    # Fold-aggregated metrics, weighted by the number of test rows of every fold
+    weights = folds["test_end"] - folds["test_start"]
+    return {
+        "backtest_mse": float(np.average(folds["mse"], weights=weights)),
+        "backtest_mae": float(np.average(folds["mae"], weights=weights)),
+        "backtest_directional_accuracy": float(np.average(folds["directional_accuracy"], weights=weights)),
+        "backtest_folds": int(len(folds)),
+    }
@@ -0,0 +1,66 @@
+import asyncio
+import numpy as np
+import pandas as pd
+
+
+class MicroBatcher:
+    # Collect concurrent prediction requests into one vectorized predict call
+    def __init__(self, predict_fn, max_batch_size: int, max_wait_ms: float):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.worker = None
+
+    async def submit(self, data: pd.DataFrame) -> np.ndarray:
+        # Start the batching loop on the running event loop at first use
+        loop = asyncio.get_running_loop()
+        if self.worker is None or self.worker.done() or self.worker.get_loop() is not loop:
+            self.queue = asyncio.Queue()
+            self.worker = loop.create_task(self.run())
+
+        # Wait for the rows of this request to come back from a batch
+        future = loop.create_future()
+        await self.queue.put((data, future))
+        return await future
+
+    async def collect(self) -> list:
+        # Wait for the first request, then keep collecting until the batch is full or max wait has passed
+        items = [await self.queue.get()]
+        rows = len(items[0][0])
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+
+        while rows < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            items.append(item)
+            rows += len(item[0])
+
+        return items
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self.collect()
+
+            # Predict the whole batch in a worker thread, so the event loop keeps accepting requests
+            batch = pd.concat([data for data, _ in items], ignore_index=True)
+            try:
+                y_pred = await loop.run_in_executor(None, self.predict_fn, batch)
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            # Fan the predictions back out to every awaiting request
+            offset = 0
+            for data, future in items:
+                if not future.done():
+                    future.set_result(y_pred[offset:offset + len(data)])
+                offset += len(data)
@@ -0,0 +1,589 @@
+from multiprocessing import get_context
+from sklearn.linear_model import Ridge
+import asyncio
+import argparse
+import subprocess
+import socket
+import os
+import json
+import numpy as np
+import pandas as pd
+import tempfile
+import tracemalloc
+import resource
+import copy
+import sys
+import time
+import util as util
+import data_pipeline as data_pipeline
+import preprocessing as preprocessing
+import modelling as modelling
+import downsample as downsample
+
+
+def synthetic_price_panel(n_tickers: int, n_days: int, seed: int = 0, nan_density: float = 0.0, delisted: float = 0.0) -> pd.DataFrame:
+    # Random walk prices for n tickers on business days
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0, 0.02, size=(n_days, n_tickers))
+    prices = 1000 * np.exp(np.cumsum(returns, axis=0))
+
+    # Scattered missing prices, like days a ticker did not trade
+    if nan_density > 0:
+        prices[rng.random(size=prices.shape) < nan_density] = np.nan
+
+    # A share of tickers listed late or delisted early, leaving a gap at the start or end of their history
+    if delisted > 0:
+        for column in rng.choice(n_tickers, size=int(n_tickers * delisted), replace=False):
+            cut = rng.integers(n_days // 10, n_days // 2)
+            if rng.random() < 0.5:
+                prices[:cut, column] = np.nan
+            else:
+                prices[n_days - cut:, column] = np.nan
+
+    # Name tickers like IDX codes at yfinance
+    columns = ["T{:04d}.JK".format(i) for i in range(n_tickers)]
+    index = pd.date_range(start="2000-01-03", periods=n_days, freq="B")
+
+    return pd.DataFrame(prices, index=index, columns=columns)
+
+def time_call(function, *args, repeat: int = 3, **kwargs) -> float:
+    # Best wall clock time out of several runs
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+def legacy_check_data(input_data, params):
+    # Column by column implementation of check_data, kept as benchmark reference
+    error_messages = []
+    error_stock_tickers = []
+    for column in input_data.columns:
+        if input_data[column].dtype != 'float64':
+            error_messages.append(f"Column ({column}) has a non-float data type")
+            error_stock_tickers.append(column)
+
+        if not (input_data[column] >= 0).sum() == len(input_data):
+            error_messages.append(f'an error occurs in {column} column')
+            if column not in error_stock_tickers:
+                error_stock_tickers.append(column)
+
+    return error_stock_tickers
+
+def bench_check_data(n_tickers: int = 2000, n_days: int = 5000) -> dict:
+    params = util.load_config()
+
+    # Synthetic panel with a few negative and missing values
+    dataset = synthetic_price_panel(n_tickers, n_days)
+    dataset.iloc[10, 5] = -1.0
+    dataset.iloc[20:30, 7] = np.nan
+
+    # Both implementations must agree on offending tickers
+    assert legacy_check_data(dataset, params) == data_pipeline.check_data(dataset, params, print_errors=False)
+
+    result = {
+        "legacy": time_call(legacy_check_data, dataset, params),
+        "vectorized": time_call(data_pipeline.check_data, dataset, params, print_errors=False),
+        "vectorized_chunked": time_call(data_pipeline.check_data, dataset, params, print_errors=False, chunk_size=256),
+    }
+    print("check_data on {} tickers x {} days".format(n_tickers, n_days))
+    for name, seconds in result.items():
+        print("  {:<20} {:8.4f}s  ({:.1f}x)".format(name, seconds, result["legacy"] / seconds))
+
+    return result
+
+def bench_correlation(ticker_counts: list = (100, 1000, 5000), n_days: int = 2500, k: int = 10) -> dict:
+    params = util.load_config()
+    target = "{} Return D+2".format(params["target"])
+    result = dict()
+
+    for n_tickers in ticker_counts:
+        # Synthetic returns with missing values and the target as last column
+        dataset = preprocessing.compute_stock_return(synthetic_price_panel(n_tickers, n_days)).iloc[1:]
+        dataset.iloc[::17, ::3] = np.nan
+        dataset[target] = dataset.iloc[:, 0].shift(-2)
+
+        # Both implementations must select the same features
+        legacy = dataset.corrwith(dataset[target]).nlargest(k).sort_values(ascending=True)
+        vectorized = preprocessing.top_k_correlated(preprocessing.correlation_with_target(dataset, target, chunk_size=512), k)
+        assert list(legacy.index) == list(vectorized.index)
+
+        result[n_tickers] = {
+            "legacy": time_call(lambda: dataset.corrwith(dataset[target]).nlargest(k)),
+            "vectorized": time_call(lambda: preprocessing.top_k_correlated(preprocessing.correlation_with_target(dataset, target), k)),
+            "vectorized_chunked": time_call(lambda: preprocessing.top_k_correlated(preprocessing.correlation_with_target(dataset, target, chunk_size=512), k)),
+            "rolling_chunked": time_call(preprocessing.rolling_correlation_with_target, dataset, target, 250, chunk_size=512, repeat=1),
+        }
+        print("top-{} correlation on {} tickers x {} days".format(k, n_tickers, n_days))
+        for name, seconds in result[n_tickers].items():
+            print("  {:<20} {:8.4f}s  ({:.1f}x)".format(name, seconds, result[n_tickers]["legacy"] / seconds))
+
+    return result
+
+def chart_spec_size(data: pd.DataFrame) -> int:
+    # Size of the chart spec sent to the browser, the JSON of its records when Altair is not installed
+    try:
+        import altair as alt
+    except ImportError:
+        return len(data.to_json(orient="records", date_format="iso"))
+
+    alt.data_transformers.disable_max_rows()
+    return len(alt.Chart(data).mark_line().encode(x="date:T", y="price:Q", color="symbol:N").to_json())
+
+def bench_downsample(point_counts: list = (1000, 10000, 50000), max_points: int = 600) -> dict:
+    result = dict()
+
+    for n_points in point_counts:
+        # Actual and predicted long format price history of one symbol
+        prices = synthetic_price_panel(2, n_points).iloc[:, 0]
+        price_history = pd.concat([
+            prices.rename("price").to_frame().assign(symbol="Actual"),
+            (prices * 1.01).rename("price").to_frame().assign(symbol="Prediction"),
+        ]).rename_axis("date").reset_index()
+
+        result[n_points] = {"raw_bytes": chart_spec_size(price_history), "raw_prep": time_call(chart_spec_size, price_history, repeat=1)}
+        for method in ["lttb", "minmax"]:
+            chart = downsample.zoom(price_history, max_points=max_points, method=method)
+            result[n_points][method + "_bytes"] = chart_spec_size(chart)
+            result[n_points][method + "_prep"] = time_call(lambda: chart_spec_size(downsample.zoom(price_history, max_points=max_points, method=method)), repeat=1)
+
+        print("price chart of {} points per symbol".format(n_points))
+        print("  {:<8} {:>12} {:>10}".format("method", "spec bytes", "prep"))
+        for method in ["raw", "lttb", "minmax"]:
+            print("  {:<8} {:>12} {:>9.4f}s".format(method, result[n_points][method + "_bytes"], result[n_points][method + "_prep"]))
+
+    return result
+
+def measure_memory(function, *args) -> dict:
+    # Run the function in a fresh child process, so peak RSS is not shared between measurements
+    def target(queue):
+        tracemalloc.start()
+        start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        function(*args)
+        queue.put({
+            "tracemalloc_peak_mb": tracemalloc.get_traced_memory()[1] / 2 ** 20,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10,
+            "rss_growth_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss) / 2 ** 10,
+        })
+
+    context = get_context("fork")
+    queue = context.Queue()
+    process = context.Process(target=target, args=(queue,))
+    process.start()
+    result = queue.get()
+    process.join()
+
+    return result
+
+def modelling_run(params: dict, tuning: bool, legacy: bool) -> None:
+    if tuning:
+        modelling.main(params)
+        return
+
+    # Baseline training and production model selection of modelling.main
+    list_of_trained_model, training_log = modelling.train_eval("Baseline", params)
+
+    # Replay the deep copies the previous implementation made: one copy of every trained model
+    # on append, one of every per-feature list, then the whole dict again in get_production_model
+    legacy_copies = []
+    if legacy:
+        legacy_copies.append({key: copy.deepcopy(models) for key, models in list_of_trained_model.items()})
+        legacy_copies.append({key: copy.deepcopy(models) for key, models in list_of_trained_model.items()})
+        legacy_copies.append(copy.deepcopy(list_of_trained_model))
+
+    modelling.get_production_model(list_of_trained_model, training_log, params)
+
+def bench_training_memory(tuning: bool = False) -> dict:
+    params = util.load_config()
+
+    # Keep production model and training log of the benchmark away from the real ones
+    tmp_dir = tempfile.mkdtemp()
+    params["model_registry_dir"] = tmp_dir + "/registry"
+    params["training_log_path"] = tmp_dir + "/training_log.db"
+    params["search_cache_path"] = tmp_dir + "/search_cache.db"
+
+    # Every run trains from scratch instead of resuming from a checkpointed one
+    params["run_manifest_enabled"] = False
+
+    # Train in-process so fitted models are accounted in the measured process
+    params["training_workers"] = 1
+    util.PRINT_DEBUG = False
+
+    result = {
+        "legacy_deepcopy": measure_memory(modelling_run, params, tuning, True),
+        "current": measure_memory(modelling_run, params, tuning, False),
+    }
+    print("modelling run memory ({})".format("full main" if tuning else "baseline training and selection"))
+    for name, stats in result.items():
+        print("  {:<16} tracemalloc peak {:8.1f} MB  peak RSS {:8.1f} MB  RSS growth {:8.1f} MB".format(
+            name, stats["tracemalloc_peak_mb"], stats["peak_rss_mb"], stats["rss_growth_mb"]))
+
+    return result
+
+def serve_in_process(app, port: int):
+    import uvicorn
+    import httpx
+
+    # Local uvicorn instance in a forked process, so the load generator does not share its GIL
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    process = get_context("fork").Process(target=server.run, daemon=True)
+    process.start()
+
+    # Wait until the server answers
+    while True:
+        try:
+            httpx.get("http://127.0.0.1:{}/".format(port))
+            return process
+        except httpx.TransportError:
+            time.sleep(0.05)
+
+async def post_json(reader, writer, host: str, path: str, body: bytes) -> bytes:
+    # Minimal HTTP/1.1 keep-alive POST, lighter than a full client so the server is what gets measured
+    writer.write("POST {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n".format(
+        path, host, len(body)).encode() + body)
+    await writer.drain()
+
+    # Read status line and headers, then the body by its length
+    headers = await reader.readuntil(b"\r\n\r\n")
+    status = int(headers.split(b" ", 2)[1])
+    length = int([line for line in headers.split(b"\r\n") if line.lower().startswith(b"content-length")][0].split(b":")[1])
+    content = await reader.readexactly(length)
+    if status != 200:
+        raise RuntimeError("HTTP {}: {}".format(status, content[:200]))
+
+    return content
+
+async def load_test(host: str, port: int, path: str, payloads: list, concurrency: int) -> tuple:
+    # Every connection sends its share of the payloads one after another
+    latencies = []
+    bodies = [json.dumps(payload).encode() for payload in payloads]
+
+    async def connection(share):
+        reader, writer = await asyncio.open_connection(host, port)
+        for body in share:
+            start = time.perf_counter()
+            await post_json(reader, writer, host, path, body)
+            latencies.append(time.perf_counter() - start)
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[connection(bodies[i::concurrency]) for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    return np.array(latencies), elapsed
+
+def bench_api_load(n_requests: int = 2000, concurrency: int = 64, n_features: int = 10, port: int = 8089) -> dict:
+    import api
+
+    # Serve a Ridge model fitted on synthetic feature returns
+    returns = synthetic_price_panel(n_features, 500).pct_change().dropna() * 100
+    api.production_cache.poll_interval = 0
+    api.production_cache.swap("benchmark", {"model_data": {"model_name": "Ridge", "model_object": Ridge().fit(returns, returns.iloc[:, 0]), "model_uid": ""}})
+
+    # Single-row requests, the worst case for per-request predict calls
+    rows = returns.to_dict(orient="records")
+    payloads = [{"rows": [rows[i % len(rows)]]} for i in range(n_requests)]
+
+    result = {}
+    for batching in (False, True):
+        # The server process inherits the model and the batching switch
+        api.config_data["predict_batching"] = batching
+        process = serve_in_process(api.app, port)
+        try:
+            latencies, elapsed = asyncio.run(load_test("127.0.0.1", port, "/predict/", payloads, concurrency))
+        finally:
+            process.terminate()
+            process.join()
+
+        result["batching" if batching else "no_batching"] = {
+            "p50_ms": np.percentile(latencies, 50) * 1000,
+            "p99_ms": np.percentile(latencies, 99) * 1000,
+            "throughput_rps": n_requests / elapsed,
+        }
+
+    print("/predict load test: {} single-row requests, {} concurrent".format(n_requests, concurrency))
+    for name, stats in result.items():
+        print("  {:<12} p50 {:7.2f} ms  p99 {:7.2f} ms  throughput {:8.1f} req/s".format(
+            name, stats["p50_ms"], stats["p99_ms"], stats["throughput_rps"]))
+
+    return result
+
+def bench_compact_panel(n_tickers: int = 900, n_days: int = 3000, seed: int = 0) -> dict:
+    import panel as panel
+
+    params = util.load_config()
+    tolerance = params.get("compact_mse_tolerance", 0.01)
+
+    # float64 panel as stored today and its compact float32 copy
+    prices = synthetic_price_panel(n_tickers, n_days, seed, nan_density=0.01, delisted=0.05)
+    prices = prices.rename(columns={prices.columns[0]: params["target"]})
+    compact = panel.compact_frame(prices, "float32")
+
+    result = {"memory": dict(), "mse": dict()}
+    selected = dict()
+    for name, dataset in [("float64", prices), ("float32", compact)]:
+        # Same feature engineering and selection on both representations
+        returns = preprocessing.transform_to_stock_return(dataset, params)
+        train_set, valid_set, _ = np.split(returns, [int(len(returns) * 0.7), int(len(returns) * 0.85)])
+        corr_stock, train_set, valid_set, _ = preprocessing.keep_correlated_features(train_set, valid_set, valid_set, params)
+        selected[name] = list(corr_stock.index)
+
+        result["memory"][name] = {"prices_mb": panel.memory_usage(dataset) / 2 ** 20, "returns_mb": panel.memory_usage(returns) / 2 ** 20,
+                                  "blocks": dataset._mgr.nblocks}
+
+        # Validation MSE of every model family, models with a random state are seeded so only the dtype differs
+        for model in modelling.create_model_object(params):
+            model_object = model["model_object"]
+            if "random_state" in model_object.get_params():
+                model_object.set_params(random_state=seed)
+            x_train, x_valid = train_set.iloc[:, :-1].fillna(0), valid_set.iloc[:, :-1].fillna(0)
+            model_object.fit(x_train, train_set.iloc[:, -1])
+            mse = modelling.mean_squared_error(valid_set.iloc[:, -1].astype("float64"), model_object.predict(x_valid).astype("float64"))
+            result["mse"].setdefault(model["model_name"], dict())[name] = mse
+
+    # Both representations must select the same features and keep every MSE within the tolerance
+    for model_name, mse in result["mse"].items():
+        mse["relative_change"] = abs(mse["float32"] - mse["float64"]) / mse["float64"]
+    result["same_features"] = selected["float64"] == selected["float32"]
+    result["within_tolerance"] = result["same_features"] and all(mse["relative_change"] <= tolerance for mse in result["mse"].values())
+
+    print("compact panel on {} tickers x {} days".format(n_tickers, n_days))
+    for name, memory in result["memory"].items():
+        print("  {:<8} prices {:8.1f} MB  returns {:8.1f} MB  blocks {:5d}".format(name, memory["prices_mb"], memory["returns_mb"], memory["blocks"]))
+    for model_name, mse in result["mse"].items():
+        print("  {:<24} MSE float64 {:.6f}  float32 {:.6f}  change {:.2e}".format(model_name, mse["float64"], mse["float32"], mse["relative_change"]))
+    print("  same features: {}  within tolerance {}: {}".format(result["same_features"], tolerance, result["within_tolerance"]))
+
+    return result
+
+def suite_params(tmp_dir: str) -> dict:
+    params = util.load_config()
+
+    # Every artifact of the suite goes to a temporary directory, away from the real ones
+    for key in ["train_feng_set_path", "valid_feng_set_path", "test_feng_set_path"]:
+        params[key] = [os.path.join(tmp_dir, os.path.basename(path)) for path in params[key]]
+    params["model_registry_dir"] = os.path.join(tmp_dir, "registry")
+    params["training_log_path"] = os.path.join(tmp_dir, "training_log.db")
+    params["search_cache_path"] = os.path.join(tmp_dir, "search_cache.db")
+
+    # Every run trains from scratch in-process, so runs are comparable
+    params["run_manifest_enabled"] = False
+    params["training_workers"] = 1
+
+    return params
+
+def predict_latency(n_requests: int, features: pd.DataFrame, model_object) -> dict:
+    import api
+    from fastapi.testclient import TestClient
+
+    # Single-row requests through the whole app, served in-process
+    api.production_cache.swap("benchmark", {"model_data": {"model_name": type(model_object).__name__, "model_object": model_object, "model_uid": ""}})
+    client = TestClient(api.app)
+    rows = features.to_dict(orient="records")
+
+    latencies = []
+    for i in range(n_requests):
+        start = time.perf_counter()
+        client.post("/predict/", json={"rows": [rows[i % len(rows)]]})
+        latencies.append(time.perf_counter() - start)
+
+    return {"predict_p50_ms": np.percentile(latencies, 50) * 1000, "predict_p99_ms": np.percentile(latencies, 99) * 1000}
+
+def bench_suite(n_tickers: int = 300, n_days: int = 1500, nan_density: float = 0.01, delisted: float = 0.05, seed: int = 0, n_requests: int = 200) -> dict:
+    tmp_dir = tempfile.mkdtemp()
+    params = suite_params(tmp_dir)
+    util.PRINT_DEBUG = False
+
+    # Synthetic panel with the configured target as first ticker, no network needed
+    prices = synthetic_price_panel(n_tickers, n_days, seed, nan_density, delisted)
+    prices = prices.rename(columns={prices.columns[0]: params["target"]})
+    result = dict()
+
+    # Validation and feature engineering on the full panel
+    result["check_data_s"] = time_call(data_pipeline.check_data, prices, params, print_errors=False)
+    result["transform_to_stock_return_s"] = time_call(preprocessing.transform_to_stock_return, prices, params)
+
+    # Correlated feature selection on a 70/15/15 time split of the returns
+    returns = preprocessing.transform_to_stock_return(prices, params)
+    train_set, valid_set, test_set = np.split(returns, [int(len(returns) * 0.7), int(len(returns) * 0.85)])
+    result["keep_correlated_features_s"] = time_call(preprocessing.keep_correlated_features, train_set, valid_set, test_set, params)
+
+    # Pickle and columnar store I/O of the price panel
+    storage_format = util.STORAGE_FORMAT
+    for name in ["pickle", "arrow"]:
+        util.STORAGE_FORMAT = name
+        path = os.path.join(tmp_dir, "prices_{}.pkl".format(name))
+        result["{}_dump_s".format(name)] = time_call(util.pickle_dump, prices, path)
+        result["{}_load_s".format(name)] = time_call(util.pickle_load, path)
+    util.STORAGE_FORMAT = "pickle"
+
+    # Feature sets written as the preprocessing stage would, then one training run per model family
+    # Missing synthetic returns are filled, not every model family accepts NaN
+    _, train_set, valid_set, test_set = preprocessing.keep_correlated_features(train_set, valid_set, test_set, params)
+    for split, path in zip([train_set, valid_set, test_set], ["train_feng_set_path", "valid_feng_set_path", "test_feng_set_path"]):
+        util.pickle_dump(split.iloc[:, :-1].fillna(0), params[path][0])
+        util.pickle_dump(split.iloc[:, -1], params[path][1])
+    for model in modelling.create_model_object(params):
+        result["train_eval_{}_s".format(model["model_name"])] = time_call(modelling.train_eval, "Benchmark", params, [model], repeat=1)
+    util.STORAGE_FORMAT = storage_format
+
+    # /predict latency of a model on the selected features
+    x_train = train_set.iloc[:, :-1].fillna(0)
+    result.update(predict_latency(n_requests, x_train, Ridge().fit(x_train, train_set.iloc[:, -1])))
+
+    return {"config": {"n_tickers": n_tickers, "n_days": n_days, "nan_density": nan_density, "delisted": delisted, "seed": seed, "n_requests": n_requests},
+            "results": result}
+
+def git_commit() -> str:
+    # Commit the suite ran on, None outside a git checkout
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def append_history(run: dict, path: str) -> None:
+    # One JSON line per suite run
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as file:
+        file.write(json.dumps(run) + "\n")
+
+def detect_regressions(run: dict, baseline: dict, tolerance: float, min_seconds: float = 0.005) -> list:
+    # Only runs on the same synthetic data are comparable
+    if baseline is None or baseline["config"] != run["config"]:
+        return []
+
+    # Metrics slower than the baseline by more than the tolerance, timings too small to be reliable are skipped
+    regressions = []
+    for name, value in run["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        floor = min_seconds * 1000 if name.endswith("_ms") else min_seconds
+        if value > reference * (1 + tolerance) and value > floor:
+            regressions.append({"metric": name, "baseline": reference, "current": value, "ratio": value / reference})
+
+    return regressions
+
+def run_suite(save_baseline: bool = False, tolerance: float = None) -> list:
+    params = util.load_config()
+    tolerance = params.get("benchmark_tolerance", 0.25) if tolerance is None else tolerance
+
+    # Time every stage and record the run with the commit it ran on
+    run = bench_suite(**(params.get("benchmark_suite") or {}))
+    run.update({"timestamp": str(util.time_stamp()), "commit": git_commit()})
+    append_history(run, params["benchmark_history_path"])
+
+    # Compare against the baseline, or make this run the new baseline
+    baseline = None
+    if os.path.isfile(params["benchmark_baseline_path"]):
+        with open(params["benchmark_baseline_path"], "r") as file:
+            baseline = json.load(file)
+    if baseline is not None and baseline["config"] != run["config"]:
+        print("Baseline was recorded on other synthetic data, save a new one with --save-baseline.")
+    regressions = detect_regressions(run, baseline, tolerance)
+    if save_baseline:
+        with open(params["benchmark_baseline_path"], "w") as file:
+            json.dump(run, file, indent=2)
+
+    print("benchmark suite on {n_tickers} tickers x {n_days} days".format(**run["config"]))
+    for name, value in run["results"].items():
+        reference = baseline["results"].get(name) if baseline is not None else None
+        change = " ({:+.0%})".format(value / reference - 1) if reference else ""
+        print("  {:<36} {:10.4f}{}".format(name, value, change))
+
+    # Fail on a regression, so it can gate CI
+    if regressions:
+        for regression in regressions:
+            print("Regression: {metric} {current:.4f} vs baseline {baseline:.4f} ({ratio:.2f}x)".format(**regression))
+        sys.exit(1)
+
+    return regressions
+
+def import_times(module: str) -> list:
+    # Cumulative import time of every module imported by `python -X importtime -c "import module"`
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import {}".format(module)],
+        env=dict(os.environ, PYTHONPATH="src"), capture_output=True, text=True, check=True,
+    ).stderr
+
+    times = []
+    for line in output.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line.split("|")
+            times.append((name.strip(), int(cumulative) / 1000))
+
+    return times
+
+def bench_startup(max_import_ms: float = None, max_first_response_ms: float = None, port: int = 8090) -> dict:
+    # Import time of the serving module and its heaviest dependencies
+    times = import_times("api")
+    import_ms = dict(times)["api"]
+
+    # Time from process start until the API answers its first request
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--app-dir", "src", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=1) as connection:
+                    connection.sendall(b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n")
+                    if connection.recv(12).startswith(b"HTTP/1.1 200"):
+                        break
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError("API process exited with code {}".format(process.returncode))
+                time.sleep(0.01)
+        first_response_ms = (time.perf_counter() - start) * 1000
+    finally:
+        process.terminate()
+        process.wait()
+
+    result = {"import_ms": import_ms, "first_response_ms": first_response_ms}
+    print("API startup")
+    print("  import api          {:8.1f} ms".format(import_ms))
+    print("  first response      {:8.1f} ms".format(first_response_ms))
+    print("  heaviest imports:")
+    for name, cumulative in sorted(times, key=lambda item: -item[1])[1:11]:
+        print("    {:<40} {:8.1f} ms".format(name, cumulative))
+
+    # Fail when a threshold is exceeded, so it can gate CI
+    if (max_import_ms and import_ms > max_import_ms) or (max_first_response_ms and first_response_ms > max_first_response_ms):
+        print("API startup exceeds its budget.")
+        sys.exit(1)
+
+    return result
+
+BENCHMARKS = {
+    "check_data": bench_check_data,
+    "correlation": bench_correlation,
+    "downsample": bench_downsample,
+    "training_memory": bench_training_memory,
+    "api_load": bench_api_load,
+    "startup": bench_startup,
+    "compact_panel": bench_compact_panel,
+    "suite": run_suite,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmarks", nargs="*", help="benchmarks to run, all by default: {}".format(", ".join(BENCHMARKS)))
+    parser.add_argument("--max-import-ms", type=float, help="startup: fail when importing api takes longer")
+    parser.add_argument("--max-first-response-ms", type=float, help="startup: fail when the first response takes longer")
+    parser.add_argument("--save-baseline", action="store_true", help="suite: make this run the baseline of regression detection")
+    parser.add_argument("--tolerance", type=float, help="suite: slowdown over the baseline counted as a regression, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    # Run the benchmarks given as arguments, or all of them
+    for name in args.benchmarks or list(BENCHMARKS):
+        if name == "startup":
+            bench_startup(args.max_import_ms, args.max_first_response_ms)
+        elif name == "suite":
+            run_suite(args.save_baseline, args.tolerance)
+        else:
+            BENCHMARKS[name]()
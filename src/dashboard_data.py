@@ -0,0 +1,122 @@
+import pandas as pd
+import time
+import os
+
+import util as util
+import downsample as downsample
+
+# Snapshot served to every rerun of the dashboard in this process
+_cache = {"snapshot": None, "key": None, "checked_at": 0.0}
+
+
+def source_paths(params: dict) -> list:
+    # Artifacts the dashboard is computed from
+    return [params["raw_dataset_path"], params["predict_dataset_path"], params["clean_dataset_path"]]
+
+def source_key(params: dict) -> tuple:
+    # Modification time of every source artifact, missing ones included
+    key = []
+    for path in source_paths(params):
+        try:
+            key.append(util.artifact_mtime(path))
+        except FileNotFoundError as fe:
+            key.append(None)
+
+    return tuple(key)
+
+def price_metrics(actual: pd.Series, predicted: pd.Series) -> dict:
+    # Latest values come from the end of the date sorted series, no full sort per metric
+    latest_price, latest_price_lag = actual.iloc[-1], actual.iloc[-2]
+    latest_pred = predicted.iloc[-1]
+    change = (latest_price - latest_price_lag) / latest_price_lag
+    change_pred = (latest_pred - latest_price_lag) / latest_price_lag
+
+    return {
+        "latest_price": latest_price,
+        "change": change,
+        "latest_pred": latest_pred,
+        "change_pred": change_pred,
+        "price_var": latest_pred - latest_price,
+        "change_var": change_pred - change,
+    }
+
+def daily_snapshots(returns: pd.DataFrame, last_n_days: int) -> dict:
+    # Long format returns of the last n days in one reshape, latest first
+    last_days = returns.tail(last_n_days).iloc[::-1]
+    data = last_days.rename_axis(index="date", columns="index_name").stack().rename("price").reset_index()
+
+    # Symmetric range of every daily chart
+    return {"data": data, "symmetric_range": last_days.abs().max(axis=1)}
+
+def chart_data(price_history: pd.DataFrame, params: dict, start=None, end=None) -> pd.DataFrame:
+    # Price chart of the zoomed date range at the chart resolution
+    return downsample.zoom(price_history, start, end, params.get("dashboard_max_points"), params.get("dashboard_downsample_method", "lttb"))
+
+def build_snapshot(params: dict) -> dict:
+    # Actual and predicted price of the target stock, sorted by date once
+    target_stock = params["target_stock"]
+    actual = util.pickle_load(params["raw_dataset_path"], columns=[target_stock])[target_stock].dropna().sort_index()
+    predicted = util.pickle_load(params["predict_dataset_path"]).dropna().sort_index()
+
+    # Full resolution long format price history, zoomed charts are downsampled from it
+    price_history = pd.concat([
+        actual.rename("price").to_frame().assign(symbol=target_stock + " Actual"),
+        predicted.rename("price").to_frame().assign(symbol=target_stock + " Prediction"),
+    ])
+    price_history.index.name = "date"
+    price_history = price_history.reset_index()
+
+    # Only the tail of the clean dataset is needed for the daily charts, so only its latest partition is read
+    last_n_days = params.get("dashboard_last_n_days", 5)
+    returns = util.pickle_load(params["clean_dataset_path"], start=actual.index[-1] - pd.Timedelta(days=7 * last_n_days)).sort_index()
+    if len(returns) < last_n_days:
+        returns = util.pickle_load(params["clean_dataset_path"]).sort_index()
+
+    return {
+        "metrics": price_metrics(actual, predicted),
+        "price_history": price_history,
+        # Default view of the whole history, downsampled per symbol to the chart resolution
+        "stock_price": chart_data(price_history, params),
+        "daily": daily_snapshots(returns, last_n_days),
+        "source_key": source_key(params),
+        "built_at": util.time_stamp(),
+    }
+
+def write_snapshot(params: dict) -> dict:
+    # Precompute the dashboard data when the pipeline runs
+    snapshot = build_snapshot(params)
+    util.pickle_dump(snapshot, params["dashboard_snapshot_path"])
+
+    return snapshot
+
+def load_snapshot(params: dict, key: tuple) -> dict:
+    # Precomputed snapshot when it matches the current artifacts, otherwise build it in process
+    if os.path.isfile(params["dashboard_snapshot_path"]):
+        snapshot = util.pickle_load(params["dashboard_snapshot_path"])
+        if snapshot["source_key"] == key:
+            return snapshot
+
+    return build_snapshot(params)
+
+def get_snapshot(params: dict) -> dict:
+    # Within the TTL the cached snapshot is served without touching the disk
+    now = time.time()
+    if _cache["snapshot"] is not None and now - _cache["checked_at"] < params.get("dashboard_cache_ttl_s", 60):
+        return _cache["snapshot"]
+
+    # After the TTL, reload only if an artifact changed
+    key = source_key(params)
+    if _cache["snapshot"] is None or _cache["key"] != key:
+        _cache["snapshot"] = load_snapshot(params, key)
+        _cache["key"] = key
+    _cache["checked_at"] = now
+
+    return _cache["snapshot"]
+
+def main(params: dict) -> None:
+    write_snapshot(params)
+
+if __name__ == "__main__":
+    params = util.load_config()
+
+    main(params)
@@ -1,4 +1,3 @@
-from tqdm import tqdm
 import pandas as pd
 import numpy as np
 import yfinance as yf
@@ -7,9 +6,11 @@ import joblib
 import os
 import yaml
 import util as util
+import downloader as downloader
+import panel as panel
 from sklearn.model_selection import TimeSeriesSplit
 
-def read_raw_data(config: dict) -> pd.DataFrame:
+def read_ticker_list(config: dict) -> list:
     # Load and define stock ticker list at IDX
     stock_list = pd.read_excel(config['raw_dataset_dir'])
 
@@ -17,52 +18,158 @@ def read_raw_data(config: dict) -> pd.DataFrame:
     stock_list['ticker.jk'] = stock_list['Kode'] + config['ticker_ext']
 
     # Take only the needed column and change it from df to list
-    ticker_list = stock_list['ticker.jk'].tolist()
+    return stock_list['ticker.jk'].tolist()
+
+def to_adj_close(stock_data: dict) -> pd.DataFrame:
+    # Convert the dictionary to a pandas DataFrame with a MultiIndex
+    dataset = pd.concat(stock_data, axis=1)
+
+    # re adjust the table only to show the required column (adj. closing price)
+    dataset = dataset.xs('Adj Close', axis=1, level=1)
+
+    # return adj. closing price per ticker
+    return dataset
+
+def read_raw_data(config: dict, fetch_fn=None) -> pd.DataFrame:
+    # Define the ticker list
+    ticker_list = read_ticker_list(config)
     
     # Define the date range parameter
     start_date = config['start_date']
     end_date = date.today()
-    interval = config['interval_date']
 
-    # Download stock data from yfinance
-    stock_data = {}
-    for ticker in tqdm(ticker_list, desc='Downloading stock data'):
-        stock_data[ticker] = yf.download(ticker, start=start_date, end=end_date, interval=interval, progress=False)
+    # Download stock data in concurrent batches
+    stock_data, report = downloader.download_tickers(ticker_list, start_date, end_date, config, fetch_fn)
 
-    # Convert the dictionary to a pandas DataFrame with a MultiIndex
-    dataset = pd.concat(stock_data, axis=1)
+    # return raw dataset
+    return to_adj_close(stock_data)
 
-    # re adjust the table only to show the required column (adj. closing price)
-    dataset = dataset[dataset.columns[4::6]]
-    dataset.columns = dataset.columns.droplevel(1)
+def last_stored_dates(dataset: pd.DataFrame) -> pd.Series:
+    # Position of the last non-missing row for every ticker
+    valid = dataset.notna().to_numpy()
+    last_pos = len(dataset) - 1 - valid[::-1].argmax(axis=0)
 
-    # return raw dataset
-    return dataset
+    # Tickers without any valid row have no stored date
+    last_dates = pd.Series(dataset.index[last_pos], index=dataset.columns)
+    last_dates[~valid.any(axis=0)] = pd.NaT
+
+    return last_dates
+
+def merge_raw_data(stored: pd.DataFrame, fresh: pd.DataFrame) -> pd.DataFrame:
+    # Fresh bars take priority, so corrected values overwrite the stored ones
+    dataset = fresh.combine_first(stored)
+
+    # Keep stored tickers first and append newly listed ones after them
+    columns = list(stored.columns) + [column for column in fresh.columns if column not in stored.columns]
+
+    return dataset[columns].sort_index()
 
-def check_data(input_data, params, print_errors=True):
+def update_raw_data(config: dict, fetch_fn=None, ticker_list: list = None) -> pd.DataFrame:
+    # Try to load the existing raw store, fallback to a full download
+    try:
+        stored = util.pickle_load(config['raw_dataset_path'])
+    except FileNotFoundError as fe:
+        util.print_debug("No raw store found, downloading full history.")
+        return read_raw_data(config, fetch_fn)
+
+    # Define the ticker list and the date range parameter
+    if ticker_list is None:
+        ticker_list = read_ticker_list(config)
+    end_date = date.today()
+    overlap = pd.Timedelta(days=config.get('incremental_overlap_days', 5))
+
+    # Define where every ticker should restart, re-fetching a few days back to catch corrected bars
+    last_dates = last_stored_dates(stored)
+    newest = last_dates.max()
+    restart = {}
+    stale = []
+    for ticker in ticker_list:
+        last_date = last_dates.get(ticker, pd.NaT)
+        if pd.isna(last_date):
+            # Newly listed ticker, download its whole history
+            restart[ticker] = pd.Timestamp(config['start_date']).date()
+            continue
+
+        restart[ticker] = max(last_date - overlap, pd.Timestamp(config['start_date'])).date()
+
+        # Suspended or delisted ticker, its last date is older than the overlap window of the store
+        if last_date < newest - overlap:
+            stale.append(ticker)
+
+    # Download only the missing tail of every ticker on one pool, stale tickers are not retried
+    util.print_debug("Refreshing {} ticker(s), {} of them stale.".format(len(restart), len(stale)))
+    stock_data, report = downloader.download_tickers(ticker_list, restart, end_date, config, fetch_fn, no_retry=stale)
+
+    # Nothing new, e.g. every remaining ticker is delisted
+    if not stock_data:
+        return stored
+
+    # Merge the tail, tickers missing from the response (delisted) keep their stored history
+    fresh = to_adj_close(stock_data)
+    fresh.index = pd.to_datetime(fresh.index)
+
+    return merge_raw_data(stored, fresh)
+
+def validate_data(input_data: pd.DataFrame, params: dict, chunk_size: int = None) -> pd.DataFrame:
+    # Variabel to store every violation found, one entry per ticker and violation type
+    report = {"ticker": [], "violation": [], "first_date": [], "count": []}
+
+    # Check data types of every column at once, the panel dtype is float32 in compact mode
+    dtype = panel.panel_dtype(params)
+    dtypes = input_data.dtypes.to_numpy()
+    non_float = np.flatnonzero(dtypes != dtype)
+    report["ticker"].extend(input_data.columns[non_float])
+    report["violation"].extend(["non_float"] * len(non_float))
+    report["first_date"].extend([pd.NaT] * len(non_float))
+    report["count"].extend([len(input_data)] * len(non_float))
+
+    # Validate numeric columns by column blocks to bound memory of the masks on very wide frames
+    numeric = np.flatnonzero([dtype.kind in 'fiu' for dtype in dtypes])
+    chunk_size = chunk_size or len(numeric) or 1
+    for start in range(0, len(numeric), chunk_size):
+        positions = numeric[start:start + chunk_size]
+
+        # Contiguous blocks are sliced, so a single float block is read without copying
+        if positions[-1] - positions[0] + 1 == len(positions):
+            block = input_data.iloc[:, positions[0]:positions[-1] + 1]
+        else:
+            block = input_data.iloc[:, positions]
+        values = block.to_numpy(dtype=dtype, copy=False)
+
+        # Missing and negative values of the whole block in one pass each
+        for violation, mask in (("missing", np.isnan(values)), ("negative", values < 0)):
+            count = mask.sum(axis=0)
+            offending = np.flatnonzero(count)
+            if len(offending) == 0:
+                continue
+
+            # First offending row of every offending column
+            first_row = mask[:, offending].argmax(axis=0)
+            report["ticker"].extend(input_data.columns[positions[offending]])
+            report["violation"].extend([violation] * len(offending))
+            report["first_date"].extend(input_data.index[first_row])
+            report["count"].extend(count[offending])
+
+    # Return structured report
+    return pd.DataFrame(report)
+
+def check_data(input_data, params, print_errors=True, chunk_size=None):
 
-    error_messages = []
     error_stock_tickers = []
-    #input_data = input_data.fillna(0)
     try:
         # Check index data types
         assert input_data.index.dtype == params['datetime_index'], 'an error occurs in index format, should be datetime.'
 
-        # Check index data type & range
-        for column in input_data.columns:
-            if input_data[column].dtype != 'float64':
-                error_messages.append(f"Column ({column}) has a non-float data type")
-                error_stock_tickers.append(column)
-
-            if not (input_data[column] >= 0).sum() == len(input_data):
-                error_messages.append(f'an error occurs in {column} column')
-                if column not in error_stock_tickers:
-                    error_stock_tickers.append(column)
-        
-        if error_messages:
-            total_errors = len(error_messages)
-            error_summary = f"\nTotal errors: {total_errors} errors out of {len(input_data.columns)}\n"
-            raise AssertionError(error_summary + "\n".join(error_messages))
+        # Check data types & range of every column
+        report = validate_data(input_data, params, chunk_size)
+
+        # Keep offending tickers in column order
+        offending = set(report["ticker"])
+        error_stock_tickers = [column for column in input_data.columns if column in offending]
+
+        if len(report):
+            error_summary = f"\nTotal errors: {len(report)} errors out of {len(input_data.columns)}\n"
+            raise AssertionError(error_summary + report.to_string(index=False))
     
     except AssertionError as e:
         if print_errors:
@@ -70,12 +177,12 @@ def check_data(input_data, params, print_errors=True):
     
     return error_stock_tickers
 
-if __name__ == "__main__":
-    # 1. Load configuration file
-    config_data = util.load_config()
-
-    # 2. Read all raw dataset
-    raw_dataset = read_raw_data(config_data)
+def main(config_data: dict) -> None:
+    # 2. Read all raw dataset, or only the missing tail when refreshing incrementally
+    if config_data['incremental_refresh']:
+        raw_dataset = update_raw_data(config_data)
+    else:
+        raw_dataset = read_raw_data(config_data)
 
     # change the index format from object into datetime 
     raw_dataset.index = pd.to_datetime(raw_dataset.index)
@@ -83,14 +190,18 @@ if __name__ == "__main__":
     # sort the date index
     raw_dataset = raw_dataset.sort_index(ascending=True)
 
+    # Compact mode keeps the panel as one contiguous float32 block
+    if config_data.get("compact_panels"):
+        raw_dataset = panel.compact_frame(raw_dataset, panel.panel_dtype(config_data))
+
+    # 3. Save Raw Dataset before filtering, so the next incremental refresh sees every ticker
+    util.pickle_dump(raw_dataset, config_data['raw_dataset_path'])
+
     # Delete unrequired rows & columns where all its value is NaN
     raw_dataset.dropna(axis=0, thresh=0.01*len(raw_dataset.columns), inplace=True)
     raw_dataset.dropna(axis=1, thresh=0.01*len(raw_dataset.index), inplace=True)
     raw_dataset.dropna(axis=1, how='any', inplace=True)
 
-    # 3. Save Raw Dataset
-    util.pickle_dump(raw_dataset, config_data['raw_dataset_path'])
-
     # Check the error stock in the dataset
     check_data(raw_dataset, config_data)
 
@@ -146,3 +257,9 @@ if __name__ == "__main__":
 
     util.pickle_dump(X_test, config_data["test_set_path"][0])
     util.pickle_dump(y_test, config_data["test_set_path"][1])
+
+if __name__ == "__main__":
+    # 1. Load configuration file
+    config_data = util.load_config()
+
+    main(config_data)
@@ -0,0 +1,182 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+import pandas as pd
+import threading
+import time
+import yfinance as yf
+import util as util
+import instrument as instrument
+
+# yf.download keeps its results in module globals, so only one download may run at a time
+_yfinance_lock = threading.Lock()
+
+
+class RateLimiter:
+    # Space out fetch calls so that no more than `rate` calls per second leave this process
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_allowed = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        # No limit configured
+        if self.interval == 0.0:
+            return
+
+        # Reserve the next free slot, then sleep outside the lock until it comes
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_allowed)
+            self.next_allowed = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class RecordedPriceSource:
+    # Offline fetch backend serving previously recorded OHLCV frames per ticker
+    def __init__(self, frames: dict, fail_times: dict = None):
+        self.frames = frames
+        self.fail_times = dict(fail_times or {})
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, tickers: list, start, end, interval: str) -> dict:
+        # Keep track of every request for inspection
+        with self.lock:
+            self.calls.append((list(tickers), start, end))
+
+        result = {}
+        for ticker in tickers:
+            # Simulate a transient failure for the first n requests of a ticker
+            with self.lock:
+                if self.fail_times.get(ticker, 0) > 0:
+                    self.fail_times[ticker] -= 1
+                    continue
+
+            # Unknown tickers return nothing, like a delisted code at yfinance
+            if ticker not in self.frames:
+                continue
+
+            # Serve the frame within [start, end), end being exclusive like yfinance
+            frame = self.frames[ticker]
+            frame = frame.loc[(frame.index >= pd.Timestamp(start)) & (frame.index < pd.Timestamp(end))]
+            result[ticker] = frame.copy()
+
+        return result
+
+
+def yfinance_fetcher(tickers: list, start, end, interval: str) -> dict:
+    # Download the whole batch in one call at a time, yfinance fetches the tickers of the batch on its own threads
+    with _yfinance_lock:
+        data = yf.download(tickers, start=start, end=end, interval=interval, group_by='ticker', progress=False, threads=True)
+
+    # A single ticker comes back without the ticker level
+    if not isinstance(data.columns, pd.MultiIndex):
+        return {tickers[0]: data}
+
+    # Split the batch frame back into one OHLCV frame per ticker
+    return {ticker: data[ticker] for ticker in data.columns.get_level_values(0).unique()}
+
+def fetch_batch(tickers: list, start, end, interval: str, fetch_fn, limiter: RateLimiter, max_retries: int, backoff: float) -> dict:
+    # Variabel to store downloaded frames and retry statistics
+    frames = {}
+    pending = list(tickers)
+    retries = 0
+    attempt = 0
+
+    while pending:
+        # Respect the global request rate before every call
+        limiter.wait()
+
+        # Fetch every ticker still pending, a failing call leaves all of them pending
+        try:
+            fetched = fetch_fn(pending, start, end, interval)
+        except Exception as e:
+            util.print_debug("Fetching {} ticker(s) failed: {}".format(len(pending), e))
+            fetched = {}
+
+        # Keep non-empty frames only, empty or all-NaN frames count as a failed ticker
+        for ticker in pending:
+            frame = fetched.get(ticker)
+            if frame is not None and not frame.dropna(how='all').empty:
+                frames[ticker] = frame
+        pending = [ticker for ticker in pending if ticker not in frames]
+
+        # Stop once retries are exhausted
+        if not pending or attempt >= max_retries:
+            break
+
+        # Exponential backoff before retrying the failed tickers
+        time.sleep(backoff * (2 ** attempt))
+        attempt += 1
+        retries += len(pending)
+
+    return {"frames": frames, "failed": pending, "retries": retries}
+
+def make_batches(ticker_list: list, starts: dict, batch_size: int) -> list:
+    # Tickers sorted by start date, so every batch fetches from the earliest start of similar tickers
+    ordered = sorted(ticker_list, key=lambda ticker: starts[ticker])
+    batches = [ordered[i:i + batch_size] for i in range(0, len(ordered), batch_size)]
+
+    return [(batch, min(starts[ticker] for ticker in batch)) for batch in batches]
+
+def download_tickers(ticker_list: list, start, end, config: dict, fetch_fn=None, no_retry: list = None) -> tuple:
+    # Use yfinance unless another backend is given
+    if fetch_fn is None:
+        fetch_fn = yfinance_fetcher
+
+    # Define the engine parameters
+    interval = config['interval_date']
+    batch_size = config.get('download_batch_size', 50)
+    workers = config.get('download_workers', 4)
+    max_retries = config.get('download_max_retries', 3)
+    backoff = config.get('download_backoff', 1.0)
+    limiter = RateLimiter(config.get('download_rate_limit', 0))
+
+    # Start date of every ticker, either one for all of them or one per ticker
+    starts = start if isinstance(start, dict) else {ticker: start for ticker in ticker_list}
+
+    # Split ticker list into batches, tickers not worth retrying (e.g. suspended or delisted) are fetched once in their own batches
+    no_retry = set(no_retry or [])
+    batches = [(batch, batch_start, max_retries) for batch, batch_start in make_batches([ticker for ticker in ticker_list if ticker not in no_retry], starts, batch_size)]
+    batches += [(batch, batch_start, 0) for batch, batch_start in make_batches([ticker for ticker in ticker_list if ticker in no_retry], starts, batch_size)]
+
+    # Variabel to store downloaded frames and report
+    stock_data = {}
+    report = {"tickers": len(ticker_list), "batches": len(batches), "failed": [], "retries": 0, "batch_time": []}
+
+    # Download every batch on a bounded thread pool
+    start_time = util.time_stamp()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for batch, batch_start, batch_retries in batches:
+            futures[executor.submit(timed_fetch_batch, batch, batch_start, end, interval, fetch_fn, limiter, batch_retries, backoff)] = batch
+
+        for future in tqdm(as_completed(futures), total=len(futures), desc='Downloading stock data'):
+            result = future.result()
+            stock_data.update(result["frames"])
+            report["failed"].extend(result["failed"])
+            report["retries"] += result["retries"]
+            report["batch_time"].append(result["time"])
+
+    report["elapsed"] = (util.time_stamp() - start_time).total_seconds()
+
+    # Debug message
+    util.print_debug("Downloaded {} of {} tickers in {:.2f}s ({} batches, {} retries, {} failed).".format(
+        len(stock_data), report["tickers"], report["elapsed"], report["batches"], report["retries"], len(report["failed"])))
+
+    # Keep the original ticker order
+    stock_data = {ticker: stock_data[ticker] for ticker in ticker_list if ticker in stock_data}
+
+    return stock_data, report
+
+def timed_fetch_batch(*args) -> dict:
+    # Fetch one batch and record how long it took
+    batch_time = util.time_stamp()
+    with instrument.span("download", tickers=len(args[0])) as record:
+        result = fetch_batch(*args)
+        record.update({"failed": len(result["failed"]), "retries": result["retries"]})
+    result["time"] = (util.time_stamp() - batch_time).total_seconds()
+
+    return result
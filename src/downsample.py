@@ -0,0 +1,84 @@
+import pandas as pd
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets: positions of the points that keep the visual shape of the line
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # First and last point are always kept, the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+
+        # Average point of the next bucket, the last point for the last bucket
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+
+        # Point of this bucket making the largest triangle with the previous selected point and the next average
+        prev_x, prev_y = x[selected[bucket]], y[selected[bucket]]
+        area = np.abs((prev_x - next_x) * (y[start:end] - prev_y) - (prev_x - x[start:end]) * (next_y - prev_y))
+        selected[bucket + 1] = start + int(np.argmax(area))
+
+    return selected
+
+def minmax(y: np.ndarray, n_out: int) -> np.ndarray:
+    # Minimum and maximum of every bucket, so spikes are never dropped
+    n = len(y)
+    n_buckets = n_out // 2
+    if n_out >= n or n_buckets < 1:
+        return np.arange(n)
+
+    # Pad to equal bucket sizes and find extremes of every bucket at once
+    size = int(np.ceil(n / n_buckets))
+    padded = np.full(size * n_buckets, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(n_buckets, size)
+    valid = ~np.isnan(buckets).all(axis=1)
+    offsets = np.arange(n_buckets)[valid] * size
+    low = offsets + np.nanargmin(buckets[valid], axis=1)
+    high = offsets + np.nanargmax(buckets[valid], axis=1)
+
+    # Keep points in time order, with the first and last one
+    return np.unique(np.concatenate([[0], low, high, [n - 1]]))
+
+def downsample_series(series: pd.Series, n_out: int, method: str = "lttb") -> pd.Series:
+    # Date indexed series reduced to about n_out points
+    if n_out is None or len(series) <= n_out:
+        return series
+    if method == "lttb":
+        positions = lttb(series.index.asi8.astype("float64"), series.to_numpy(dtype="float64"), n_out)
+    elif method == "minmax":
+        positions = minmax(series.to_numpy(dtype="float64"), n_out)
+    else:
+        raise ValueError("Unknown downsampling method: {}".format(method))
+
+    return series.iloc[positions]
+
+def downsample_long(data: pd.DataFrame, n_out: int, method: str = "lttb", x: str = "date", y: str = "price", group: str = "symbol") -> pd.DataFrame:
+    # Downsample every symbol of a long format chart frame on its own
+    frames = []
+    for name, rows in data.groupby(group, sort=False):
+        series = downsample_series(rows.set_index(x)[y].sort_index(), n_out, method)
+        frames.append(series.rename(y).reset_index().assign(**{group: name}))
+
+    return pd.concat(frames, ignore_index=True) if frames else data
+
+def visible_range(data: pd.DataFrame, start=None, end=None, x: str = "date") -> pd.DataFrame:
+    # Rows within the zoomed date range, the full history when not zoomed
+    mask = pd.Series(True, index=data.index)
+    if start is not None:
+        mask &= data[x] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= data[x] <= pd.Timestamp(end)
+
+    return data[mask]
+
+def zoom(data: pd.DataFrame, start=None, end=None, max_points: int = 600, method: str = "lttb") -> pd.DataFrame:
+    # The narrower the zoom, the more of the visible points are kept, up to max_points per symbol
+    return downsample_long(visible_range(data, start, end), max_points, method)
@@ -0,0 +1,211 @@
+from contextlib import contextmanager
+import functools
+import threading
+import random
+import resource
+import json
+import time
+import sys
+import os
+import pandas as pd
+
+import util as util
+
+# Settings of the trace and the profiler, loaded from the configuration on first use
+_settings = dict()
+
+# Count, total and max seconds of every span name in this process, exported as Prometheus metrics
+_metrics = dict()
+_lock = threading.Lock()
+
+# Trace file opened once per process, forked workers open their own
+_trace = {"file": None, "pid": None}
+
+
+def settings() -> dict:
+    if not _settings:
+        params = util.get_params()
+        _settings.update({
+            "trace_enabled": params.get("trace_enabled", False),
+            "trace_path": params.get("trace_path", "log/trace.jsonl"),
+            "trace_max_bytes": params.get("trace_max_bytes"),
+            "profile_stages": params.get("profile_stages") or [],
+            "profile_backend": params.get("profile_backend", "cprofile"),
+            "profile_dir": params.get("profile_dir", "log/profiles"),
+        })
+
+    return _settings
+
+def configure(**kwargs) -> None:
+    # Override settings of this process, a new trace path is opened on the next span
+    settings().update(kwargs)
+    close_trace()
+
+def close_trace() -> None:
+    with _lock:
+        if _trace["file"] is not None:
+            _trace["file"].close()
+        _trace.update({"file": None, "pid": None})
+
+def peak_rss_mb() -> float:
+    # High-water mark of the resident memory of this process, ru_maxrss is in KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def shape(data) -> dict:
+    # Row and column count of frames, series and arrays
+    data_shape = getattr(data, "shape", None)
+    if data_shape is None or len(data_shape) == 0:
+        return dict()
+
+    return {"rows": int(data_shape[0]), "columns": int(data_shape[1]) if len(data_shape) > 1 else 1}
+
+def write_trace(record: dict) -> None:
+    # One JSON line per span, appended by every process of the run
+    line = json.dumps(record, default=str) + "\n"
+    path = settings()["trace_path"]
+    max_bytes = settings().get("trace_max_bytes")
+    with _lock:
+        if _trace["file"] is None or _trace["pid"] != os.getpid():
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            _trace.update({"file": open(path, "a", buffering=1), "pid": os.getpid()})
+
+        # Keep the trace bounded, the previous one is kept as a single backup
+        if max_bytes and _trace["file"].tell() > max_bytes:
+            _trace["file"].close()
+            os.replace(path, path + ".1")
+            _trace["file"] = open(path, "a", buffering=1)
+        _trace["file"].write(line)
+
+def observe(name: str, seconds: float) -> None:
+    with _lock:
+        metric = _metrics.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+        metric["count"] += 1
+        metric["sum"] += seconds
+        metric["max"] = max(metric["max"], seconds)
+
+@contextmanager
+def span(name: str, sample: float = 1.0, **fields):
+    # Time a block, fields added to the yielded record (row and column counts) end up in its trace line
+    # Metrics count every span, only a `sample` share of them is written to the trace
+    record = dict(fields)
+    started = util.time_stamp()
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        observe(name, seconds)
+        if settings()["trace_enabled"] and (sample >= 1.0 or random.random() < sample):
+            write_trace({"span": name, "start": started.isoformat(), "seconds": seconds, "peak_rss_mb": peak_rss_mb(), "pid": os.getpid(), **record})
+
+def timed(name: str = None, **fields):
+    # Decorator form of span, named after the function by default
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name or function.__name__, **fields):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+def metrics_text(prefix: str = "stock") -> str:
+    # Prometheus text exposition of the span totals and the peak memory of this process
+    with _lock:
+        metrics = {name: dict(metric) for name, metric in _metrics.items()}
+
+    lines = ["# TYPE {}_span_seconds summary".format(prefix)]
+    for name, metric in sorted(metrics.items()):
+        lines.append('{}_span_seconds_count{{span="{}"}} {}'.format(prefix, name, metric["count"]))
+        lines.append('{}_span_seconds_sum{{span="{}"}} {:.6f}'.format(prefix, name, metric["sum"]))
+    lines.append("# TYPE {}_span_seconds_max gauge".format(prefix))
+    for name, metric in sorted(metrics.items()):
+        lines.append('{}_span_seconds_max{{span="{}"}} {:.6f}'.format(prefix, name, metric["max"]))
+    lines.append("# TYPE {}_peak_rss_bytes gauge".format(prefix))
+    lines.append("{}_peak_rss_bytes {:.0f}".format(prefix, peak_rss_mb() * 1024 * 1024))
+
+    return "\n".join(lines) + "\n"
+
+@contextmanager
+def profile(name: str):
+    # Opt-in profile of a block, only for the names listed in profile_stages ("all" profiles every stage)
+    config = settings()
+    if name not in config["profile_stages"] and "all" not in config["profile_stages"]:
+        yield None
+        return
+
+    os.makedirs(config["profile_dir"], exist_ok=True)
+    path = os.path.join(config["profile_dir"], "{}-{}".format(name, util.time_stamp().strftime("%Y%m%d%H%M%S")))
+
+    # pyinstrument is optional, cProfile is always available
+    backend = config["profile_backend"]
+    if backend == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            util.print_debug("pyinstrument is not installed, profiling {} with cProfile.".format(name))
+            backend = "cprofile"
+
+    if backend == "pyinstrument":
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield path + ".html"
+        finally:
+            profiler.stop()
+            with open(path + ".html", "w") as file:
+                file.write(profiler.output_html())
+    else:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield path + ".prof"
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path + ".prof")
+
+    util.print_debug("Profile of {} written to {}".format(name, path))
+
+def load_trace(path: str) -> pd.DataFrame:
+    # Trace lines of every process, a line cut by a crash is ignored
+    records = []
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+
+    return pd.DataFrame(records)
+
+def summarize(trace: pd.DataFrame) -> pd.DataFrame:
+    # Where the time went: total, count and max seconds per span, slowest first
+    if trace.empty:
+        return trace
+
+    trace = trace.assign(rows=trace["rows"] if "rows" in trace else 0)
+    summary = trace.groupby("span").agg(
+        count=("seconds", "size"),
+        total_seconds=("seconds", "sum"),
+        max_seconds=("seconds", "max"),
+        rows=("rows", "sum"),
+        peak_rss_mb=("peak_rss_mb", "max"),
+    )
+    summary["rows"] = summary["rows"].astype("int64")
+
+    return summary.sort_values("total_seconds", ascending=False)
+
+if __name__ == "__main__":
+    # Summary of the given trace file, the configured one by default
+    path = sys.argv[1] if len(sys.argv) > 1 else settings()["trace_path"]
+
+    print(summarize(load_trace(path)).to_string(float_format="{:.3f}".format))
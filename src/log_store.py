@@ -0,0 +1,120 @@
+from contextlib import contextmanager
+import sqlite3
+import json
+import os
+
+COLUMNS = ["run_id", "model_name", "model_family", "model_uid", "training_time", "training_date",
+           "performance", "mse", "data_configurations", "data_fingerprint", "record"]
+
+
+def model_family(model_name: str) -> str:
+    # "Baseline-Ridge" and "Production-Ridge" both belong to the Ridge family
+    return model_name.split("-")[-1]
+
+
+class TrainingLogStore:
+    # Append-only training log in an embedded SQLite table, indexed for model selection queries
+    def __init__(self, path: str, legacy_json_path: str = None):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self.connect() as connection:
+            # WAL lets readers run alongside a writer, concurrent writers wait on the busy timeout
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS training_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT, model_name TEXT, model_family TEXT, model_uid TEXT,
+                    training_time REAL, training_date TEXT, performance REAL, mse REAL,
+                    data_configurations TEXT, data_fingerprint TEXT, record TEXT
+                )""")
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_model_name ON training_log (model_name)")
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_model_uid ON training_log (model_uid)")
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_training_date ON training_log (training_date)")
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_family_run ON training_log (model_family, run_id, mse)")
+
+        # Import the previous JSON array log once
+        if legacy_json_path is not None and os.path.isfile(legacy_json_path) and self.count() == 0:
+            with open(legacy_json_path, "r") as file:
+                self.append_many(json.load(file), run_id="legacy")
+
+    @contextmanager
+    def connect(self):
+        # A short lived connection per operation is safe across threads and forked workers
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def to_row(self, record: dict, run_id: str) -> tuple:
+        return (
+            run_id, record["model_name"], model_family(record["model_name"]), record["model_uid"],
+            record.get("training_time"), str(record.get("training_date")), record.get("performance"),
+            record.get("mse"), str(record.get("data_configurations")), record.get("data_fingerprint"),
+            json.dumps(record, default=str),
+        )
+
+    def append_many(self, records: list, run_id: str = None) -> None:
+        # One insert per record in a single transaction, no read of the existing log
+        with self.connect() as connection:
+            connection.executemany(
+                "INSERT INTO training_log ({}) VALUES ({})".format(", ".join(COLUMNS), ", ".join("?" * len(COLUMNS))),
+                [self.to_row(record, run_id) for record in records],
+            )
+
+    def append(self, record: dict, run_id: str = None) -> None:
+        self.append_many([record], run_id)
+
+    def count(self) -> int:
+        with self.connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM training_log").fetchone()[0]
+
+    def select(self, query: str, args: tuple = ()) -> list:
+        # Run a query and return rows as dictionaries
+        with self.connect() as connection:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute(query, args).fetchall()]
+
+    def find(self, model_uid: str = None, model_name: str = None, since: str = None) -> list:
+        # Records filtered by indexed columns
+        conditions, args = [], []
+        for column, operator, value in (("model_uid", "=", model_uid), ("model_name", "=", model_name), ("training_date", ">=", since)):
+            if value is not None:
+                conditions.append("{} {} ?".format(column, operator))
+                args.append(value)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+        return self.select("SELECT * FROM training_log {} ORDER BY id".format(where), tuple(args))
+
+    def metric_expression(self, metric: str) -> str:
+        # Metrics without their own column are read from the JSON record
+        if metric in COLUMNS:
+            return metric
+        if not metric.isidentifier():
+            raise ValueError("Invalid metric name: {}".format(metric))
+        return "json_extract(record, '$.{}')".format(metric)
+
+    def best(self, run_id: str, metric: str = "mse") -> dict:
+        # Lowest metric of a run, faster training first on ties
+        metric = self.metric_expression(metric)
+        rows = self.select(
+            "SELECT * FROM training_log WHERE run_id = ? AND {0} IS NOT NULL ORDER BY {0} ASC, training_time ASC LIMIT 1".format(metric),
+            (run_id,),
+        )
+        return rows[0] if rows else None
+
+    def best_per_family(self, last_n_runs: int = None) -> list:
+        # Best mse per model family over the last n runs
+        return self.select("""
+            WITH recent AS (
+                SELECT run_id FROM training_log GROUP BY run_id ORDER BY MAX(id) DESC LIMIT ?
+            )
+            SELECT model_family, model_uid, model_name, MIN(mse) AS mse, run_id
+            FROM training_log
+            WHERE run_id IN recent
+            GROUP BY model_family
+            ORDER BY mse ASC
+        """, (last_n_runs if last_n_runs is not None else -1,))
@@ -0,0 +1,99 @@
+import pandas as pd
+import hashlib
+import shutil
+import json
+import glob
+import os
+
+import registry as registry
+
+
+class RunManifest:
+    # Append-only record of the completed tasks of a training run, one JSON line per task
+    def __init__(self, directory: str, name: str, fingerprint: str):
+        self.directory = os.path.join(directory, name)
+        self.fingerprint = fingerprint
+        self.path = os.path.join(self.directory, "{}.jsonl".format(fingerprint[:16]))
+        self.artifacts_dir = os.path.join(self.directory, fingerprint[:16])
+        os.makedirs(self.artifacts_dir, exist_ok=True)
+
+        # Results of the same run on other data are stale
+        self.invalidate_stale()
+
+    def invalidate_stale(self) -> None:
+        # Remove manifests and artifacts of every other data fingerprint
+        for path in glob.glob(os.path.join(self.directory, "*")):
+            if path not in (self.path, self.artifacts_dir):
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+
+    def clear(self) -> None:
+        # Checkpoints are only needed to resume an interrupted run, a completed one removes them
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def task_key(self, task: dict) -> str:
+        # Identity of a task: estimator and params, feature config, data and backtest folds
+        uid = registry.model_uid(task["model"]["model_object"], [task["config_data"]], self.fingerprint)
+        content = json.dumps([uid, task.get("splits")])
+
+        return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+    def load(self) -> dict:
+        # Completed tasks by key, a line cut by a crash is ignored
+        completed = dict()
+        if not os.path.isfile(self.path):
+            return completed
+
+        with open(self.path, "r") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if os.path.isfile(os.path.join(self.artifacts_dir, record["artifact"])):
+                    completed[record["key"]] = record
+
+        return completed
+
+    def record(self, task: dict, result: dict) -> None:
+        # Store the fitted model first, then append its line, so every line points to a complete artifact
+        import joblib
+
+        artifact = "{}.pkl".format(task["key"])
+        registry.write_atomic(os.path.join(self.artifacts_dir, artifact), lambda path: joblib.dump(result["model"]["model_object"], path))
+
+        line = json.dumps({
+            "key": task["key"],
+            "config_data": task["config_data"],
+            "model_name": result["model"]["model_name"],
+            "params": repr(result["model"]["model_object"].get_params()),
+            "training_time": result["training_time"],
+            "training_date": str(result["training_date"]),
+            "performance": result["performance"],
+            "backtest": result["backtest"],
+            "artifact": artifact,
+        }, default=str)
+
+        with open(self.path, "a") as file:
+            file.write(line + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def result(self, record: dict) -> dict:
+        # Rebuild the result of a completed task, as returned by the training task
+        import joblib
+
+        return {
+            "model": {
+                "model_name": record["model_name"],
+                "model_object": joblib.load(os.path.join(self.artifacts_dir, record["artifact"])),
+                "model_uid": "",
+            },
+            "training_time": record["training_time"],
+            "training_date": pd.Timestamp(record["training_date"]).to_pydatetime(),
+            "performance": record["performance"],
+            "backtest": record["backtest"],
+            "task_time": 0.0,
+        }
@@ -0,0 +1,173 @@
+from collections import OrderedDict, deque
+import numpy as np
+import threading
+import time
+import util as util
+import registry as registry
+
+
+class LRUCache:
+    # Size bounded cache, the least recently used entry is evicted first
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.misses += 1
+
+        # Load outside the lock, so other keys are still served meanwhile
+        value = loader()
+
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+        return value
+
+
+class ModelCache:
+    # Serve the model pointed by a registry stage, reloading it in the background when the pointer moves
+    def __init__(self, registry_dir: str, stage: str = "production", poll_interval: float = 5.0, reference_size: int = 32):
+        self.registry_dir = registry_dir
+        self.stage = stage
+        self.poll_interval = poll_interval
+        self.reference = LRUCache(reference_size)
+
+        # Current and previous version, each one a (uid, model) pair swapped as a whole
+        self.current = None
+        self.previous = None
+        self.lock = threading.Lock()
+        self.poller = None
+
+        # Swap and request latency statistics
+        self.swaps = 0
+        self.last_swap_time = None
+        self.last_swap_latency = None
+        self.last_refresh = None
+        self.latencies = deque(maxlen=5000)
+
+        # Reload failures, reported once per distinct error instead of on every poll
+        self.reload_errors = 0
+        self.last_reload_error = None
+
+    def load(self, uid: str) -> dict:
+        # Unpickle the estimator now, so no request pays for it
+        model = registry.ModelRegistry(self.registry_dir).get(uid)
+        model["model_data"]["model_object"].load()
+        return model
+
+    def swap(self, uid: str, model: dict, load_latency: float = 0.0) -> None:
+        # Replace the (uid, model) pair in one assignment, in-flight requests keep the model they already hold
+        with self.lock:
+            self.previous = self.current
+            self.current = (uid, model)
+            self.swaps += 1
+            self.last_swap_time = time.time()
+            self.last_swap_latency = load_latency
+
+    def refresh(self) -> bool:
+        # Check the stage pointer and load the new version if it moved, the index is only read for a new version
+        self.last_refresh = time.time()
+        uid = registry.read_stage(self.registry_dir, self.stage)
+        if uid is None or (self.current is not None and self.current[0] == uid):
+            return False
+
+        # Reuse the previous version when the pointer went back to it
+        start = time.perf_counter()
+        if self.previous is not None and self.previous[0] == uid:
+            model = self.previous[1]
+        else:
+            model = self.load(uid)
+        self.swap(uid, model, time.perf_counter() - start)
+
+        return True
+
+    def get(self, max_age: float = None) -> dict:
+        # Caches without a poller check their pointer on use, at most once every max age seconds
+        if max_age is not None and self.current is not None and time.time() - self.last_refresh > max_age:
+            try:
+                self.refresh()
+                self.last_reload_error = None
+            except Exception as e:
+                self.report_error(e)
+
+        # First request loads synchronously if the background load has not finished yet
+        current = self.current
+        if current is None:
+            self.refresh()
+            current = self.current
+            if current is None:
+                raise RuntimeError("No {} model has been promoted yet.".format(self.stage))
+
+        return current[1]
+
+    def rollback(self) -> str:
+        # Point the stage back to the previous version, which is still in memory
+        previous = self.previous
+        if previous is None:
+            raise RuntimeError("No previous model to roll back to.")
+
+        registry.ModelRegistry(self.registry_dir).promote(previous[0], self.stage)
+        self.swap(previous[0], previous[1])
+
+        return previous[0]
+
+    def report_error(self, error: Exception) -> None:
+        # Count every failure, print only when it differs from the previous one
+        self.reload_errors += 1
+        message = "{}: {}".format(type(error).__name__, error)
+        if message != self.last_reload_error:
+            util.print_debug("{} model reload failed, keeping the current model: {}".format(self.stage, message))
+        self.last_reload_error = message
+
+    def poll(self) -> None:
+        while True:
+            try:
+                self.refresh()
+                self.last_reload_error = None
+            except Exception as e:
+                # Keep serving the current model if the new one cannot be loaded
+                self.report_error(e)
+            time.sleep(self.poll_interval)
+
+    def start(self) -> None:
+        # Watch the stage pointer in a background thread
+        if self.poll_interval <= 0 or self.poller is not None:
+            return
+        self.poller = threading.Thread(target=self.poll, daemon=True)
+        self.poller.start()
+
+    def record_latency(self, seconds: float) -> None:
+        self.latencies.append((time.time(), seconds))
+
+    def status(self) -> dict:
+        # Latency of every recorded request, and of the ones served since the last swap
+        latencies = list(self.latencies)
+        since_swap = [seconds for timestamp, seconds in latencies if self.last_swap_time and timestamp >= self.last_swap_time]
+
+        def percentiles(values):
+            if not values:
+                return {"count": 0, "p50_ms": None, "p99_ms": None}
+            return {"count": len(values), "p50_ms": np.percentile(values, 50) * 1000, "p99_ms": np.percentile(values, 99) * 1000}
+
+        return {
+            "model_uid": self.current[0] if self.current else None,
+            "previous_model_uid": self.previous[0] if self.previous else None,
+            "swaps": self.swaps,
+            "last_swap_latency_ms": self.last_swap_latency * 1000 if self.last_swap_latency is not None else None,
+            "request_latency": percentiles([seconds for _, seconds in latencies]),
+            "request_latency_since_swap": percentiles(since_swap),
+            "reload_errors": self.reload_errors,
+            "last_reload_error": self.last_reload_error,
+            "reference_cache": {"size": len(self.reference.entries), "hits": self.reference.hits, "misses": self.reference.misses},
+        }
@@ -7,51 +7,61 @@ from sklearn.neighbors import KNeighborsRegressor
 from xgboost import XGBRegressor 
 from sklearn.metrics import mean_squared_error
 from sklearn.model_selection import GridSearchCV
+from sklearn.base import clone
 
 
 import joblib
 import json
+import os
 import pandas as pd
 import numpy as np
-import copy
-import hashlib
 
 import util as util
-
-
-def load_train_feng(params: dict) -> pd.DataFrame:
+import parallel as parallel
+import registry as registry
+import log_store as log_store
+import backtest as backtest
+import online_linear as online_linear
+import search as search
+import manifest as manifest
+import instrument as instrument
+import panel as panel
+
+
+def load_train_feng(params: dict, columns: list = None) -> pd.DataFrame:
     # Load train set
-    x_train = util.pickle_load(params["train_feng_set_path"][0])
+    x_train = util.pickle_load(params["train_feng_set_path"][0], columns)
     y_train = util.pickle_load(params["train_feng_set_path"][1])
 
-    return x_train, y_train
+    # Features and target of a set share one date index
+    return panel.share_index(x_train, y_train)
 
-def load_valid_feng(params: dict) -> pd.DataFrame:
+def load_valid_feng(params: dict, columns: list = None) -> pd.DataFrame:
     # Load valid set
-    x_valid = util.pickle_load(params["valid_feng_set_path"][0])
+    x_valid = util.pickle_load(params["valid_feng_set_path"][0], columns)
     y_valid = util.pickle_load(params["valid_feng_set_path"][1])
 
-    return x_valid, y_valid
+    return panel.share_index(x_valid, y_valid)
 
-def load_test_feng(params: dict) -> pd.DataFrame:
+def load_test_feng(params: dict, columns: list = None) -> pd.DataFrame:
     # Load test set
-    x_test = util.pickle_load(params["test_feng_set_path"][0])
+    x_test = util.pickle_load(params["test_feng_set_path"][0], columns)
     y_test = util.pickle_load(params["test_feng_set_path"][1])
 
-    return x_test, y_test
+    return panel.share_index(x_test, y_test)
 
-def load_dataset(params: dict) -> pd.DataFrame:
+def load_dataset(params: dict, columns: list = None) -> pd.DataFrame:
     # Debug message
     util.print_debug("Loading dataset.")
 
     # Load train set
-    x_train, y_train = load_train_feng(params)
+    x_train, y_train = load_train_feng(params, columns)
 
     # Load valid set
-    x_valid, y_valid = load_valid_feng(params)
+    x_valid, y_valid = load_valid_feng(params, columns)
 
     # Load test set
-    x_test, y_test = load_test_feng(params)
+    x_test, y_test = load_test_feng(params, columns)
 
     # Debug message
     util.print_debug("Dataset loaded.")
@@ -66,6 +76,7 @@ def training_log_template() -> dict:
     
     # Template of training log
     logger = {
+        "run_id" : [],
         "model_name" : [],
         "model_uid" : [],
         "training_time" : [],
@@ -73,6 +84,10 @@ def training_log_template() -> dict:
         "performance" : [],
         "mse" : [],
         "data_configurations" : [],
+        "data_fingerprint" : [],
+        "backtest_mse" : [],
+        "backtest_mae" : [],
+        "backtest_directional_accuracy" : [],
     }
 
     # Debug message
@@ -81,39 +96,17 @@ def training_log_template() -> dict:
     # Return training log template
     return logger
 
-def training_log_updater(current_log: dict, params: dict) -> list:
-    # Create copy of current log
-    current_log = copy.deepcopy(current_log)
-
-    # Path for training log file
-    log_path = params["training_log_path"]
+def training_log_store(params: dict) -> log_store.TrainingLogStore:
+    # Open the training log store, importing the previous JSON log on first use
+    return log_store.TrainingLogStore(params["training_log_path"], params.get("legacy_training_log_path"))
 
-    # Try to load training log file
-    try:
-        with open(log_path, "r") as file:
-            last_log = json.load(file)
-        file.close()
+def training_log_updater(current_log: dict, params: dict) -> log_store.TrainingLogStore:
+    # Append current log in O(1), the existing log is never read or rewritten
+    store = training_log_store(params)
+    store.append(current_log, run_id=current_log.get("run_id"))
 
-    # If file not found, create a new one
-    except FileNotFoundError as fe:
-        with open(log_path, "w") as file:
-            file.write("[]")
-        file.close()
-
-        with open(log_path, "r") as file:
-            last_log = json.load(file)
-        file.close()
-    
-    # Add current log to previous log
-    last_log.append(current_log)
-
-    # Save updated log
-    with open(log_path, "w") as file:
-        json.dump(last_log, file)
-        file.close()
-
-    # Return log
-    return last_log
+    # Return log store
+    return store
 
 def create_model_object(params: dict) -> list:
     # Debug message
@@ -128,6 +121,11 @@ def create_model_object(params: dict) -> list:
     knn = KNeighborsRegressor()
     xgb = XGBRegressor()
 
+    # Pin the seed of every stochastic estimator, so a refit on the same data is the same model
+    for model_object in [lnr, rdg, dct, ran, knn, xgb]:
+        if "random_state" in model_object.get_params():
+            model_object.set_params(random_state=params.get("model_random_state", 0))
+
     # Create list of model
     list_of_model = [
         { "model_name": lnr.__class__.__name__, "model_object": lnr, "model_uid": ""},
@@ -144,11 +142,49 @@ def create_model_object(params: dict) -> list:
     # Return the list of model
     return list_of_model
 
+def fit_eval_task(task: dict) -> dict:
+    # Read-only training arrays shared by the parent process
+    task_time = util.time_stamp()
+    arrays = parallel.shared_arrays()
+    model = task["model"]
+    config_data = task["config_data"]
+
+    # Load train & valid data based on its configuration
+    x_train_data = pd.DataFrame(arrays["x_train"][:, [task["position"]]], columns=[config_data])
+    x_valid_data = pd.DataFrame(arrays["x_valid"][:, [task["position"]]], columns=[config_data])
+
+    # Debug message
+    util.print_debug("Training model: {} on configuration data: {}".format(model["model_name"], config_data))
+
+    # Training
+    training_time = util.time_stamp()
+    with instrument.span("fit", model=model["model_name"], config_data=config_data, **instrument.shape(x_train_data)):
+        model["model_object"].fit(x_train_data, arrays["y_train"])
+    training_time = (util.time_stamp() - training_time).total_seconds()
+
+    # Debug message
+    util.print_debug("Evalutaing model: {}".format(model["model_name"]))
+
+    # Evaluation
+    with instrument.span("predict", model=model["model_name"], config_data=config_data, **instrument.shape(x_valid_data)):
+        y_predict = model["model_object"].predict(x_valid_data)
+    performance = float(mean_squared_error(arrays["y_valid"], y_predict))
+
+    # Walk-forward backtest on train & valid history, folds are index slices of the same arrays
+    backtest_metrics = dict()
+    if task.get("splits"):
+        x_history = arrays["x_history"][:, [task["position"]]]
+        folds = [backtest.evaluate_fold(model["model_object"], x_history, arrays["y_history"], split, [config_data]) for split in task["splits"]]
+        backtest_metrics = backtest.aggregate_folds(pd.DataFrame(folds))
+
+    # Return trained model and its metrics
+    return {"model": model, "training_time": training_time, "training_date": util.time_stamp(), "performance": performance,
+            "backtest": backtest_metrics, "task_time": (util.time_stamp() - task_time).total_seconds()}
+
 def train_eval(configuration_model: str, params: dict, hyperparams_model: list = None):
-    # Load dataset
-    x_train, y_train, \
-    x_valid, y_valid, \
-    x_test, y_test = load_dataset(params)
+    # Load only the train and valid set, test set is not needed for training
+    x_train, y_train = load_train_feng(params)
+    x_valid, y_valid = load_valid_feng(params)
 
     # Variabel to store trained models
     list_of_trained_model = dict()
@@ -156,78 +192,121 @@ def train_eval(configuration_model: str, params: dict, hyperparams_model: list =
     # Create log template
     training_log = training_log_template()
 
-    # Training for every data configuration
-    for config_data in x_train.columns:
-        # Debug message
-        util.print_debug("Training model based on configuration data: {}".format(config_data))
+    # Walk-forward folds over train & valid history, computed once for every task
+    splits = None
+    if params.get("backtest_enabled"):
+        splits = backtest.backtest_splits(params, len(x_train) + len(x_valid))
 
-        # Create model objects
+    # Create one independent task for every data configuration and model
+    tasks = list()
+    for position, config_data in enumerate(x_train.columns):
+        # Create model objects, tuned models are cloned unfitted instead of deep copied
         if hyperparams_model == None:
             list_of_model = create_model_object(params)
         else:
-            list_of_model = copy.deepcopy(hyperparams_model)
-
-        # Variabel to store trained model
-        trained_model = list()
-
-        # Load train data based on its configuration
-        x_train_data = x_train[[config_data]]
-        y_train_data = y_train
+            list_of_model = [
+                {"model_name": model["model_name"], "model_object": clone(model["model_object"]), "model_uid": ""}
+                for model in hyperparams_model
+            ]
 
-        # Train each model by current dataset configuration
         for model in list_of_model:
-            # Debug message
-            util.print_debug("Training model: {}".format(model["model_name"]))
-
-            # Training
-            training_time = util.time_stamp()
-            model["model_object"].fit(x_train_data, y_train_data)
-            training_time = (util.time_stamp() - training_time).total_seconds()
+            tasks.append({"config_data": config_data, "position": position, "model": model, "splits": splits})
+
+    # Fingerprint of the training data, part of every model UID
+    fingerprint = registry.data_fingerprint(x_train, y_train)
+
+    # Tasks completed by an interrupted run on the same train & valid data are loaded instead of trained again
+    run_manifest = None
+    completed = dict()
+    if params.get("run_manifest_enabled"):
+        run_manifest = manifest.RunManifest(params["run_manifest_dir"], configuration_model, registry.data_fingerprint(x_train, y_train, x_valid, y_valid))
+        completed = run_manifest.load()
+        for task in tasks:
+            task["key"] = run_manifest.task_key(task)
+    pending = [task for task in tasks if task.get("key") not in completed]
+
+    # Training arrays are shared once with every worker instead of being sent with each task, float32 in compact mode
+    dtype = panel.panel_dtype(params)
+    arrays = {
+        "x_train": x_train.to_numpy(dtype=dtype),
+        "y_train": y_train.to_numpy(dtype=dtype),
+        "x_valid": x_valid[x_train.columns].to_numpy(dtype=dtype),
+        "y_valid": y_valid.to_numpy(dtype=dtype),
+    }
+    if splits:
+        arrays["x_history"] = np.concatenate([arrays["x_train"], arrays["x_valid"]])
+        arrays["y_history"] = np.concatenate([arrays["y_train"], arrays["y_valid"]])
 
-            # Debug message
-            util.print_debug("Evalutaing model: {}".format(model["model_name"]))
+    # Debug message
+    util.print_debug("Training {} tasks on {} worker(s), {} already completed.".format(len(pending), params.get("training_workers", 1), len(tasks) - len(pending)))
 
-            # Evaluation
-            y_predict = model["model_object"].predict(x_valid[[config_data]])
-            performance = mean_squared_error(y_valid, y_predict)
+    # Train every pending task on the process pool, checkpointing each one as soon as it completes
+    wall_time = util.time_stamp()
+    pending_results = parallel.run_tasks(fit_eval_task, pending, params.get("training_workers", 1), arrays,
+                                         run_manifest.record if run_manifest is not None else None)
+    wall_time = (util.time_stamp() - wall_time).total_seconds()
 
-            # Debug message
-            util.print_debug("Logging: {}".format(model["model_name"]))
+    # Merge completed and newly trained tasks back in task order
+    pending_results = iter(pending_results)
+    results = [run_manifest.result(completed[task["key"]]) if task.get("key") in completed else next(pending_results) for task in tasks]
 
-            # Create UID
-            uid = hashlib.md5(str(training_time).encode()).hexdigest()
+    # The run is complete, its checkpoints are not needed anymore
+    if run_manifest is not None:
+        run_manifest.clear()
 
-            # Assign model's UID
-            model["model_uid"] = uid
+    # Identify this training run in the training log store
+    run_id = "{}-{}".format(configuration_model, util.time_stamp().strftime("%Y%m%d%H%M%S%f"))
 
-            # Create training log data
-            training_log["model_name"].append("{}-{}".format(configuration_model, model["model_name"]))
-            training_log["model_uid"].append(uid)
-            training_log["training_time"].append(training_time)
-            training_log["training_date"].append(util.time_stamp())
-            training_log["performance"].append(performance)
-            training_log["mse"].append(performance)
-            training_log["data_configurations"].append('no configuration')
+    # Collect results in the same order as the serial training
+    for task, result in zip(tasks, results):
+        model = result["model"]
 
-            # Collect current trained model
-            trained_model.append(copy.deepcopy(model))
+        # Debug message
+        util.print_debug("Logging: {}".format(model["model_name"]))
+
+        # Create UID from the content of estimator params, feature set and training data
+        uid = registry.model_uid(model["model_object"], [task["config_data"]], fingerprint)
+
+        # Assign model's UID
+        model["model_uid"] = uid
+
+        # Create training log data
+        training_log["run_id"].append(run_id)
+        training_log["model_name"].append("{}-{}".format(configuration_model, model["model_name"]))
+        training_log["model_uid"].append(uid)
+        training_log["training_time"].append(result["training_time"])
+        training_log["training_date"].append(result["training_date"])
+        training_log["performance"].append(result["performance"])
+        training_log["mse"].append(result["performance"])
+        training_log["data_configurations"].append(task["config_data"])
+        training_log["data_fingerprint"].append(fingerprint)
+        training_log["backtest_mse"].append(result["backtest"].get("backtest_mse"))
+        training_log["backtest_mae"].append(result["backtest"].get("backtest_mae"))
+        training_log["backtest_directional_accuracy"].append(result["backtest"].get("backtest_directional_accuracy"))
+
+        # Collect current trained model
+        list_of_trained_model.setdefault(task["config_data"], list()).append(model)
+
+    # Append every record of this run to the training log store at once
+    records = [dict(zip(training_log, values)) for values in zip(*training_log.values())]
+    training_log_store(params).append_many(records, run_id)
 
-            # Debug message
-            util.print_debug("Model {} has been trained for configuration data {}.".format(model["model_name"], config_data))
-        
-        # Collect current trained list of model
-        list_of_trained_model[config_data] = copy.deepcopy(trained_model)
-    
     # Debug message
-    util.print_debug("All combination models and configuration data has been trained.")
+    task_time = sum(result["task_time"] for result in results)
+    util.print_debug("All combination models and configuration data has been trained in {:.2f}s wall clock, {:.2f}s of task time ({:.1f}x speedup).".format(
+        wall_time, task_time, task_time / wall_time if wall_time else 0))
     
     # Return list trained model
     return list_of_trained_model, training_log
 
 def get_production_model(list_of_model, training_log, params):
-    # Create copy list of model
-    list_of_model = copy.deepcopy(list_of_model)
-    
+    # Reference every trained model by its UID, models are looked up rather than copied
+    trained_models = {
+        model_data["model_uid"]: model_data
+        for configuration_data in list_of_model
+        for model_data in list_of_model[configuration_data]
+    }
+
     # Debug message
     util.print_debug("Choosing model by metrics score.")
 
@@ -236,21 +315,15 @@ def get_production_model(list_of_model, training_log, params):
     prev_production_model = None
     production_model_log = None
 
-    # Debug message
-    util.print_debug("Converting training log type of data from dict to dataframe.")
-
-    # Convert dictionary to pandas for easy operation
-    training_log = pd.DataFrame(copy.deepcopy(training_log))
-
     # Debug message
     util.print_debug("Trying to load previous production model.")
 
-    # Check if there is a previous production model
-    try:
-        prev_production_model = util.pickle_load(params["production_model_path"])
+    # Check if there is a previous production model, its estimator is loaded lazily
+    model_registry = registry.ModelRegistry(params["model_registry_dir"])
+    prev_production_model = model_registry.load_stage("production")
+    if prev_production_model != None:
         util.print_debug("Previous production model loaded.")
-
-    except FileNotFoundError as fe:
+    else:
         util.print_debug("No previous production model detected, choosing best model only from current trained model.")
 
     # If previous production model detected:
@@ -289,16 +362,17 @@ def get_production_model(list_of_model, training_log, params):
 
             # Update their performance log
             prev_production_model["model_log"]["performance"] = eval_res
-            prev_production_model["model_log"]["mse"] = eval_res["mse"]
+            prev_production_model["model_log"]["mse"] = eval_res
+
+            # Backtest metrics come from an older run, so the previous model only competes on mse
+            for key in ["backtest_mse", "backtest_mae", "backtest_directional_accuracy"]:
+                prev_production_model["model_log"][key] = None
 
             # Debug message
             util.print_debug("Adding previous model data to current training log and list of model")
 
-            # Added previous production model log to current logs to compere who has the greatest f1 score
-            training_log = pd.concat([training_log, pd.DataFrame([prev_production_model["model_log"]])])
-
-            # Added previous production model to current list of models to choose from if it has the greatest f1 score
-            list_of_model["prev_production_model"] = [copy.deepcopy(prev_production_model["model_data"])]
+            # Added previous production model to the registry to choose from if it has the lowest mse
+            trained_models[prev_production_model["model_data"]["model_uid"]] = prev_production_model["model_data"]
         else:
             # To indicate that we are not using previous production model
             prev_production_model = None
@@ -306,26 +380,44 @@ def get_production_model(list_of_model, training_log, params):
             # Debug message
             util.print_debug("Different features between production model with current dataset is detected, ignoring production dataset.")
 
-    # Debug message
-    util.print_debug("Sorting training log by mse and training time.")
+    # Selection metric, either validation mse or a fold-aggregated backtest metric
+    metric = params.get("selection_metric", "mse")
 
-    # Sort training log by mse and training time
-    best_model_log = training_log.sort_values(["mse", "training_time"], ascending = [False, True]).iloc[0]
+    # Backtest metrics only exist when the backtest has run
+    if metric.startswith("backtest_") and not params.get("backtest_enabled"):
+        util.print_debug("Selection metric {} needs backtest_enabled, choosing by mse instead.".format(metric))
+        metric = "mse"
+
+    # Debug message
+    util.print_debug("Querying training log store for the lowest {} of this run.".format(metric))
+
+    # Best model of the current run is an indexed query on the training log store
+    best_model_log = training_log_store(params).best(training_log["run_id"][0], metric)
+    if best_model_log is None and metric != "mse":
+        util.print_debug("No model of this run has a {}, choosing by mse instead.".format(metric))
+        metric = "mse"
+        best_model_log = training_log_store(params).best(training_log["run_id"][0], metric)
+    if best_model_log is None:
+        raise RuntimeError("No model of this run has been logged.")
+    best_model_log = json.loads(best_model_log["record"])
+
+    # Previous production model wins if it still has the lowest metric
+    if prev_production_model != None and prev_production_model["model_log"].get(metric) is not None and \
+        (prev_production_model["model_log"][metric], prev_production_model["model_log"]["training_time"]) < (best_model_log[metric], best_model_log["training_time"]):
+        best_model_log = prev_production_model["model_log"]
     
     # Debug message
     util.print_debug("Searching model data based on sorted training log.")
 
-    # Get model object with greatest mse score macro avg by using UID
-    for configuration_data in list_of_model:
-        for model_data in list_of_model[configuration_data]:
-            if model_data["model_uid"] == best_model_log["model_uid"]:
-                curr_production_model = dict()
-                curr_production_model["model_data"] = copy.deepcopy(model_data)
-                curr_production_model["model_log"] = copy.deepcopy(best_model_log.to_dict())
-                curr_production_model["model_log"]["model_name"] = "Production-{}".format(curr_production_model["model_data"]["model_name"])
-                curr_production_model["model_log"]["training_date"] = str(curr_production_model["model_log"]["training_date"])
-                production_model_log = training_log_updater(curr_production_model["model_log"], params)
-                break
+    # Get model object with lowest mse by using UID, the chosen model is referenced, not copied
+    model_data = trained_models.get(best_model_log["model_uid"])
+    if model_data != None:
+        curr_production_model = dict()
+        curr_production_model["model_data"] = model_data
+        curr_production_model["model_log"] = dict(best_model_log)
+        curr_production_model["model_log"]["model_name"] = "Production-{}".format(curr_production_model["model_data"]["model_name"])
+        curr_production_model["model_log"]["training_date"] = str(curr_production_model["model_log"]["training_date"])
+        production_model_log = training_log_updater(curr_production_model["model_log"], params)
     
     # In case UID not found
     if curr_production_model == None:
@@ -334,15 +426,66 @@ def get_production_model(list_of_model, training_log, params):
     # Debug message
     util.print_debug("Model chosen.")
 
-    # Dump chosen production model
-    util.pickle_dump(curr_production_model, params["production_model_path"])
+    # Store the chosen model once in the registry and point the production stage to it
+    uid = model_registry.register(
+        curr_production_model["model_data"],
+        curr_production_model["model_log"],
+        list(curr_production_model["model_data"]["model_object"].feature_names_in_),
+        curr_production_model["model_log"].get("data_fingerprint"),
+    )
+    model_registry.promote(uid, "production")
     
     # Return current chosen production model, log of production models and current training log
     return curr_production_model, production_model_log, training_log
     
+def load_online_state(params: dict) -> dict:
+    # Sufficient statistics of every linear model, per data configuration
+    if os.path.isfile(params["online_state_path"]):
+        return util.pickle_load(params["online_state_path"])
+
+    # Debug message
+    util.print_debug("No online state found, initializing it from the train set.")
+
+    # First state is a full fit on the train set, later refits only add the new rows
+    x_train, y_train = load_train_feng(params)
+    online_models = dict()
+    for config_data in x_train.columns:
+        for model in create_model_object(params):
+            if online_linear.is_linear(model["model_object"]):
+                online_model = online_linear.from_estimator(model["model_object"], params.get("online_window"))
+                online_models.setdefault(config_data, dict())[model["model_name"]] = online_model.fit(x_train[[config_data]], y_train)
+
+    return online_models
+
+def online_refit(params: dict, x_new: pd.DataFrame, y_new: pd.Series) -> dict:
+    # Load the sufficient statistics of the previous refit
+    online_models = load_online_state(params)
+
+    # Debug message
+    util.print_debug("Updating {} online model(s) with {} new row(s).".format(sum(len(models) for models in online_models.values()), len(x_new)))
+
+    # Add the new rows to every model of their configuration, rows leaving the rolling window are subtracted
+    refit_time = util.time_stamp()
+    for config_data, models in online_models.items():
+        for online_model in models.values():
+            online_model.partial_fit(x_new[[config_data]], y_new)
+    refit_time = (util.time_stamp() - refit_time).total_seconds()
+
+    # Store the updated statistics for the next refit
+    util.pickle_dump(online_models, params["online_state_path"])
+
+    # Debug message
+    util.print_debug("Online models updated in {:.4f}s.".format(refit_time))
+
+    # Return the refit models, keyed by configuration then model name
+    return online_models
+
 def create_grid_params(model_name: str) -> dict:
 
     # Define models parameters
+    grid_params_lnr = {
+        "fit_intercept": [True, False]
+    }
     grid_params_xgb = {
         "n_estimators": [50, 100, 200, 300, 400, 500]
     }
@@ -371,6 +514,7 @@ def create_grid_params(model_name: str) -> dict:
 
     # Combine all models parameters into one
     grid_params = {
+        "LinearRegression": grid_params_lnr,
         "XGBRegressor": grid_params_xgb,
         "DecisionTreeRegressor": grid_params_dct,
         "KNeighborsRegressor": grid_params_knn,
@@ -381,32 +525,51 @@ def create_grid_params(model_name: str) -> dict:
     # Return distribution of model parameters
     return grid_params[model_name]
 
-def hyper_params_tuning(model: dict) -> list:
-    # Create copy of current best baseline model
-    model = copy.deepcopy(model)
-
+def hyper_params_tuning(model: dict, params: dict = None) -> list:
     # Create model's parameter distribution
     grid_params = create_grid_params(model["model_data"]["model_name"])
 
-    # Create model object
-    model_gsc = GridSearchCV(model["model_data"]["model_object"], grid_params, n_jobs = -1)
+    # A previous production model from the registry is searched on its real estimator
+    model_object = model["model_data"]["model_object"]
+    if isinstance(model_object, registry.LazyModel):
+        model_object = model_object.load()
+
+    # Exhaustive grid search, kept for comparison with the budgeted search
+    if params is None or params.get("search_method", "halving") == "grid":
+        model_gsc = GridSearchCV(model_object, grid_params, n_jobs = -1)
+        model_data = {
+            "model_name": model["model_data"]["model_name"],
+            "model_object": model_gsc,
+            "model_uid": ""
+        }
+
+        # Return model object
+        return [model_data]
+
+    # Search on the train set of the features the model has been trained on, with time series folds
+    features = list(model_object.feature_names_in_)
+    x_train, y_train = load_train_feng(params, features)
+    result = search.successive_halving(model_object, grid_params, x_train, y_train, params)
+
+    # Debug message
+    util.print_debug("Best params: {} with mse {:.6f} after {} new fits.".format(result["best_params"], result["best_score"], result["fits"]))
+
+    # Unfitted estimator with the best params, trained on every configuration by train_eval
     model_data = {
         "model_name": model["model_data"]["model_name"],
-        "model_object": model_gsc,
+        "model_object": clone(model_object).set_params(**result["best_params"]),
         "model_uid": ""
     }
-    
+
     # Return model object
     return [model_data]
 
-if __name__ == "__main__":
-    params = util.load_config()
-
+def main(params: dict) -> float:
     list_of_trained_model, training_log = train_eval("Baseline", params)
 
     model, production_model_log, training_logs = get_production_model(list_of_trained_model, training_log, params)
 
-    list_of_trained_model, training_log = train_eval("Hyperparams_Tuning", params, hyper_params_tuning(model))
+    list_of_trained_model, training_log = train_eval("Hyperparams_Tuning", params, hyper_params_tuning(model, params))
 
     # Load data
     x_train, y_train = load_train_feng(params)
@@ -421,3 +584,10 @@ if __name__ == "__main__":
     # Calculate Mean Squared Error
     mse = mean_squared_error(y_valid, y_pred)
     print("Mean Squared Error:", mse)
+
+    return mse
+
+if __name__ == "__main__":
+    params = util.load_config()
+
+    main(params)
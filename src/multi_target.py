@@ -0,0 +1,185 @@
+from sklearn.metrics import mean_squared_error
+from sklearn.base import clone
+import pandas as pd
+import numpy as np
+
+import util as util
+import parallel as parallel
+import registry as registry
+import modelling as modelling
+import preprocessing as preprocessing
+
+# Relative fit cost per row and feature, so the slowest tasks are scheduled first
+MODEL_COST = {
+    "LinearRegression": 1,
+    "Ridge": 1,
+    "KNeighborsRegressor": 2,
+    "DecisionTreeRegressor": 5,
+    "XGBRegressor": 50,
+    "RandomForestRegressor": 100,
+}
+
+
+def load_prices(params: dict) -> pd.DataFrame:
+    # Full clean price panel, shared by every target
+    return util.pickle_load(params["clean_dataset_path"])
+
+def split_dates(params: dict) -> tuple:
+    # Last date of the train and valid set, as split by the data pipeline
+    y_train = util.pickle_load(params["train_set_path"][1])
+    y_valid = util.pickle_load(params["valid_set_path"][1])
+
+    return y_train.index[-1], y_valid.index[-1]
+
+def target_tickers(params: dict, prices: pd.DataFrame) -> list:
+    # Every ticker of the panel unless a watchlist is configured
+    tickers = params.get("multi_target_tickers")
+    if tickers is None:
+        return list(prices.columns)
+
+    return [ticker for ticker in tickers if ticker in prices.columns]
+
+def task_cost(task: dict) -> float:
+    # Estimated fit time of a task
+    return MODEL_COST.get(task["model"]["model_name"], 10) * task["n_rows"] * len(task["features"])
+
+def fit_target_task(task: dict) -> dict:
+    # Returns and D+2 targets of the whole panel are shared by every worker
+    arrays = parallel.shared_arrays()
+    model = task["model"]
+    features = task["features"]
+
+    # Rows of this target where the target and every feature are present
+    x = arrays["returns"][:, task["feature_positions"]]
+    y = arrays["targets"][:, task["target_position"]]
+    complete = np.isfinite(x).all(axis=1) & np.isfinite(y)
+    train_rows = np.flatnonzero(complete[:task["train_end"]])
+    valid_rows = task["train_end"] + np.flatnonzero(complete[task["train_end"]:task["valid_end"]])
+
+    # Debug message
+    util.print_debug("Training model: {} on target: {}".format(model["model_name"], task["ticker"]))
+
+    # Training
+    x_train = pd.DataFrame(x[train_rows], columns=features)
+    y_train = pd.Series(y[train_rows], name=task["ticker"])
+    training_time = util.time_stamp()
+    model["model_object"].fit(x_train, y_train)
+    training_time = (util.time_stamp() - training_time).total_seconds()
+
+    # Evaluation
+    y_predict = model["model_object"].predict(pd.DataFrame(x[valid_rows], columns=features))
+    performance = mean_squared_error(y[valid_rows], y_predict)
+
+    # UID of the model depends on its target through the training data
+    fingerprint = registry.data_fingerprint(x_train, y_train)
+    model["model_uid"] = registry.model_uid(model["model_object"], features, fingerprint)
+
+    return {"model": model, "training_time": training_time, "training_date": util.time_stamp(),
+            "performance": performance, "data_fingerprint": fingerprint}
+
+def create_tasks(params: dict, returns: pd.DataFrame, correlations: pd.DataFrame, tickers: list, train_end: int, valid_end: int) -> list:
+    # Models trained for every target, cloned unfitted into each task
+    model_names = params.get("multi_target_models")
+    list_of_model = [model for model in modelling.create_model_object(params) if model_names is None or model["model_name"] in model_names]
+    positions = {column: position for position, column in enumerate(returns.columns)}
+
+    tasks = list()
+    for target_position, ticker in enumerate(tickers):
+        # Features most correlated with the D+2 return of this target, from the shared correlation matrix
+        # Only features with a finite correlation are used, a target without any is skipped instead of failing the run
+        features = list(preprocessing.top_k_correlated(
+            correlations[ticker], params.get("feature_top_k", 10), params.get("feature_abs_correlation", False), pad=False
+        ).index)
+        if not features:
+            util.print_debug("Skipping target {}: no feature has a finite correlation with its return.".format(ticker))
+            continue
+
+        for model in list_of_model:
+            tasks.append({
+                "ticker": ticker, "features": features, "n_rows": train_end,
+                "model": {"model_name": model["model_name"], "model_object": clone(model["model_object"]), "model_uid": ""},
+                "feature_positions": [positions[feature] for feature in features],
+                "target_position": target_position, "train_end": train_end, "valid_end": valid_end,
+            })
+
+    # Longest tasks first, idle workers then pull the remaining shorter ones so a few slow targets do not stall the pool
+    tasks.sort(key=task_cost, reverse=True)
+
+    return tasks
+
+def train_targets(params: dict, prices: pd.DataFrame = None, split: tuple = None, tickers: list = None) -> dict:
+    # Load the price panel and compute returns once for every target
+    prices = load_prices(params) if prices is None else prices
+    train_date, valid_date = split_dates(params) if split is None else split
+    tickers = target_tickers(params, prices) if tickers is None else tickers
+    returns = preprocessing.compute_stock_return(prices)
+    targets = returns[tickers].shift(periods=-params.get("multi_target_horizon", 2))
+
+    # Debug message
+    util.print_debug("Computing correlation matrix of {} features with {} targets.".format(returns.shape[1], len(tickers)))
+
+    # Correlation of every feature with every target, on the train rows only
+    train_end = int(returns.index.searchsorted(train_date, side="right"))
+    valid_end = int(returns.index.searchsorted(valid_date, side="right"))
+    correlations = preprocessing.cross_correlation(
+        returns.iloc[:train_end], targets.iloc[:train_end], params.get("feature_corr_chunk_size")
+    )
+
+    # One task per target and model, fit on the process pool with the panel shared once
+    tasks = create_tasks(params, returns, correlations, tickers, train_end, valid_end)
+    arrays = {"returns": returns.to_numpy(dtype="float64"), "targets": targets.to_numpy(dtype="float64")}
+
+    # Debug message
+    util.print_debug("Training {} tasks for {} targets on {} worker(s).".format(len(tasks), len(tickers), params.get("multi_target_workers", 1)))
+
+    wall_time = util.time_stamp()
+    results = parallel.run_tasks(fit_target_task, tasks, params.get("multi_target_workers", 1), arrays)
+    wall_time = (util.time_stamp() - wall_time).total_seconds()
+
+    # Log every model of the run
+    run_id = "MultiTarget-{}".format(util.time_stamp().strftime("%Y%m%d%H%M%S%f"))
+    records = list()
+    for task, result in zip(tasks, results):
+        records.append({
+            "run_id": run_id,
+            "model_name": "MultiTarget-{}-{}".format(task["ticker"], result["model"]["model_name"]),
+            "model_uid": result["model"]["model_uid"],
+            "training_time": result["training_time"],
+            "training_date": result["training_date"],
+            "performance": result["performance"],
+            "mse": result["performance"],
+            "data_configurations": task["ticker"],
+            "data_fingerprint": result["data_fingerprint"],
+            "target": task["ticker"],
+            "features": task["features"],
+        })
+    modelling.training_log_store(params).append_many(records, run_id)
+
+    # Best model of every target, lowest mse then fastest training
+    best = dict()
+    for task, result, record in zip(tasks, results, records):
+        current = best.get(task["ticker"])
+        if current is None or (record["mse"], record["training_time"]) < (current["model_log"]["mse"], current["model_log"]["training_time"]):
+            best[task["ticker"]] = {"model_data": result["model"], "model_log": record}
+
+    # Register every best model, save the index once and point each target stage to its model
+    model_registry = registry.ModelRegistry(params["model_registry_dir"])
+    stages = dict()
+    for ticker, model in best.items():
+        stages[registry.target_stage(ticker)] = model_registry.register(
+            model["model_data"], model["model_log"], model["model_log"]["features"], model["model_log"]["data_fingerprint"], save=False
+        )
+    model_registry.save_index()
+    model_registry.promote_many(stages)
+
+    # Debug message
+    task_time = sum(result["training_time"] for result in results)
+    util.print_debug("{} targets trained in {:.2f}s wall clock, {:.2f}s of fit time.".format(len(best), wall_time, task_time))
+
+    # Return the production model of every target
+    return best
+
+if __name__ == "__main__":
+    params = util.load_config()
+
+    train_targets(params)
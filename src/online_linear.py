@@ -0,0 +1,122 @@
+from sklearn.base import BaseEstimator, RegressorMixin
+from collections import deque
+import pandas as pd
+import numpy as np
+
+
+class OnlineLinearRegression(BaseEstimator, RegressorMixin):
+    # Linear regression / ridge kept as sufficient statistics, so new rows update the fit in O(p^2) each
+    def __init__(self, alpha: float = 0.0, fit_intercept: bool = True, window: int = None):
+        self.alpha = alpha
+        self.fit_intercept = fit_intercept
+        self.window = window
+
+    def reset(self, n_features: int) -> None:
+        # Sums of rows, targets and their cross products
+        self.n_samples_seen_ = 0
+        self.sum_x_ = np.zeros(n_features)
+        self.sum_y_ = 0.0
+        self.xtx_ = np.zeros((n_features, n_features))
+        self.xty_ = np.zeros(n_features)
+        self.n_features_in_ = n_features
+
+        # Rows inside the rolling window, needed to subtract them once they leave it
+        self.rows_ = deque() if self.window else None
+
+    def to_arrays(self, x, y=None) -> tuple:
+        # Remember feature names the same way sklearn estimators do
+        if isinstance(x, pd.DataFrame) and not hasattr(self, "feature_names_in_"):
+            self.feature_names_in_ = np.asarray(x.columns, dtype=object)
+        x = np.asarray(x, dtype="float64")
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        if y is None:
+            return x
+        return x, np.asarray(y, dtype="float64").reshape(-1)
+
+    def update(self, x: np.ndarray, y: np.ndarray, sign: float) -> None:
+        # Add (sign = 1) or subtract (sign = -1) rows from the sufficient statistics
+        self.n_samples_seen_ += int(sign) * len(x)
+        self.sum_x_ += sign * x.sum(axis=0)
+        self.sum_y_ += sign * y.sum()
+        self.xtx_ += sign * (x.T @ x)
+        self.xty_ += sign * (x.T @ y)
+
+    def partial_fit(self, x, y):
+        x, y = self.to_arrays(x, y)
+        if not hasattr(self, "xtx_"):
+            self.reset(x.shape[1])
+
+        # Add the new rows
+        self.update(x, y, 1.0)
+
+        # Subtract the rows that left the rolling window
+        if self.window:
+            self.rows_.extend(zip(x, y))
+            old = [self.rows_.popleft() for _ in range(max(0, len(self.rows_) - self.window))]
+            if old:
+                self.update(np.array([row for row, _ in old]), np.array([target for _, target in old]), -1.0)
+
+        return self.solve()
+
+    def forget(self, x, y):
+        # Remove rows explicitly, e.g. a revised or delisted day
+        x, y = self.to_arrays(x, y)
+
+        # Forgotten rows also leave the rolling window, so they are not subtracted again on eviction
+        if self.window:
+            for row, target in zip(x, y):
+                position = next((i for i, (kept, kept_target) in enumerate(self.rows_)
+                                 if kept_target == target and np.array_equal(kept, row)), None)
+                if position is None:
+                    raise ValueError("Row to forget is not inside the rolling window.")
+                del self.rows_[position]
+
+        self.update(x, y, -1.0)
+
+        return self.solve()
+
+    def fit(self, x, y):
+        # Full fit is a partial fit from empty statistics
+        if hasattr(self, "feature_names_in_"):
+            del self.feature_names_in_
+        self.reset(np.asarray(x).shape[1])
+
+        return self.partial_fit(x, y)
+
+    def solve(self):
+        # Center the statistics so the intercept is not penalized, as in sklearn Ridge
+        n = self.n_samples_seen_
+        if self.fit_intercept and n > 0:
+            mean_x = self.sum_x_ / n
+            mean_y = self.sum_y_ / n
+            xtx = self.xtx_ - n * np.outer(mean_x, mean_x)
+            xty = self.xty_ - n * mean_x * mean_y
+        else:
+            mean_x = np.zeros(self.n_features_in_)
+            mean_y = 0.0
+            xtx, xty = self.xtx_, self.xty_
+
+        # Minimum norm solution of the normal equations, also defined for collinear features
+        xtx = xtx + self.alpha * np.eye(self.n_features_in_)
+        self.coef_ = np.linalg.lstsq(xtx, xty, rcond=None)[0]
+        self.intercept_ = float(mean_y - mean_x @ self.coef_)
+
+        return self
+
+    def predict(self, x) -> np.ndarray:
+        x = np.asarray(x, dtype="float64")
+        return x @ self.coef_ + self.intercept_
+
+
+def from_estimator(model_object, window: int = None) -> OnlineLinearRegression:
+    # Online equivalent of a LinearRegression or Ridge estimator
+    return OnlineLinearRegression(
+        alpha=getattr(model_object, "alpha", 0.0),
+        fit_intercept=model_object.fit_intercept,
+        window=window,
+    )
+
+def is_linear(model_object) -> bool:
+    # Only the linear family can be refit from sufficient statistics
+    return model_object.__class__.__name__ in ("LinearRegression", "Ridge", "OnlineLinearRegression")
@@ -0,0 +1,36 @@
+import pandas as pd
+import numpy as np
+
+
+def panel_dtype(params: dict) -> np.dtype:
+    # Float dtype of the price and return panels, float32 in compact mode
+    if params.get("compact_panels"):
+        return np.dtype(params.get("panel_dtype", "float32"))
+
+    return np.dtype("float64")
+
+def compact_frame(frame: pd.DataFrame, dtype="float32", index: pd.DatetimeIndex = None) -> pd.DataFrame:
+    # One contiguous float block instead of a block per dtype or per concatenated piece
+    values = np.asarray(frame.to_numpy(dtype=dtype), order="C")
+
+    # Reuse a shared date index object when it holds the same dates
+    if index is None or not index.equals(frame.index):
+        index = frame.index
+
+    return pd.DataFrame(values, index=index, columns=frame.columns, copy=False)
+
+def share_index(*frames) -> list:
+    # Frames on the same dates point to one index object, so the dates are held in memory once
+    shared = frames[0].index
+    for frame in frames[1:]:
+        if frame.index.equals(shared):
+            frame.index = shared
+
+    return list(frames)
+
+def memory_usage(data) -> int:
+    # Bytes held by the values and the index of a frame or series
+    usage = data.memory_usage(index=True, deep=True)
+
+    return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+
@@ -0,0 +1,71 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+
+# Arrays published to the current process, either directly or attached from shared memory
+_arrays = {}
+_blocks = []
+
+
+class SharedArrays:
+    # Copy arrays once into shared memory blocks that worker processes attach to read-only
+    def __init__(self, arrays: dict):
+        self.blocks = []
+        self.spec = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.spec[name] = (block.name, array.shape, array.dtype.str)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        # Release the blocks once every worker is done
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+
+def attach_arrays(spec: dict) -> None:
+    # Attach every shared block as a read-only array of this worker
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+
+        array = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        _blocks.append(block)
+        _arrays[name] = array
+
+def shared_arrays() -> dict:
+    # Arrays available to the task currently running
+    return _arrays
+
+def run_tasks(function, tasks: list, workers: int, arrays: dict = None, on_result=None) -> list:
+    # Variabel to store results in task order
+    results = [None] * len(tasks)
+    arrays = arrays or {}
+
+    # Run in-process when no pool is requested
+    if workers is None or workers <= 1:
+        _arrays.clear()
+        _arrays.update(arrays)
+        for i, task in enumerate(tasks):
+            results[i] = function(task)
+            if on_result is not None:
+                on_result(task, results[i])
+        return results
+
+    # Every task is submitted on its own, so an idle worker always picks the next pending one
+    with SharedArrays(arrays) as shared:
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_arrays, initargs=(shared.spec,)) as executor:
+            futures = {executor.submit(function, task): i for i, task in enumerate(tasks)}
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                if on_result is not None:
+                    on_result(tasks[i], results[i])
+
+    return results
@@ -0,0 +1,151 @@
+from datetime import date
+import argparse
+import time
+import os
+
+import util as util
+import instrument as instrument
+import stage_cache as stage_cache
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Modules imported by every stage, part of every stage's code hash
+COMMON_CODE = ["util.py"]
+
+# Pipeline DAG in run order: artifacts every stage reads and writes (config keys of paths),
+# the config keys its result depends on and the modules of its code
+STAGES = [
+    {
+        "name": "data_pipeline",
+        "module": "data_pipeline",
+        "depends_on": [],
+        "inputs": ["raw_dataset_dir"],
+        "outputs": ["raw_dataset_path", "clean_dataset_path", "train_set_path", "valid_set_path", "test_set_path"],
+        "config_keys": ["ticker_ext", "start_date", "interval_date", "target", "incremental_refresh",
+                        "incremental_overlap_days", "storage_format", "compact_panels", "panel_dtype"],
+        "code": ["data_pipeline.py", "downloader.py", "store.py", "panel.py"],
+        # Prices are downloaded up to today, so the stage reruns once a day
+        "daily": True,
+    },
+    {
+        "name": "preprocessing",
+        "module": "preprocessing",
+        "depends_on": ["data_pipeline"],
+        "inputs": ["clean_dataset_path", "train_set_path", "valid_set_path", "test_set_path"],
+        "outputs": ["train_feng_set_path", "valid_feng_set_path", "test_feng_set_path"],
+        "config_keys": ["target", "feature_top_k", "feature_abs_correlation", "feature_corr_window", "storage_format",
+                        "compact_panels", "panel_dtype"],
+        "code": ["preprocessing.py", "store.py", "panel.py"],
+        "daily": False,
+    },
+    {
+        "name": "modelling",
+        "module": "modelling",
+        "depends_on": ["preprocessing"],
+        "inputs": ["train_feng_set_path", "valid_feng_set_path", "test_feng_set_path"],
+        # The registry is shared and changed by promotions, multi-target runs and rollbacks, so it is never
+        # restored from the cache, a hit only skips retraining on unchanged inputs
+        "outputs": [],
+        "config_keys": ["selection_metric", "backtest_enabled", "backtest_window", "backtest_min_train_size",
+                        "backtest_train_size", "backtest_refit_every", "backtest_horizon", "search_method",
+                        "search_n_splits", "search_factor", "search_min_resources", "search_max_fits", "search_seed",
+                        "compact_panels", "panel_dtype", "model_random_state"],
+        "code": ["modelling.py", "backtest.py", "search.py", "registry.py", "parallel.py", "log_store.py", "manifest.py", "panel.py"],
+        "daily": False,
+    },
+    {
+        "name": "dashboard_data",
+        "module": "dashboard_data",
+        "depends_on": ["data_pipeline"],
+        "inputs": ["raw_dataset_path", "predict_dataset_path", "clean_dataset_path"],
+        "outputs": ["dashboard_snapshot_path"],
+        "config_keys": ["target_stock", "dashboard_max_points", "dashboard_downsample_method", "dashboard_last_n_days"],
+        "code": ["dashboard_data.py", "downsample.py", "store.py"],
+        "daily": False,
+    },
+]
+
+
+def stage_order(stages: list) -> list:
+    # Topological order of the DAG, every stage after the stages it depends on
+    ordered, done = [], set()
+    while len(ordered) < len(stages):
+        ready = [stage for stage in stages if stage["name"] not in done and set(stage["depends_on"]) <= done]
+        if not ready:
+            raise ValueError("Pipeline stages have a dependency cycle.")
+        ordered.extend(ready)
+        done.update(stage["name"] for stage in ready)
+
+    return ordered
+
+def config_paths(params: dict, keys: list) -> list:
+    # Config values of path keys, some of them are [x, y] pairs
+    paths = []
+    for key in keys:
+        value = params[key]
+        paths.extend(value if isinstance(value, list) else [value])
+
+    return paths
+
+def stage_key(cache: stage_cache.StageCache, stage: dict, params: dict) -> str:
+    return cache.key(
+        stage["name"],
+        config_paths(params, stage["inputs"]),
+        {key: params.get(key) for key in stage["config_keys"]},
+        [os.path.join(SRC_DIR, path) for path in stage["code"] + COMMON_CODE],
+        str(date.today()) if stage["daily"] else None,
+    )
+
+def run_stage(stage: dict, params: dict) -> None:
+    # Stage modules are only imported when they actually run
+    module = __import__(stage["module"])
+    with instrument.span("stage", stage=stage["name"]), instrument.profile(stage["name"]):
+        module.main(params)
+
+def run(params: dict, stages: list = None, force: bool = False) -> list:
+    # Variabel to store the report of every stage
+    report = []
+    cache = stage_cache.StageCache(params["stage_cache_dir"], params.get("stage_cache_max_bytes"), params.get("stage_cache_max_age_days"))
+    selected = stages or [stage["name"] for stage in STAGES]
+
+    for stage in stage_order(STAGES):
+        if stage["name"] not in selected:
+            continue
+
+        # Key of the stage on its current inputs, an upstream miss that changed them leads to a new key
+        start = time.perf_counter()
+        key = stage_key(cache, stage, params)
+        meta = None if force else cache.restore(key)
+
+        if meta is not None:
+            # Hit: outputs are already on disk or restored from the cache
+            status, saved = "hit", meta["duration"]
+        else:
+            # Miss: run the stage and store its outputs under the key of its inputs
+            util.print_debug("Running stage: {}".format(stage["name"]))
+            run_stage(stage, params)
+            cache.save(key, stage["name"], config_paths(params, stage["outputs"]), time.perf_counter() - start)
+            status, saved = "miss", 0.0
+
+        report.append({"stage": stage["name"], "status": status, "seconds": time.perf_counter() - start, "saved_seconds": saved, "key": key})
+
+    return report
+
+def print_report(report: list) -> None:
+    print("{:<16} {:<6} {:>10} {:>12}".format("stage", "cache", "seconds", "saved"))
+    for row in report:
+        print("{:<16} {:<6} {:>10.2f} {:>12.2f}".format(row["stage"], row["status"], row["seconds"], row["saved_seconds"]))
+    print("total time saved: {:.2f}s".format(sum(row["saved_seconds"] for row in report)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("stages", nargs="*", help="stages to run, all by default: {}".format(", ".join(stage["name"] for stage in STAGES)))
+    parser.add_argument("--force", action="store_true", help="run every selected stage, ignoring cached outputs")
+    parser.add_argument("--profile", action="append", default=[], help="profile a stage (repeatable, 'all' for every stage)")
+    args = parser.parse_args()
+
+    params = util.load_config()
+    if args.profile:
+        instrument.configure(profile_stages=args.profile)
+
+    print_report(run(params, args.stages, args.force))
@@ -1,7 +1,7 @@
 import pandas as pd
 import numpy as np
-import seaborn as sns
 import util as util
+import panel as panel
 
 def load_dataset(config_data: dict) -> pd.DataFrame:
     
@@ -30,9 +30,13 @@ def load_dataset(config_data: dict) -> pd.DataFrame:
 # 1. the data value will vary from -0.5 to +0.5. While its possible, its less likely stock change will be up/down more than 50% within 2 days. 
 # 2. the stock return is something we want to know anyway therefore its a representative approach in this case
 
-def transform_to_stock_return(dataset, params):
+def compute_stock_return(dataset):
     # define the return for all stock based on the next day of its price change percentage 
-    dataset = (dataset.shift(periods=1)-dataset)*100/dataset
+    return (dataset.shift(periods=1)-dataset)*100/dataset
+
+def transform_to_stock_return(dataset, params):
+    # define the return for all stock
+    dataset = compute_stock_return(dataset)
     
     #define the target return column name
     target_return_column_name = f"{params['target']} Return D+2"
@@ -49,12 +53,171 @@ def transform_to_stock_return(dataset, params):
 
     return dataset
 
+class StreamingReturnTransformer:
+    # Keep the last price row and the rows still waiting for their D+2 target, so appended days cost O(tickers)
+    def __init__(self, params: dict):
+        self.target = params['target']
+        self.target_return_column_name = f"{params['target']} Return D+2"
+        self.last_prices = None
+        self.pending = None
+
+    def update(self, prices: pd.DataFrame) -> pd.DataFrame:
+        # Returns of the new rows only, the previous price row stands in for the shift
+        if self.last_prices is None:
+            returns = compute_stock_return(prices)
+        else:
+            returns = compute_stock_return(pd.concat([self.last_prices, prices])).iloc[1:]
+        self.last_prices = prices.iloc[-1:]
+
+        # Rows waiting for a target get it once the returns two rows ahead have landed
+        if self.pending is not None:
+            returns = pd.concat([self.pending, returns])
+        returns[self.target_return_column_name] = returns[self.target].shift(periods=-2)
+
+        # Last two rows stay pending until their future prices arrive
+        self.pending = returns.iloc[-2:].drop(columns=self.target_return_column_name)
+        completed = returns.iloc[:-2]
+
+        # Same missing value handling as the batch transform
+        return completed.dropna(subset=[self.target, self.target_return_column_name])
+
+    def transform(self, dataset: pd.DataFrame) -> pd.DataFrame:
+        # Stream a whole history row by row, mainly to check against the batch function
+        rows = [self.update(dataset.iloc[position:position + 1]) for position in range(len(dataset))]
+        return pd.concat(rows)
+
+def correlation_with_target(dataset: pd.DataFrame, target_column: str, window: int = None, chunk_size: int = None) -> pd.Series:
+    # Correlate on the latest rows only when a window is given
+    if window is not None:
+        dataset = dataset.iloc[-window:]
+
+    # Target values, features are evaluated in column blocks to bound memory to rows x chunk_size
+    # float32 panels are upcast one block at a time, so the sums are accumulated in float64
+    y = dataset[target_column].to_numpy(dtype="float64")
+    chunk_size = chunk_size or dataset.shape[1]
+    correlations = []
+
+    for start in range(0, dataset.shape[1], chunk_size):
+        x = dataset.iloc[:, start:start + chunk_size].to_numpy(dtype="float64")
+
+        # Pairwise complete rows per column, like corrwith
+        mask = ~np.isnan(x) & ~np.isnan(y)[:, None]
+        count = mask.sum(axis=0)
+
+        # Two pass Pearson correlation over the masked rows of every column at once
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x_masked = np.where(mask, x, 0.0)
+            y_masked = np.where(mask, y[:, None], 0.0)
+            x_centered = np.where(mask, x_masked - x_masked.sum(axis=0) / count, 0.0)
+            y_centered = np.where(mask, y_masked - y_masked.sum(axis=0) / count, 0.0)
+            correlation = (x_centered * y_centered).sum(axis=0) / np.sqrt((x_centered ** 2).sum(axis=0) * (y_centered ** 2).sum(axis=0))
+
+        correlation[count < 2] = np.nan
+        correlations.append(correlation)
+
+    return pd.Series(np.concatenate(correlations), index=dataset.columns)
+
+def cross_correlation(features: pd.DataFrame, targets: pd.DataFrame, chunk_size: int = None) -> pd.DataFrame:
+    # Pairwise complete correlation of every feature with every target, as masked matrix products
+    x = features.to_numpy(dtype="float64")
+    x_mask = (~np.isnan(x)).astype("float64")
+    x = np.where(x_mask > 0, x, 0.0)
+    chunk_size = chunk_size or targets.shape[1]
+    correlations = []
+
+    # Targets are evaluated in column blocks to bound memory to features x chunk_size
+    for start in range(0, targets.shape[1], chunk_size):
+        y = targets.iloc[:, start:start + chunk_size].to_numpy(dtype="float64")
+        y_mask = (~np.isnan(y)).astype("float64")
+        y = np.where(y_mask > 0, y, 0.0)
+
+        # Sums over the rows where both the feature and the target are present
+        count = x_mask.T @ y_mask
+        sum_x, sum_y = x.T @ y_mask, x_mask.T @ y
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = x.T @ y - sum_x * sum_y / count
+            var_x = (x ** 2).T @ y_mask - sum_x ** 2 / count
+            var_y = x_mask.T @ (y ** 2) - sum_y ** 2 / count
+            correlation = cov / np.sqrt(var_x * var_y)
+
+        correlation[count < 2] = np.nan
+        correlations.append(correlation)
+
+    return pd.DataFrame(np.concatenate(correlations, axis=1), index=features.columns, columns=targets.columns)
+
+def rolling_correlation_with_target(dataset: pd.DataFrame, target_column: str, window: int, chunk_size: int = None,
+                                    min_periods: int = None) -> pd.DataFrame:
+    # Rolling sums of every pairwise complete window come from cumulative sums, in column blocks
+    y = dataset[target_column].to_numpy(dtype="float64")
+    chunk_size = chunk_size or dataset.shape[1]
+    correlations = []
+
+    def window_sum(values):
+        # Sum of the last `window` rows at every row
+        cumulative = np.cumsum(values, axis=0)
+        cumulative[window:] = cumulative[window:] - cumulative[:-window]
+        return cumulative
+
+    for start in range(0, dataset.shape[1], chunk_size):
+        x = dataset.iloc[:, start:start + chunk_size].to_numpy(dtype="float64")
+        mask = ~np.isnan(x) & ~np.isnan(y)[:, None]
+        x_masked = np.where(mask, x, 0.0)
+        y_masked = np.where(mask, y[:, None], 0.0)
+
+        count = window_sum(mask.astype("float64"))
+        sum_x, sum_y = window_sum(x_masked), window_sum(y_masked)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = window_sum(x_masked * y_masked) - sum_x * sum_y / count
+            var_x = window_sum(x_masked ** 2) - sum_x ** 2 / count
+            var_y = window_sum(y_masked ** 2) - sum_y ** 2 / count
+            correlation = cov / np.sqrt(var_x * var_y)
+
+        # Windows with too few complete rows have no correlation, as in pandas rolling
+        correlation[count < max(min_periods or window, 2)] = np.nan
+        correlations.append(correlation)
+
+    return pd.DataFrame(np.concatenate(correlations, axis=1), index=dataset.index, columns=dataset.columns)
+
+def top_k_correlated(correlation: pd.Series, k: int, absolute: bool = False, target: str = None, pad: bool = True) -> pd.Series:
+    # Rank by absolute correlation if asked, the target is kept out of the ranking and always comes last
+    candidates = correlation.drop(target) if target is not None else correlation
+    k = k - 1 if target is not None else k
+    score = candidates.abs() if absolute else candidates
+    values = score.to_numpy(dtype="float64")
+    valid = np.flatnonzero(np.isfinite(values))
+    n_top = max(min(k, len(valid)), 0)
+
+    # argpartition finds the k largest in linear time, only those k are sorted
+    top = valid[np.argpartition(-values[valid], n_top - 1)[:n_top]] if n_top > 0 else valid[:0]
+    top = top[np.argsort(values[top], kind="stable")]
+
+    # Like nlargest, remaining slots are filled with NaN or inf correlated columns in column order
+    if pad and n_top < k:
+        missing = np.flatnonzero(~np.isfinite(values))[:k - n_top]
+        top = np.concatenate([top, missing])
+
+    selected = candidates.iloc[top]
+    if target is not None:
+        selected = pd.concat([selected, correlation[[target]]])
+
+    return selected
+
 def keep_correlated_features(train_set, val_set, test_set, params):
     #define the target return column name
     target_return_column_name = f"{params['target']} Return D+2"
 
-    # define the correlated features
-    corr_stock = train_set.corrwith(train_set[target_return_column_name], axis=0).nlargest(10).sort_values(ascending=True)
+    # define the correlated features, the target column is always kept in last position
+    correlation = correlation_with_target(train_set, target_return_column_name, params.get("feature_corr_window"), params.get("feature_corr_chunk_size"))
+    corr_stock = top_k_correlated(correlation, params.get("feature_top_k", 10), params.get("feature_abs_correlation", False), target_return_column_name)
+
+    # Without any feature the model sets would be empty
+    if len(corr_stock) < 2:
+        raise ValueError("No features left to correlate with {}, check the clean dataset.".format(target_return_column_name))
+
+    # Debug message for correlations that could not be computed, e.g. inf returns from zero prices
+    n_missing = int((~np.isfinite(corr_stock.iloc[:-1].to_numpy(dtype="float64"))).sum())
+    if n_missing:
+        util.print_debug("{} of {} selected features have no finite correlation with {}.".format(n_missing, len(corr_stock) - 1, target_return_column_name))
 
     # keep correlated features
     train_set = train_set[corr_stock.index]
@@ -63,16 +226,22 @@ def keep_correlated_features(train_set, val_set, test_set, params):
 
     return corr_stock, train_set, val_set, test_set
 
-if __name__ == "__main__":
-    config_data = util.load_config()
-
+def main(config_data: dict) -> None:
     clean_data, train_set, valid_set, test_set = load_dataset(config_data)
 
-    train_set_feng = transform_to_stock_return(dataset=train_set, params=config_data)
+    # Transform the full panel once, so no split loses its first row to the shift
+    panel_feng = transform_to_stock_return(dataset=pd.concat([train_set, valid_set, test_set]), params=config_data)
 
-    val_set_feng = transform_to_stock_return(dataset=valid_set, params=config_data)
+    # Compact mode merges the returns and the added target column back into one float32 block
+    if config_data.get("compact_panels"):
+        panel_feng = panel.compact_frame(panel_feng, panel.panel_dtype(config_data))
 
-    test_set_feng = transform_to_stock_return(dataset=test_set, params=config_data)
+    # Slice every split back out of the transformed panel
+    train_set_feng = panel_feng.loc[panel_feng.index.isin(train_set.index)]
+
+    val_set_feng = panel_feng.loc[panel_feng.index.isin(valid_set.index)]
+
+    test_set_feng = panel_feng.loc[panel_feng.index.isin(test_set.index)]
 
     corr_stock, train_set_feng, val_set_feng, test_set_feng = keep_correlated_features(train_set= train_set_feng, val_set= val_set_feng, test_set= test_set_feng,params= config_data)
 
@@ -94,3 +263,7 @@ if __name__ == "__main__":
     util.pickle_dump(X_test, config_data["test_feng_set_path"][0])
     util.pickle_dump(y_test, config_data["test_feng_set_path"][1])
 
+if __name__ == "__main__":
+    config_data = util.load_config()
+
+    main(config_data)
@@ -0,0 +1,225 @@
+import pandas as pd
+import hashlib
+import fcntl
+import json
+import os
+
+
+class LazyModel:
+    # Estimator proxy that unpickles its artifact only when it is used for the first time
+    def __init__(self, artifact_path: str):
+        self.artifact_path = artifact_path
+        self.model_object = None
+
+    def load(self):
+        # Load the estimator once, joblib and the estimator library are imported here, not at startup
+        if self.model_object is None:
+            import joblib
+            self.model_object = joblib.load(self.artifact_path)
+        return self.model_object
+
+    def predict(self, data):
+        return self.load().predict(data)
+
+    def __getattr__(self, name):
+        # Every other attribute (feature_names_in_, fit, ...) comes from the real estimator
+        if name in ("artifact_path", "model_object") or name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+
+def data_fingerprint(*datasets) -> str:
+    # Hash values, index and column names of every dataset
+    digest = hashlib.sha256()
+    for data in datasets:
+        digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+        if isinstance(data, pd.DataFrame):
+            digest.update(json.dumps([str(column) for column in data.columns]).encode())
+        else:
+            digest.update(str(data.name).encode())
+
+    return digest.hexdigest()
+
+def unseeded(model_object) -> bool:
+    # Estimators with a random_state left to None fit differently on every run
+    return any(key.split("__")[-1] == "random_state" and value is None for key, value in model_object.get_params(deep=True).items())
+
+def model_uid(model_object, features: list, fingerprint: str) -> str:
+    # Content hash of estimator type and params, feature set and training data
+    content = {
+        "estimator": model_object.__class__.__name__,
+        "params": model_object.get_params(deep=True),
+        "features": [str(feature) for feature in features],
+        "data": fingerprint,
+    }
+
+    # Params and data do not identify an unseeded fit, so its fitted state is hashed too
+    if unseeded(model_object):
+        import joblib
+        content["state"] = joblib.hash(model_object)
+    content = json.dumps(content, sort_keys=True, default=repr)
+
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+def target_stage(ticker: str, stage: str = "production") -> str:
+    # Stage holding the model of one target ticker in multi-target mode
+    return "{}-{}".format(stage, ticker)
+
+def stage_path(root: str, stage: str) -> str:
+    # Pointer file of a stage inside a registry root
+    return os.path.join(root, "stages", stage)
+
+def read_stage(root: str, stage: str = "production") -> str:
+    # Model UID a stage points to without loading the index, None when nothing has been promoted yet
+    try:
+        with open(stage_path(root, stage), "r") as file:
+            return file.read().strip()
+    except FileNotFoundError as fe:
+        return None
+
+def write_atomic(path: str, write) -> None:
+    # Write into a temporary file, then swap it in place so readers never see a partial file
+    tmp_path = "{}.tmp{}".format(path, os.getpid())
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class ModelRegistry:
+    # Local registry storing every artifact once by content hash, with an index and stage pointers
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.stages_dir = os.path.join(root, "stages")
+        self.index_path = os.path.join(root, "index.jsonl")
+        self.legacy_index_path = os.path.join(root, "index.json")
+        self.pending = []
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.stages_dir, exist_ok=True)
+
+        # Load the index and build the lookup tables
+        self.reload()
+
+    def reload(self) -> None:
+        self.models = {}
+        self.by_name = {}
+
+        # Index written by earlier versions as a single JSON list
+        if os.path.isfile(self.legacy_index_path):
+            with open(self.legacy_index_path, "r") as file:
+                for entry in json.load(file):
+                    self.add_entry(entry)
+
+        # Append-only index, a later line of the same UID refreshes its entry and a line cut by a crash is ignored
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, "r") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.add_entry(entry)
+
+    def add_entry(self, entry: dict) -> None:
+        self.models[entry["model_uid"]] = entry
+        uids = self.by_name.setdefault(entry["model_name"], [])
+        if entry["model_uid"] not in uids:
+            uids.append(entry["model_uid"])
+
+    def save_index(self) -> None:
+        # Append the entries registered since the last save, O(1) per model instead of rewriting the index
+        if not self.pending:
+            return
+        lines = "".join(json.dumps(entry, default=str) + "\n" for entry in self.pending)
+
+        # Exclusive lock, so concurrent registrations from other processes never interleave
+        with open(self.index_path, "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                file.write(lines)
+                file.flush()
+                os.fsync(file.fileno())
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+        self.pending = []
+
+    def artifact_path(self, uid: str) -> str:
+        return os.path.join(self.objects_dir, "{}.pkl".format(uid))
+
+    def register(self, model_data: dict, model_log: dict = None, features: list = None, fingerprint: str = None, save: bool = True) -> str:
+        # Derive the UID from the content when it is not known yet
+        uid = model_data["model_uid"] or model_uid(model_data["model_object"], features or [], fingerprint or "")
+
+        # Store the artifact only once
+        artifact_path = self.artifact_path(uid)
+        if not os.path.isfile(artifact_path):
+            import joblib
+            write_atomic(artifact_path, lambda path: joblib.dump(model_data["model_object"], path))
+
+        # Add or refresh the index entry
+        entry = {
+            "model_uid": uid,
+            "model_name": model_data["model_name"],
+            "features": [str(feature) for feature in features or []],
+            "data_fingerprint": fingerprint,
+            "artifact": os.path.basename(artifact_path),
+            "model_log": model_log or {},
+        }
+        self.add_entry(entry)
+        self.pending.append(entry)
+
+        # Many models can be registered at once and the index saved only after the last one
+        if save:
+            self.save_index()
+
+        return uid
+
+    def get(self, uid: str) -> dict:
+        # O(1) lookup by UID, the estimator itself is loaded lazily
+        entry = self.models[uid]
+        return {
+            "model_data": {
+                "model_name": entry["model_name"],
+                "model_object": LazyModel(os.path.join(self.objects_dir, entry["artifact"])),
+                "model_uid": uid,
+            },
+            "model_log": dict(entry["model_log"]),
+        }
+
+    def find(self, model_name: str) -> list:
+        # Every model registered under a name, latest last
+        return [self.get(uid) for uid in self.by_name.get(model_name, [])]
+
+    def promote_many(self, stages: dict) -> None:
+        # Point every stage to its model, e.g. one production stage per target ticker
+        for stage, uid in stages.items():
+            self.promote(uid, stage)
+
+    def stage_path(self, stage: str) -> str:
+        return stage_path(self.root, stage)
+
+    def stage_uid(self, stage: str = "production") -> str:
+        # Read the pointer of a stage, None when nothing has been promoted yet
+        return read_stage(self.root, stage)
+
+    def promote(self, uid: str, stage: str = "production") -> None:
+        # Promotion is an atomic swap of the stage pointer, artifacts are never rewritten
+        if uid not in self.models:
+            raise KeyError("Model {} is not registered.".format(uid))
+
+        def write(path):
+            with open(path, "w") as file:
+                file.write(uid)
+
+        write_atomic(self.stage_path(stage), write)
+
+    def load_stage(self, stage: str = "production") -> dict:
+        # Model currently pointed by a stage, None when nothing has been promoted yet
+        uid = self.stage_uid(stage)
+        if uid is None:
+            return None
+
+        # The pointer may have been moved by another process since the index was loaded
+        if uid not in self.models:
+            self.reload()
+
+        return self.get(uid)
@@ -0,0 +1,185 @@
+from sklearn.model_selection import ParameterGrid
+from sklearn.metrics import mean_squared_error
+from sklearn.base import clone
+from contextlib import contextmanager
+import pandas as pd
+import numpy as np
+import hashlib
+import sqlite3
+import json
+import math
+import time
+import os
+
+import util as util
+import parallel as parallel
+import registry as registry
+
+
+class FoldCache:
+    # Fold level scores of every evaluated point, so a re-run or an expanded grid only fits new points
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self.connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS fold_results (
+                    key TEXT PRIMARY KEY, estimator TEXT, params TEXT, data_fingerprint TEXT,
+                    fold INTEGER, resource INTEGER, mse REAL, fit_time REAL, error TEXT
+                )""")
+
+    @contextmanager
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get_many(self, keys: list) -> dict:
+        # Cached results of the given keys, chunked under the SQLite variable limit
+        results = dict()
+        with self.connect() as connection:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = connection.execute(
+                    "SELECT key, mse, fit_time, error FROM fold_results WHERE key IN ({})".format(", ".join("?" * len(chunk))), chunk
+                ).fetchall()
+                results.update({key: {"mse": mse, "fit_time": fit_time, "error": error} for key, mse, fit_time, error in rows})
+
+        return results
+
+    def put_many(self, rows: list) -> None:
+        with self.connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO fold_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(row["key"], row["estimator"], row["params"], row["data_fingerprint"], row["fold"],
+                  row["resource"], row["mse"], row["fit_time"], row["error"]) for row in rows],
+            )
+
+
+def time_series_folds(n_samples: int, n_splits: int) -> list:
+    # Expanding window folds, every test block comes after its train rows
+    test_size = n_samples // (n_splits + 1)
+    return [(0, n_samples - (n_splits - fold) * test_size, n_samples - (n_splits - fold) * test_size,
+             n_samples - (n_splits - fold - 1) * test_size) for fold in range(n_splits)]
+
+def resource_schedule(n_samples: int, min_resources: int, factor: int) -> list:
+    # Latest train rows per fold at every rung, independent of the grid so cached rungs are reused
+    resources = []
+    resource = min_resources
+    while resource < n_samples:
+        resources.append(resource)
+        resource *= factor
+
+    # Last rung always fits the full train window
+    return resources + [n_samples]
+
+def fold_key(estimator: str, params: str, fingerprint: str, n_splits: int, fold: int, resource: int) -> str:
+    content = json.dumps([estimator, params, fingerprint, n_splits, fold, resource])
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+def evaluate_task(task: dict) -> dict:
+    # Fit a candidate on the latest `resource` train rows of a fold and score its test block
+    arrays = parallel.shared_arrays()
+    train_start, train_end, test_start, test_end = task["fold_range"]
+    train_start = max(train_start, train_end - task["resource"])
+    x_train = pd.DataFrame(arrays["x"][train_start:train_end], columns=task["features"])
+    x_test = pd.DataFrame(arrays["x"][test_start:test_end], columns=task["features"])
+
+    # Invalid combinations of the grid score as infinitely bad, like error_score of GridSearchCV
+    fit_time = time.perf_counter()
+    try:
+        model_object = clone(task["model_object"]).set_params(**task["params"])
+        model_object.fit(x_train, arrays["y"][train_start:train_end])
+        mse, error = float(mean_squared_error(arrays["y"][test_start:test_end], model_object.predict(x_test))), None
+    except Exception as e:
+        mse, error = math.inf, "{}: {}".format(e.__class__.__name__, e)
+
+    return {"mse": mse, "fit_time": time.perf_counter() - fit_time, "error": error}
+
+def successive_halving(model_object, grid_params: dict, x_train: pd.DataFrame, y_train: pd.Series, params: dict) -> dict:
+    # Every candidate of the grid and the rungs they compete on
+    candidates = list(ParameterGrid(grid_params))
+    n_splits = params.get("search_n_splits", 3)
+    factor = params.get("search_factor", 3)
+    folds = time_series_folds(len(x_train), n_splits)
+    resources = resource_schedule(folds[-1][1], params.get("search_min_resources", 60), factor)
+
+    # Budget of new fits and of wall clock time, cached folds are free
+    max_fits = params.get("search_max_fits")
+    max_seconds = params.get("search_max_seconds")
+    start_time = time.perf_counter()
+    fits = 0
+
+    # Fold cache and the data identity every cached score depends on
+    cache = FoldCache(params["search_cache_path"])
+    fingerprint = registry.data_fingerprint(x_train, y_train)
+    estimator = model_object.__class__.__name__
+    arrays = {"x": x_train.to_numpy(dtype="float64"), "y": y_train.to_numpy(dtype="float64")}
+    features = list(x_train.columns)
+
+    # A grid too large for the fit budget is sampled, the first rung then takes about half of the budget
+    if max_fits is not None and len(candidates) * n_splits > max_fits // 2:
+        sample = np.random.default_rng(params.get("search_seed", 0)).choice(len(candidates), max(1, max_fits // (2 * n_splits)), replace=False)
+        candidates = [candidates[candidate] for candidate in sorted(sample)]
+
+    # Debug message
+    util.print_debug("Searching {} candidates of {} on {} rungs of {} folds.".format(len(candidates), estimator, len(resources), n_splits))
+
+    history = []
+    scores = None
+    for rung, resource in enumerate(resources):
+        # Fold keys of every surviving candidate at this rung
+        keys = {}
+        for candidate, candidate_params in enumerate(candidates):
+            params_json = json.dumps(candidate_params, sort_keys=True, default=repr)
+            for fold in range(n_splits):
+                keys[(candidate, fold)] = fold_key(estimator, params_json, fingerprint, n_splits, fold, resource)
+        cached = cache.get_many(list(keys.values()))
+        pending = [(candidate, fold) for (candidate, fold), key in keys.items() if key not in cached]
+
+        # Stop at the last complete rung once the budget is spent
+        out_of_time = max_seconds is not None and time.perf_counter() - start_time > max_seconds
+        out_of_fits = max_fits is not None and fits + len(pending) > max_fits
+        if scores is not None and (out_of_time or out_of_fits):
+            util.print_debug("Search budget spent, keeping the best candidate of rung {}.".format(rung - 1))
+            break
+
+        # Fit the pending folds on the process pool, the train set is shared once
+        tasks = [{"model_object": model_object, "params": candidates[candidate], "features": features,
+                  "fold_range": folds[fold], "resource": resource} for candidate, fold in pending]
+        for task, (candidate, fold) in zip(tasks, pending):
+            task.update({"candidate": candidate, "fold": fold})
+
+        # Store every fold score as soon as it completes, so an interrupted search resumes where it stopped
+        def store_result(task, result):
+            key = keys[(task["candidate"], task["fold"])]
+            cached[key] = result
+            cache.put_many([dict(result, key=key, estimator=estimator, fold=task["fold"], resource=resource, data_fingerprint=fingerprint,
+                                 params=json.dumps(task["params"], sort_keys=True, default=repr))])
+
+        parallel.run_tasks(evaluate_task, tasks, params.get("search_workers", 1), arrays, store_result)
+        fits += len(tasks)
+
+        # Score of a candidate is its mean mse over the folds
+        scores = [float(np.mean([cached[keys[(candidate, fold)]]["mse"] for fold in range(n_splits)])) for candidate in range(len(candidates))]
+        history.append({"rung": rung, "resource": resource, "candidates": len(candidates), "fits": len(tasks), "cache_hits": len(keys) - len(tasks)})
+
+        # Debug message
+        util.print_debug("Rung {}: {} candidates on {} rows, {} fits, {} cached.".format(rung, len(candidates), resource, len(tasks), len(keys) - len(tasks)))
+
+        # Keep the best 1/factor candidates for the next rung
+        if rung < len(resources) - 1:
+            order = np.argsort(scores, kind="stable")[:max(1, math.ceil(len(candidates) / factor))]
+            candidates = [candidates[candidate] for candidate in order]
+            scores = [scores[candidate] for candidate in order]
+
+    # Best candidate of the last evaluated rung
+    best = int(np.argmin(scores))
+
+    return {"best_params": candidates[best], "best_score": scores[best], "fits": fits, "history": history}
@@ -2,6 +2,7 @@ import streamlit as st
 import altair as alt
 
 import util as util
+import dashboard_data as dashboard_data
 import pandas as pd
 import numpy as np
 
@@ -10,30 +11,19 @@ params = util.load_config()
 with open('src/style.css') as f:
     st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
 
-actual_price = pd.DataFrame(util.pickle_load(params["raw_dataset_path"])[params['target_stock']])
-predict_price = pd.DataFrame(util.pickle_load(params["predict_dataset_path"]))
+# Precomputed dashboard data, served from the process cache on every rerun
+snapshot = dashboard_data.get_snapshot(params)
+metrics = snapshot["metrics"]
 
-actual_price['symbol'] = params["target_stock"] + ' Actual'
-predict_price['symbol'] = params["target_stock"] + ' Prediction'
-predict_price.rename(columns={predict_price.columns[0]: 'price'}, inplace=True)
-actual_price.rename(columns={actual_price.columns[0]: 'price'}, inplace=True)
+latest_price = metrics["latest_price"]
+change = metrics["change"]
 
-stock_price = pd.concat([actual_price, predict_price], axis=0)
-stock_price.index.name = 'date'
-stock_price.reset_index(inplace=True)
+latest_pred = metrics["latest_pred"]
+change_pred = metrics["change_pred"]
 
+change_var = metrics["change_var"]
+price_var = metrics["price_var"]
 
-
-latest_price = stock_price[stock_price['symbol'] == params["target_stock"] + ' Actual'].sort_values(by='date', ascending=False).iloc[0]['price']
-latest_price_lag = stock_price[stock_price['symbol'] == params["target_stock"] + ' Actual'].sort_values(by='date', ascending=False).iloc[1]['price']
-change = (latest_price-latest_price_lag)/latest_price_lag
-
-latest_pred = stock_price[stock_price['symbol'] == params["target_stock"] + ' Prediction'].sort_values(by='date', ascending=False).iloc[0]['price']
-#latest_pred_lag = stock_price[stock_price['symbol'] == params["target_stock"] + ' Prediction'].sort_values(by='date', ascending=False).iloc[1]['price']
-change_pred = (latest_pred-latest_price_lag)/latest_price_lag
-
-change_var = change_pred-change
-price_var = latest_pred-latest_price
 # first row
 a1, a2, a3 = st.columns(3)
 with a1:
@@ -49,6 +39,16 @@ with a3:
 # second row
 
 st.subheader("Stock Price and Forecast")
+
+# Zoom level chooses the resolution, the visible range is downsampled per symbol to the chart width
+price_history = snapshot["price_history"]
+first_date, last_date = price_history["date"].min().to_pydatetime(), price_history["date"].max().to_pydatetime()
+zoom_start, zoom_end = st.slider("Date range", min_value=first_date, max_value=last_date, value=(first_date, last_date), format="YYYY-MM-DD")
+if (zoom_start, zoom_end) == (first_date, last_date):
+    stock_price = snapshot["stock_price"]
+else:
+    stock_price = dashboard_data.chart_data(price_history, params, zoom_start, zoom_end)
+
 base = alt.Chart(stock_price).encode(
 ).properties(
     width=600,
@@ -109,29 +109,14 @@ chart1
 
 
 
-indices = util.pickle_load(params["clean_dataset_path"])
-
+# Last 5 dates in long format, reshaped once when the snapshot is built
+daily_data = snapshot["daily"]["data"].groupby("date")
 
-
-# Get the last 10 dates
-last_5_dates = indices.tail(5).index[::-1]
-
-
-for date in last_5_dates:
+for date, symmetric_range in snapshot["daily"]["symmetric_range"].items():
     st.write(f"Date: {date.strftime('%Y-%m-%d')}")  # Display the date as a subheader
 
-    # Extract the data for the current date
-    date_data = indices.loc[date].to_frame().T
-
-    # Transform the DataFrame into a long format
-    long_format_data = date_data.melt(var_name='index_name', value_name='price')
-
-    # Get the minimum and maximum values of the 'price' column
-    min_value = long_format_data['price'].min()
-    max_value = long_format_data['price'].max()
-
-    # Calculate the symmetric range around zero
-    symmetric_range = max(abs(min_value), abs(max_value))
+    # Long format data of the current date
+    long_format_data = daily_data.get_group(date)[["index_name", "price"]]
 
 
 # Create the Altair bar chart using the transformed DataFrame
@@ -0,0 +1,152 @@
+import hashlib
+import shutil
+import json
+import time
+import os
+
+import store as store
+
+
+def artifact_path(file_path: str) -> str:
+    # Artifact actually read for a path, either its columnar store or the file itself
+    if store.use_store(file_path):
+        return store.store_path(file_path)
+
+    return file_path
+
+def hash_path(path: str) -> str:
+    # Content hash of a file, or of every file in a directory with its relative path
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        for root, dirs, files in sorted(os.walk(path)):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode())
+                digest.update(hash_path(file_path).encode())
+    elif os.path.isfile(path):
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+    else:
+        return "missing"
+
+    return digest.hexdigest()
+
+def path_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+def copy_path(source: str, destination: str) -> None:
+    # Replace destination with a copy of the source file or directory
+    if os.path.isdir(destination):
+        shutil.rmtree(destination)
+    if os.path.dirname(destination):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+    if os.path.isdir(source):
+        shutil.copytree(source, destination)
+    else:
+        shutil.copy2(source, destination)
+
+
+class StageCache:
+    # Outputs of pipeline stages keyed by the hash of their inputs, config and code, evicted by total size and age
+    def __init__(self, directory: str, max_bytes: int = None, max_age_days: float = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400 if max_age_days is not None else None
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, stage: str, inputs: list, config: dict, code: list, extra: str = None) -> str:
+        # Hash of every input artifact, the stage's config values and the source of its modules
+        content = {
+            "stage": stage,
+            "inputs": {path: hash_path(artifact_path(path)) for path in inputs},
+            "config": config,
+            "code": {os.path.basename(path): hash_path(path) for path in code},
+            "extra": extra,
+        }
+        content = json.dumps(content, sort_keys=True, default=str)
+
+        return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def read_meta(self, key: str) -> dict:
+        try:
+            with open(os.path.join(self.entry_dir(key), "meta.json"), "r") as file:
+                return json.load(file)
+        except FileNotFoundError as fe:
+            return None
+
+    def write_meta(self, key: str, meta: dict) -> None:
+        with open(os.path.join(self.entry_dir(key), "meta.json"), "w") as file:
+            json.dump(meta, file)
+
+    def restore(self, key: str) -> dict:
+        # Outputs already on disk are left untouched, only changed or missing ones are copied back
+        meta = self.read_meta(key)
+        if meta is None:
+            return None
+
+        for path, output in meta["outputs"].items():
+            if hash_path(artifact_path(path)) != output["hash"]:
+                copy_path(os.path.join(self.entry_dir(key), output["entry"]), os.path.join(os.path.dirname(path), output["name"]))
+
+        # Keep recently used entries longer
+        meta["last_used"] = time.time()
+        self.write_meta(key, meta)
+
+        return meta
+
+    def save(self, key: str, stage: str, outputs: list, duration: float) -> None:
+        # Copy every output into a temporary entry first, so a crashed save is never a hit
+        tmp_dir = self.entry_dir(key) + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        meta = {"stage": stage, "duration": duration, "created": time.time(), "last_used": time.time(), "outputs": {}}
+        for position, path in enumerate(outputs):
+            source = artifact_path(path)
+            if not os.path.exists(source):
+                continue
+            copy_path(source, os.path.join(tmp_dir, str(position)))
+            meta["outputs"][path] = {"entry": str(position), "name": os.path.basename(source), "hash": hash_path(source), "size": path_size(source)}
+
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as file:
+            json.dump(meta, file)
+        shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+        os.rename(tmp_dir, self.entry_dir(key))
+
+        self.evict()
+
+    def entries(self) -> list:
+        # Metadata of every complete entry
+        entries = []
+        for key in os.listdir(self.directory):
+            meta = self.read_meta(key) if not key.endswith(".tmp") else None
+            if meta is not None:
+                entries.append((key, meta))
+
+        return entries
+
+    def evict(self) -> list:
+        # Drop entries unused for longer than max age, then the least recently used ones above max size
+        entries = sorted(self.entries(), key=lambda entry: entry[1]["last_used"])
+        now = time.time()
+        evicted = []
+
+        total = sum(output["size"] for _, meta in entries for output in meta["outputs"].values())
+        for key, meta in entries:
+            too_old = self.max_age is not None and now - meta["last_used"] > self.max_age
+            too_big = self.max_bytes is not None and total > self.max_bytes
+            if not (too_old or too_big):
+                continue
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            total -= sum(output["size"] for output in meta["outputs"].values())
+            evicted.append(key)
+
+        return evicted
@@ -0,0 +1,156 @@
+import pandas as pd
+import shutil
+import json
+import glob
+import os
+
+DATE_COLUMN = "__date__"
+VALUE_COLUMN = "__value__"
+META_FILE = "_meta.json"
+
+
+def store_path(file_path: str) -> str:
+    # The columnar store lives next to the pickle path, as a directory of yearly partitions
+    return os.path.splitext(file_path)[0] + ".arrow"
+
+def exists(file_path: str) -> bool:
+    # Check whether a columnar store has been written for this path
+    return os.path.isfile(os.path.join(store_path(file_path), META_FILE))
+
+def use_store(file_path: str) -> bool:
+    # Read the columnar store unless a pickle written later sits at the same path
+    if not exists(file_path):
+        return False
+    if not os.path.isfile(file_path):
+        return True
+
+    return os.path.getmtime(os.path.join(store_path(file_path), META_FILE)) >= os.path.getmtime(file_path)
+
+def remove_store(file_path: str) -> None:
+    shutil.rmtree(store_path(file_path), ignore_errors=True)
+
+def is_frame(data) -> bool:
+    # Only date indexed frames and series are stored in columnar format
+    return isinstance(data, (pd.DataFrame, pd.Series)) and isinstance(data.index, pd.DatetimeIndex)
+
+def dump_frame(data, file_path: str) -> None:
+    # pyarrow is only imported once a store is actually written or read
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    # Convert series into single column frame, remembering how to restore it
+    if isinstance(data, pd.Series):
+        meta = {"kind": "series", "name": data.name}
+        frame = data.to_frame(VALUE_COLUMN)
+    else:
+        meta = {"kind": "frame", "name": None}
+        frame = data
+
+    # Arrow requires string column names
+    columns = [str(column) for column in frame.columns]
+    meta.update({"columns": columns, "index_name": frame.index.name, "years": []})
+
+    # Write into a temporary directory first, so readers never see a half written store
+    path = store_path(file_path)
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    # Write one uncompressed Arrow IPC file per year, so it can be memory mapped on read
+    frame = frame.set_axis(columns, axis=1)
+    for year, partition in frame.groupby(frame.index.year):
+        table = pa.Table.from_pandas(partition.rename_axis(DATE_COLUMN).reset_index(), preserve_index=False)
+        with ipc.new_file(os.path.join(tmp_path, "year={}.arrow".format(year)), table.schema) as writer:
+            writer.write_table(table)
+        meta["years"].append(int(year))
+
+    with open(os.path.join(tmp_path, META_FILE), "w") as file:
+        json.dump(meta, file)
+
+    # Swap the new store in place of the old one
+    old_path = path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.isdir(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def load_frame(file_path: str, columns: list = None, start=None, end=None):
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    # Load store metadata
+    path = store_path(file_path)
+    with open(os.path.join(path, META_FILE), "r") as file:
+        meta = json.load(file)
+
+    # Define which columns and yearly partitions are needed
+    if meta["kind"] == "series" or columns is None:
+        columns = meta["columns"]
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    years = [year for year in meta["years"]
+             if (start is None or year >= start.year) and (end is None or year <= end.year)]
+
+    # Memory map every needed partition and read the selected columns only
+    partitions = []
+    for year in years:
+        with pa.memory_map(os.path.join(path, "year={}.arrow".format(year)), "r") as source:
+            table = ipc.open_file(source).read_all().select([DATE_COLUMN] + list(columns))
+            partitions.append(table.to_pandas())
+
+    # Restore the date index, an empty selection keeps the schema
+    if partitions:
+        frame = pd.concat(partitions, ignore_index=True).set_index(DATE_COLUMN)
+    else:
+        frame = pd.DataFrame(columns=[DATE_COLUMN] + list(columns)).set_index(DATE_COLUMN)
+        frame.index = pd.DatetimeIndex(frame.index)
+    frame.index.name = meta["index_name"]
+
+    # Slice the requested date range within the partitions
+    frame = frame.loc[start:end]
+
+    # Restore series
+    if meta["kind"] == "series":
+        return frame[VALUE_COLUMN].rename(meta["name"])
+
+    return frame
+
+def select_frame(data, columns: list = None, start=None, end=None):
+    # Apply the same column and date selection on an in-memory frame
+    if columns is not None and isinstance(data, pd.DataFrame):
+        data = data[columns]
+    if start is not None or end is not None:
+        data = data.loc[start:end]
+
+    return data
+
+def migrate_pickles(directory: str, remove: bool = False) -> list:
+    # Variabel to store migrated files
+    migrated = []
+
+    import joblib
+
+    # Convert every date indexed pickle into the columnar store
+    for file_path in sorted(glob.glob(os.path.join(directory, "*.pkl"))):
+        data = joblib.load(file_path)
+        if not is_frame(data):
+            continue
+
+        dump_frame(data, file_path)
+        migrated.append(file_path)
+
+        # Remove the pickle once its store is written
+        if remove:
+            os.remove(file_path)
+
+    return migrated
+
+if __name__ == "__main__":
+    import util as util
+
+    config_data = util.load_config()
+
+    # One-shot migration of every processed pickle
+    for file_path in migrate_pickles(os.path.dirname(config_data["raw_dataset_path"])):
+        print("Migrated", file_path, "->", store_path(file_path))
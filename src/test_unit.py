@@ -1,8 +1,43 @@
 import preprocessing
+import data_pipeline
+import downloader
+import store
+import os
+import modelling
+import registry
+import log_store
+import api
+import batcher
+import model_cache
+import backtest
+import online_linear
+import multi_target
+import search
+import pipeline
+import stage_cache
+import dashboard_data
+import downsample
+import instrument
+import benchmark
+import panel
+import asyncio
+import time
+from fastapi.testclient import TestClient
+import pytest
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.ensemble import RandomForestRegressor
 import util as utils
 import pandas as pd
 import numpy as np
 
+@pytest.fixture(autouse=True)
+def tmp_trace(tmp_path, monkeypatch):
+    # Spans of every test are traced to a temporary file, never to the repository log
+    monkeypatch.setattr(instrument, "_settings", dict(instrument.settings(), trace_path=str(tmp_path / "trace.jsonl")))
+    instrument.close_trace()
+    yield
+    instrument.close_trace()
+
 def test_transform_data():
     #arrange
     config = utils.load_config()
@@ -20,6 +55,692 @@ def test_transform_data():
 
     #act
     processed_data = preprocessing.transform_to_stock_return(dataset=mock_data, params=config)
+    streamed_data = preprocessing.StreamingReturnTransformer(config).transform(mock_data)
+    chunked_transformer = preprocessing.StreamingReturnTransformer(config)
+    chunked_data = pd.concat([chunked_transformer.update(mock_data.iloc[:3]), chunked_transformer.update(mock_data.iloc[3:])])
 
     #assert
     assert processed_data.shape == (1,5)
+    pd.testing.assert_frame_equal(streamed_data, processed_data, check_exact=True, check_freq=False)
+    pd.testing.assert_frame_equal(chunked_data, processed_data, check_exact=True, check_freq=False)
+
+def mock_ohlcv(close, start="2023-04-12"):
+    index = pd.date_range(start=start, periods=len(close), freq="D")
+    close = np.array(close, dtype=float)
+
+    return pd.DataFrame({
+        "Open": close, "High": close, "Low": close, "Close": close, "Adj Close": close, "Volume": 100.0
+    }, index=index)
+
+def test_top_k_correlation_matches_corrwith():
+    #arrange
+    rng = np.random.default_rng(0)
+    dataset = pd.DataFrame(rng.normal(size=(120, 30)), columns=["T{:02d}.JK".format(i) for i in range(30)])
+    dataset["BMRI.JK Return D+2"] = dataset["T03.JK"] - 2 * dataset["T07.JK"] + rng.normal(size=120)
+    dataset.iloc[rng.integers(0, 120, 60), rng.integers(0, 30, 60)] = np.nan
+
+    #act
+    correlation = preprocessing.correlation_with_target(dataset, "BMRI.JK Return D+2", chunk_size=7)
+    top = preprocessing.top_k_correlated(correlation, 5)
+    top_absolute = preprocessing.top_k_correlated(correlation, 3, absolute=True)
+    rolling = preprocessing.rolling_correlation_with_target(dataset, "BMRI.JK Return D+2", 40, chunk_size=7)
+
+    #assert
+    expected = dataset.corrwith(dataset["BMRI.JK Return D+2"])
+    np.testing.assert_allclose(correlation, expected, rtol=1e-12)
+    assert list(top.index) == list(expected.nlargest(5).sort_values(ascending=True).index)
+    assert list(top_absolute.index) == ["T03.JK", "T07.JK", "BMRI.JK Return D+2"]
+    pd.testing.assert_frame_equal(rolling, dataset.rolling(40).corr(dataset["BMRI.JK Return D+2"]), check_exact=False, atol=1e-12)
+
+def test_keep_correlated_features_with_nan_and_inf_correlations():
+    #arrange
+    config = utils.load_config()
+    config["feature_top_k"] = 4
+    rng = np.random.default_rng(0)
+    train_set = pd.DataFrame(rng.normal(size=(50, 5)), columns=["A.JK", "B.JK", "C.JK", "D.JK", "E.JK"])
+    train_set["BMRI.JK Return D+2"] = train_set["B.JK"] + rng.normal(size=50) * 0.1
+    train_set.loc[3, ["C.JK", "D.JK"]] = np.inf
+    broken = train_set.assign(**{"BMRI.JK Return D+2": np.inf})
+
+    #act
+    corr_stock, train, _, _ = preprocessing.keep_correlated_features(train_set, train_set, train_set, config)
+    corr_broken, train_broken, _, _ = preprocessing.keep_correlated_features(broken, broken, broken, config)
+
+    #assert
+    assert list(corr_stock.index)[-2:] == ["B.JK", "BMRI.JK Return D+2"] and len(corr_stock) == 4
+    assert "C.JK" not in corr_stock.index and "D.JK" not in corr_stock.index
+    assert list(train_broken.columns) == ["A.JK", "B.JK", "C.JK", "BMRI.JK Return D+2"] and corr_broken.isna().all()
+    with pytest.raises(ValueError):
+        preprocessing.keep_correlated_features(train_set[["BMRI.JK Return D+2"]], train_set, train_set, config)
+
+def test_compact_panel_validation_and_returns():
+    #arrange
+    config = utils.load_config()
+    config.update({"compact_panels": True, "panel_dtype": "float32"})
+    index = pd.date_range(start="2023-04-12", periods=6, freq="D")
+    prices = pd.DataFrame({"BMRI.JK": [100.0, 102.0, 101.0, 105.0, 104.0, 108.0], "BBB.JK": [50.0, -1.0, 52.0, 53.0, np.nan, 55.0]}, index=index)
+    prices["CCC.JK"] = np.arange(6.0) + 10
+
+    #act
+    compact = panel.compact_frame(prices, panel.panel_dtype(config))
+    report = data_pipeline.validate_data(compact.assign(DDD=np.arange(6.0)), config)
+    returns = preprocessing.transform_to_stock_return(compact, config)
+    y = pd.Series(np.ones(6), index=pd.DatetimeIndex(list(index)))
+    x, y = panel.share_index(compact, y)
+
+    #assert
+    assert compact._mgr.nblocks == 1 and (compact.dtypes == "float32").all()
+    assert panel.memory_usage(compact) < panel.memory_usage(prices) and x.index is y.index
+    assert report[["ticker", "violation"]].values.tolist() == [["DDD", "non_float"], ["BBB.JK", "missing"], ["BBB.JK", "negative"]]
+    assert (returns.dtypes == "float32").all()
+    np.testing.assert_allclose(returns.to_numpy(), preprocessing.transform_to_stock_return(prices, config).to_numpy(), rtol=1e-5)
+
+def test_download_tickers_batches_and_retries():
+    #arrange
+    config = utils.load_config()
+    config.update({"download_batch_size": 2, "download_workers": 2, "download_backoff": 0, "download_rate_limit": 0})
+
+    frames = {ticker: mock_ohlcv([1.0, 2.0, 3.0]) for ticker in ["AAA.JK", "BBB.JK", "CCC.JK"]}
+    source = downloader.RecordedPriceSource(frames, fail_times={"BBB.JK": 1})
+
+    #act
+    stock_data, report = downloader.download_tickers(["AAA.JK", "BBB.JK", "CCC.JK", "DDD.JK"], "2023-04-12", "2023-04-20", config, source)
+    dataset = data_pipeline.to_adj_close(stock_data)
+
+    #assert
+    assert list(stock_data) == ["AAA.JK", "BBB.JK", "CCC.JK"]
+    assert report["batches"] == 2
+    assert report["failed"] == ["DDD.JK"]
+    assert report["retries"] == 1 + config["download_max_retries"]
+    assert dataset.shape == (3, 3)
+
+def test_yfinance_fetcher_concurrent_batches(monkeypatch):
+    #arrange
+    config = utils.load_config()
+    config.update({"download_batch_size": 2, "download_workers": 4, "download_backoff": 0, "download_rate_limit": 0, "download_max_retries": 0})
+    tickers = ["T{}.JK".format(i) for i in range(12)]
+    shared = {"dfs": {}}
+    calls = []
+
+    def fake_download(tickers, threads=False, **kwargs):
+        # Same pattern as yfinance, results are reset and read back from module globals
+        calls.append(threads)
+        shared["dfs"] = {}
+        for ticker in tickers:
+            shared["dfs"][ticker] = mock_ohlcv([1.0, 2.0])
+            time.sleep(0.005)
+        return pd.concat({ticker: shared["dfs"][ticker] for ticker in tickers}, axis=1)
+
+    monkeypatch.setattr(downloader.yf, "download", fake_download)
+
+    #act
+    stock_data, report = downloader.download_tickers(tickers, "2023-04-12", "2023-04-14", config)
+
+    #assert
+    assert list(stock_data) == tickers
+    assert report["failed"] == [] and report["retries"] == 0
+    assert len(calls) == 6 and all(calls)
+
+def test_update_raw_data_fetches_tail_only(tmp_path):
+    #arrange
+    config = utils.load_config()
+    config.update({"raw_dataset_path": str(tmp_path / "raw_dataset.pkl"), "start_date": "2023-04-01", "download_batch_size": 1,
+                   "incremental_overlap_days": 1, "download_backoff": 0, "download_rate_limit": 0})
+
+    stored = pd.DataFrame({"AAA.JK": [1.0, 2.0, 3.0], "ZZZ.JK": [5.0, 5.0, np.nan], "OLD.JK": [6.0, np.nan, np.nan]},
+                          index=pd.date_range(start="2023-04-12", periods=3, freq="D"))
+    utils.pickle_dump(stored, config["raw_dataset_path"])
+
+    frames = {"AAA.JK": mock_ohlcv([1.0, 2.0, 3.5, 4.0, 5.0]), "NEW.JK": mock_ohlcv([7.0, 8.0], start="2023-04-15")}
+    source = downloader.RecordedPriceSource(frames)
+
+    #act
+    dataset = data_pipeline.update_raw_data(config, source, ticker_list=["AAA.JK", "NEW.JK", "OLD.JK"])
+
+    #assert
+    starts = {call[0][0]: call[1] for call in source.calls}
+    assert len(source.calls) == 3
+    assert starts == {"NEW.JK": pd.Timestamp("2023-04-01").date(), "AAA.JK": pd.Timestamp("2023-04-13").date(), "OLD.JK": pd.Timestamp("2023-04-11").date()}
+    assert list(dataset.columns) == ["AAA.JK", "ZZZ.JK", "OLD.JK", "NEW.JK"]
+    assert dataset["OLD.JK"].iloc[0] == 6.0
+    assert dataset["AAA.JK"].tolist() == [1.0, 2.0, 3.5, 4.0, 5.0]
+    assert dataset["ZZZ.JK"].iloc[:2].tolist() == [5.0, 5.0]
+    assert dataset["NEW.JK"].dropna().tolist() == [7.0, 8.0]
+
+def test_store_selective_read(tmp_path):
+    #arrange
+    file_path = str(tmp_path / "raw_dataset.pkl")
+    index = pd.date_range(start="2022-12-28", periods=6, freq="D")
+    dataset = pd.DataFrame({"AAA.JK": np.arange(6.0), "BBB.JK": np.arange(6.0) * 2}, index=index)
+
+    #act
+    store.dump_frame(dataset, file_path)
+    store.dump_frame(dataset["BBB.JK"], str(tmp_path / "y_train.pkl"))
+    selected = utils.pickle_load(file_path, columns=["BBB.JK"], start="2023-01-01")
+    series = utils.pickle_load(str(tmp_path / "y_train.pkl"))
+
+    #assert
+    assert sorted(os.listdir(store.store_path(file_path))) == ["_meta.json", "year=2022.arrow", "year=2023.arrow"]
+    pd.testing.assert_frame_equal(selected, dataset.loc["2023-01-01":, ["BBB.JK"]], check_freq=False)
+    pd.testing.assert_series_equal(series, dataset["BBB.JK"], check_freq=False)
+
+def test_pickle_load_reads_latest_format(tmp_path, monkeypatch):
+    #arrange
+    file_path = str(tmp_path / "clean_dataset.pkl")
+    index = pd.date_range(start="2023-01-02", periods=4, freq="D")
+    old, new, newest = [pd.DataFrame({"AAA.JK": np.arange(4.0) + offset}, index=index) for offset in (0, 10, 20)]
+
+    #act
+    monkeypatch.setattr(utils, "STORAGE_FORMAT", "arrow")
+    utils.pickle_dump(old, file_path)
+    monkeypatch.setattr(utils, "STORAGE_FORMAT", "pickle")
+    utils.pickle_dump(new, file_path)
+    switched = utils.pickle_load(file_path)
+    store.dump_frame(old, file_path)
+    os.utime(os.path.join(store.store_path(file_path), store.META_FILE), (0, 0))
+    stale_store = utils.pickle_load(file_path)
+    monkeypatch.setattr(utils, "STORAGE_FORMAT", "arrow")
+    utils.pickle_dump(newest, file_path)
+
+    #assert
+    pd.testing.assert_frame_equal(switched, new)
+    pd.testing.assert_frame_equal(stale_store, new)
+    assert not os.path.exists(file_path) and store.exists(file_path)
+    pd.testing.assert_frame_equal(utils.pickle_load(file_path), newest, check_freq=False)
+
+def test_validate_data_report():
+    #arrange
+    config = utils.load_config()
+    index = pd.date_range(start="2023-04-12", periods=4, freq="D")
+    dataset = pd.DataFrame({
+        "AAA.JK": [1.0, -2.0, 3.0, -4.0],
+        "BBB.JK": [1.0, 2.0, 3.0, 4.0],
+        "CCC.JK": [1.0, 2.0, np.nan, 4.0],
+        "DDD.JK": [1, 2, 3, 4],
+    }, index=index)
+
+    #act
+    report = data_pipeline.validate_data(dataset, config, chunk_size=2)
+    error_stock_tickers = data_pipeline.check_data(dataset, config, print_errors=False, chunk_size=2)
+
+    #assert
+    assert report.values.tolist() == [
+        ["DDD.JK", "non_float", pd.NaT, 4],
+        ["AAA.JK", "negative", index[1], 2],
+        ["CCC.JK", "missing", index[2], 1],
+    ]
+    assert error_stock_tickers == ["AAA.JK", "CCC.JK", "DDD.JK"]
+
+def test_train_eval_parallel_matches_serial(tmp_path):
+    #arrange
+    config = utils.load_config()
+    config.update({"training_log_path": str(tmp_path / "training_log.db"), "run_manifest_enabled": False})
+    list_of_model = [{"model_name": "LinearRegression", "model_object": LinearRegression(), "model_uid": ""}]
+
+    #act
+    config["training_workers"] = 1
+    serial_models, serial_log = modelling.train_eval("Test", config, list_of_model)
+    config["training_workers"] = 2
+    parallel_models, parallel_log = modelling.train_eval("Test", config, list_of_model)
+
+    #assert
+    assert list(serial_models) == list(parallel_models)
+    np.testing.assert_allclose(serial_log["mse"], parallel_log["mse"])
+
+def test_walk_forward_splits_leave_horizon_gap():
+    #arrange
+    n_samples, min_train_size, refit_every, gap = 30, 10, 5, 2
+
+    #act
+    expanding = backtest.walk_forward_splits(n_samples, min_train_size, refit_every, "expanding", gap=gap)
+    sliding = backtest.walk_forward_splits(n_samples, min_train_size, refit_every, "sliding", train_size=8, gap=gap)
+
+    #assert
+    assert expanding[0] == (0, 10, 12, 17)
+    assert expanding[-1][3] == n_samples
+    assert all(test_start - train_end == gap for _, train_end, test_start, _ in expanding + sliding)
+    assert all(train_end - train_start == 8 for train_start, train_end, _, _ in sliding)
+    assert [split[2:] for split in expanding] == [split[2:] for split in sliding]
+
+def test_run_backtest_fold_metrics():
+    #arrange
+    config = utils.load_config()
+    config.update({"backtest_min_train_size": 20, "backtest_refit_every": 10, "backtest_window": "expanding", "backtest_horizon": 2})
+    index = pd.date_range(start="2023-01-02", periods=60, freq="B")
+    x = pd.DataFrame({"AAA.JK": np.random.default_rng(0).normal(size=60)}, index=index)
+    y = pd.Series(2 * x["AAA.JK"].to_numpy(), index=index)
+
+    #act
+    folds = backtest.run_backtest(LinearRegression(), x, y, config, workers=2)
+    metrics = backtest.aggregate_folds(folds)
+
+    #assert
+    assert folds["fold"].tolist() == [0, 1, 2, 3]
+    assert folds["test_start_date"].iloc[0] == index[22]
+    assert metrics["backtest_mse"] == pytest.approx(0.0, abs=1e-12)
+    assert metrics["backtest_directional_accuracy"] == 1.0
+    assert metrics["backtest_folds"] == 4
+
+def test_online_linear_matches_full_refit():
+    #arrange
+    rng = np.random.default_rng(0)
+    x = pd.DataFrame(rng.normal(size=(200, 3)), columns=["AAA.JK", "BBB.JK", "CCC.JK"])
+    y = pd.Series(x.to_numpy() @ [1.5, -2.0, 0.5] + 3.0 + rng.normal(scale=0.1, size=200))
+    online_lnr = online_linear.OnlineLinearRegression().fit(x[:150], y[:150])
+    online_rdg = online_linear.from_estimator(Ridge(alpha=10.0), window=100).fit(x[:150], y[:150])
+
+    #act
+    for row in range(150, 200):
+        online_lnr.partial_fit(x[row:row + 1], y[row:row + 1])
+        online_rdg.partial_fit(x[row:row + 1], y[row:row + 1])
+    full_lnr = LinearRegression().fit(x, y)
+    online_lnr_coef = online_lnr.coef_.copy()
+    full_rdg = Ridge(alpha=10.0).fit(x[100:], y[100:])
+    online_lnr.forget(x[:50], y[:50])
+    forgotten_lnr = LinearRegression().fit(x[50:], y[50:])
+
+    #assert
+    np.testing.assert_allclose(online_rdg.coef_, full_rdg.coef_, rtol=1e-8)
+    assert online_rdg.intercept_ == pytest.approx(full_rdg.intercept_)
+    np.testing.assert_allclose(online_lnr.coef_, forgotten_lnr.coef_, rtol=1e-8)
+    np.testing.assert_allclose(online_lnr.predict(x), forgotten_lnr.predict(x), rtol=1e-8)
+    assert online_rdg.n_samples_seen_ == 100
+    assert list(online_rdg.feature_names_in_) == list(x.columns)
+    np.testing.assert_allclose(online_lnr_coef, full_lnr.coef_, rtol=1e-8)
+
+def test_online_linear_forget_within_window():
+    #arrange
+    rng = np.random.default_rng(1)
+    x = pd.DataFrame(rng.normal(size=(80, 2)), columns=["AAA.JK", "BBB.JK"])
+    y = pd.Series(x.to_numpy() @ [2.0, -1.0] + rng.normal(scale=0.1, size=80))
+    online_rdg = online_linear.OnlineLinearRegression(alpha=1.0, window=30).fit(x[:30], y[:30])
+
+    #act
+    online_rdg.forget(x[10:12], y[10:12])
+    for row in range(30, 45):
+        online_rdg.partial_fit(x[row:row + 1], y[row:row + 1])
+    kept = list(range(15, 45))
+    full_rdg = Ridge(alpha=1.0).fit(x.iloc[kept], y.iloc[kept])
+
+    #assert
+    assert online_rdg.n_samples_seen_ == len(online_rdg.rows_) == 30
+    np.testing.assert_allclose(online_rdg.coef_, full_rdg.coef_, rtol=1e-8)
+    with pytest.raises(ValueError):
+        online_rdg.forget(x[:1], y[:1])
+
+def test_successive_halving_reuses_cached_folds(tmp_path):
+    #arrange
+    config = utils.load_config()
+    config.update({"search_cache_path": str(tmp_path / "search_cache.db"), "search_n_splits": 3, "search_factor": 3,
+                   "search_min_resources": 20, "search_max_fits": None, "search_max_seconds": None, "search_workers": 2})
+    rng = np.random.default_rng(0)
+    x_train = pd.DataFrame({"AAA.JK": rng.normal(size=240)})
+    y_train = pd.Series(3 * x_train["AAA.JK"] + rng.normal(scale=0.1, size=240))
+
+    #act
+    first = search.successive_halving(Ridge(), {"alpha": [0.01, 1.0, 100.0]}, x_train, y_train, config)
+    second = search.successive_halving(Ridge(), {"alpha": [0.01, 1.0, 100.0, 1000.0, "invalid"]}, x_train, y_train, config)
+    config["search_max_fits"] = 6
+    budgeted = search.successive_halving(Ridge(), {"alpha": [0.1, 10.0]}, x_train, y_train, config)
+
+    #assert
+    assert search.resource_schedule(180, 20, 3) == [20, 60, 180]
+    assert first["best_params"] == {"alpha": 0.01}
+    assert first["history"][0] == {"rung": 0, "resource": 20, "candidates": 3, "fits": 9, "cache_hits": 0}
+    assert second["history"][0]["fits"] == 6 and second["history"][0]["cache_hits"] == 9
+    assert second["best_params"] == {"alpha": 0.01}
+    assert budgeted["fits"] == 6 and budgeted["history"][0]["candidates"] == 1 and len(budgeted["history"]) == 2
+
+def test_train_eval_resumes_from_run_manifest(tmp_path, monkeypatch):
+    #arrange
+    config = utils.load_config()
+    config.update({"training_log_path": str(tmp_path / "training_log.db"), "run_manifest_dir": str(tmp_path / "runs"),
+                   "run_manifest_enabled": True, "training_workers": 1})
+    list_of_model = [
+        {"model_name": "LinearRegression", "model_object": LinearRegression(), "model_uid": ""},
+        {"model_name": "Ridge", "model_object": Ridge(), "model_uid": ""},
+    ]
+    trained_tasks = []
+    run_tasks = modelling.parallel.run_tasks
+    def interrupted_run_tasks(function, tasks, *args):
+        # First run crashes after checkpointing three tasks
+        trained_tasks.append(len(tasks))
+        if len(trained_tasks) == 1:
+            run_tasks(function, tasks[:3], *args)
+            raise RuntimeError("interrupted")
+        return run_tasks(function, tasks, *args)
+    monkeypatch.setattr(modelling.parallel, "run_tasks", interrupted_run_tasks)
+
+    #act
+    with pytest.raises(RuntimeError):
+        modelling.train_eval("Test", config, list_of_model)
+    _, resumed_log = modelling.train_eval("Test", config, list_of_model)
+    remaining = list((tmp_path / "runs" / "Test").glob("*/*")) + list((tmp_path / "runs" / "Test").glob("*.jsonl"))
+    config["run_manifest_enabled"] = False
+    _, full_log = modelling.train_eval("Test", config, list_of_model)
+
+    #assert
+    assert trained_tasks == [trained_tasks[0], trained_tasks[0] - 3, trained_tasks[0]]
+    assert remaining == []
+    assert resumed_log["model_uid"] == full_log["model_uid"]
+    np.testing.assert_allclose(resumed_log["mse"], full_log["mse"])
+
+def test_get_production_model_references_best_model(tmp_path):
+    #arrange
+    config = utils.load_config()
+    config.update({"model_registry_dir": str(tmp_path / "registry"), "training_log_path": str(tmp_path / "training_log.db"),
+                   "run_manifest_dir": str(tmp_path / "runs")})
+    list_of_model = [
+        {"model_name": "LinearRegression", "model_object": LinearRegression(), "model_uid": ""},
+        {"model_name": "Ridge", "model_object": Ridge(alpha=1e6), "model_uid": ""},
+    ]
+    list_of_trained_model, training_log = modelling.train_eval("Test", config, list_of_model)
+
+    #act
+    production_model, production_model_log, training_log = modelling.get_production_model(list_of_trained_model, training_log, config)
+    config.update({"selection_metric": "backtest_mse", "backtest_enabled": False})
+    fallback_model, _, _ = modelling.get_production_model(list_of_trained_model, training_log, config)
+
+    #assert
+    best = pd.DataFrame(training_log).sort_values("mse").iloc[0]
+    trained_objects = [model["model_object"] for models in list_of_trained_model.values() for model in models]
+    assert production_model["model_log"]["model_uid"] == best["model_uid"]
+    assert any(production_model["model_data"]["model_object"] is model_object for model_object in trained_objects)
+    assert fallback_model["model_log"]["model_uid"] == best["model_uid"]
+
+def test_model_registry_lazy_load_and_promote(tmp_path):
+    #arrange
+    x_train = pd.DataFrame({"AAA.JK": [1.0, 2.0, 3.0, 4.0]})
+    y_train = pd.Series([2.0, 4.0, 6.0, 8.0], name="target")
+    fingerprint = registry.data_fingerprint(x_train, y_train)
+    model_object = LinearRegression().fit(x_train, y_train)
+    uid = registry.model_uid(model_object, ["AAA.JK"], fingerprint)
+    model_registry = registry.ModelRegistry(str(tmp_path))
+
+    #act
+    model_registry.register({"model_name": "LinearRegression", "model_object": model_object, "model_uid": uid}, {"mse": 0.0}, ["AAA.JK"], fingerprint)
+    model_registry.register({"model_name": "LinearRegression", "model_object": model_object, "model_uid": uid}, {"mse": 0.0}, ["AAA.JK"], fingerprint)
+    model_registry.promote(uid)
+    production_model = registry.ModelRegistry(str(tmp_path)).load_stage("production")
+    first, second = registry.ModelRegistry(str(tmp_path)), registry.ModelRegistry(str(tmp_path))
+    first.register({"model_name": "Ridge", "model_object": Ridge().fit(x_train, y_train), "model_uid": ""}, {"mse": 1.0}, ["AAA.JK"], fingerprint)
+    second.register({"model_name": "Ridge", "model_object": Ridge(alpha=2.0).fit(x_train, y_train), "model_uid": ""}, {"mse": 2.0}, ["AAA.JK"], fingerprint)
+    reloaded = registry.ModelRegistry(str(tmp_path))
+    unseeded = [registry.model_uid(RandomForestRegressor(n_estimators=3).fit(x_train, y_train), ["AAA.JK"], fingerprint) for _ in range(2)]
+    seeded = [registry.model_uid(RandomForestRegressor(n_estimators=3, random_state=0).fit(x_train, y_train), ["AAA.JK"], fingerprint) for _ in range(2)]
+
+    #assert
+    assert uid == registry.model_uid(LinearRegression(), ["AAA.JK"], fingerprint)
+    assert uid != registry.model_uid(Ridge(), ["AAA.JK"], fingerprint)
+    assert len(reloaded.find("Ridge")) == 2 and len(reloaded.find("LinearRegression")) == 1
+    assert len(os.listdir(tmp_path / "objects")) == 3
+    assert unseeded[0] != unseeded[1] and seeded[0] == seeded[1]
+    assert production_model["model_data"]["model_object"].model_object is None
+    assert production_model["model_data"]["model_object"].predict(x_train).tolist() == pytest.approx(y_train.tolist())
+    assert production_model["model_log"]["mse"] == 0.0
+
+def test_training_log_store_queries(tmp_path):
+    #arrange
+    store = log_store.TrainingLogStore(str(tmp_path / "training_log.db"))
+    records = [
+        {"model_name": "Baseline-Ridge", "model_uid": "a", "training_time": 0.1, "training_date": "2023-04-12", "mse": 3.0},
+        {"model_name": "Baseline-Ridge", "model_uid": "b", "training_time": 0.1, "training_date": "2023-04-12", "mse": 2.0},
+        {"model_name": "Baseline-XGBRegressor", "model_uid": "c", "training_time": 0.5, "training_date": "2023-04-12", "mse": 2.5},
+    ]
+
+    #act
+    store.append_many(records[:2], run_id="run-1")
+    store.append(records[2], run_id="run-2")
+    store.append({"model_name": "Production-XGBRegressor", "model_uid": "c", "training_time": 0.5, "training_date": "2023-04-13", "mse": 2.5}, run_id="run-2")
+
+    #assert
+    assert store.best("run-1")["model_uid"] == "b"
+    assert store.best("run-2", "backtest_mse") is None
+    assert [(row["model_family"], row["mse"]) for row in store.best_per_family()] == [("Ridge", 2.0), ("XGBRegressor", 2.5)]
+    assert [row["model_family"] for row in store.best_per_family(last_n_runs=1)] == ["XGBRegressor"]
+    assert [row["model_name"] for row in store.find(model_uid="c")] == ["Baseline-XGBRegressor", "Production-XGBRegressor"]
+    assert len(store.find(since="2023-04-13")) == 1
+
+def test_pipeline_stage_cache_hits_and_restores(tmp_path, monkeypatch):
+    #arrange
+    config = {"stage_cache_dir": str(tmp_path / "cache"), "stage_cache_max_bytes": None, "stage_cache_max_age_days": 30,
+              "input_path": str(tmp_path / "input.txt"), "output_path": str(tmp_path / "output.txt"), "factor": 2}
+    (tmp_path / "input.txt").write_text("1")
+    stage = {"name": "double", "module": None, "depends_on": [], "inputs": ["input_path"], "outputs": ["output_path"],
+             "config_keys": ["factor"], "code": ["pipeline.py"], "daily": False}
+    declared_outputs = [output for declared in pipeline.STAGES for output in declared["outputs"]]
+    runs = []
+    def run_stage(stage, params):
+        runs.append(stage["name"])
+        (tmp_path / "output.txt").write_text(str(int((tmp_path / "input.txt").read_text()) * params["factor"]))
+    monkeypatch.setattr(pipeline, "STAGES", [stage])
+    monkeypatch.setattr(pipeline, "run_stage", run_stage)
+
+    #act
+    first = pipeline.run(config)
+    second = pipeline.run(config)
+    (tmp_path / "output.txt").write_text("corrupted")
+    restored = pipeline.run(config)
+    restored_output = (tmp_path / "output.txt").read_text()
+    config["factor"] = 3
+    changed = pipeline.run(config)
+    cache = stage_cache.StageCache(config["stage_cache_dir"], max_bytes=1)
+
+    #assert
+    assert [report[0]["status"] for report in (first, second, restored, changed)] == ["miss", "hit", "hit", "miss"]
+    assert restored_output == "2" and (tmp_path / "output.txt").read_text() == "3"
+    assert runs == ["double", "double"]
+    assert "model_registry_dir" not in declared_outputs
+    assert len(cache.entries()) == 2
+    assert cache.evict() == [first[0]["key"]] and [key for key, _ in cache.entries()] == [changed[0]["key"]]
+
+def test_dashboard_snapshot_cached_until_artifacts_change(tmp_path, monkeypatch):
+    #arrange
+    config = utils.load_config()
+    index = pd.date_range(start="2023-01-02", periods=1000, freq="B")
+    prices = pd.DataFrame({"BMRI.JK": np.arange(1000.0) + 100, "^JKSE": np.arange(1000.0) + 50}, index=index)
+    monkeypatch.setattr(utils, "STORAGE_FORMAT", "pickle")
+    for key, data in (("raw_dataset_path", prices), ("predict_dataset_path", prices["BMRI.JK"] + 2), ("clean_dataset_path", prices / 100)):
+        config[key] = str(tmp_path / "{}.pkl".format(key))
+        utils.pickle_dump(data, config[key])
+    config.update({"dashboard_snapshot_path": str(tmp_path / "snapshot.pkl"), "dashboard_max_points": 100, "dashboard_cache_ttl_s": 0})
+    monkeypatch.setattr(dashboard_data, "_cache", {"snapshot": None, "key": None, "checked_at": 0.0})
+
+    #act
+    written = dashboard_data.write_snapshot(config)
+    served = dashboard_data.get_snapshot(config)
+    served_again = dashboard_data.get_snapshot(config)
+    os.utime(config["predict_dataset_path"], (0, 0))
+    rebuilt = dashboard_data.get_snapshot(config)
+
+    #assert
+    assert served is served_again and rebuilt is not served
+    assert written["metrics"]["latest_price"] == 1099.0 and written["metrics"]["price_var"] == 2.0
+    assert len(written["stock_price"]) == 200 and written["stock_price"]["date"].max() == index[-1]
+    assert written["daily"]["symmetric_range"].index[0] == index[-1] and len(written["daily"]["data"]) == 10
+
+def test_downsample_keeps_extremes_per_symbol():
+    #arrange
+    index = pd.date_range(start="2023-01-02", periods=1000, freq="B")
+    price = pd.Series(np.sin(np.arange(1000) / 50.0), index=index)
+    price.iloc[333] = 5.0
+    history = pd.concat([
+        price.rename("price").to_frame().assign(symbol="Actual"),
+        price.iloc[:400].rename("price").to_frame().assign(symbol="Prediction"),
+    ]).rename_axis("date").reset_index()
+
+    #act
+    lttb = downsample.zoom(history, max_points=50, method="lttb")
+    minmax = downsample.zoom(history, max_points=50, method="minmax")
+    zoomed = downsample.zoom(history, index[100], index[139], max_points=50)
+
+    #assert
+    for chart in [lttb, minmax]:
+        actual = chart[chart["symbol"] == "Actual"]
+        assert len(actual) <= 52 and actual["date"].is_monotonic_increasing
+        assert actual["date"].iloc[0] == index[0] and actual["date"].iloc[-1] == index[-1]
+        assert actual["price"].max() == 5.0
+    assert len(lttb[lttb["symbol"] == "Prediction"]) == 50
+    assert len(zoomed) == 80 and zoomed["date"].min() == index[100]
+
+def test_instrument_trace_metrics_and_profile(tmp_path, monkeypatch):
+    #arrange
+    monkeypatch.setattr(instrument, "_metrics", dict())
+    monkeypatch.setattr(instrument, "_settings", {"trace_enabled": True, "trace_path": str(tmp_path / "trace.jsonl"), "profile_stages": ["fit"],
+                                                  "profile_backend": "cprofile", "profile_dir": str(tmp_path / "profiles")})
+    instrument.close_trace()
+
+    @instrument.timed("double")
+    def double(data):
+        return data * 2
+
+    #act
+    with instrument.span("load", path="prices") as record:
+        record.update(instrument.shape(pd.DataFrame(np.ones((10, 3)))))
+    with instrument.profile("fit") as profile_path, instrument.span("fit"):
+        double(np.ones(5))
+    with pytest.raises(ValueError), instrument.span("fit"):
+        raise ValueError
+    with instrument.span("predict", 0.0):
+        pass
+    instrument.close_trace()
+    trace = instrument.load_trace(str(tmp_path / "trace.jsonl"))
+    summary = instrument.summarize(trace)
+    instrument.configure(trace_max_bytes=1)
+    for _ in range(2):
+        with instrument.span("load"):
+            pass
+    instrument.close_trace()
+
+    #assert
+    assert list(trace["span"]) == ["load", "double", "fit", "fit"]
+    assert trace["rows"].iloc[0] == 10 and trace["columns"].iloc[0] == 3 and trace["error"].iloc[-1] == "ValueError"
+    assert summary.loc["fit", "count"] == 2 and summary.loc["load", "rows"] == 10
+    assert os.path.isfile(profile_path) and profile_path.endswith(".prof")
+    assert 'stock_span_seconds_count{span="fit"} 2' in instrument.metrics_text()
+    assert 'stock_span_seconds_count{span="predict"} 1' in instrument.metrics_text()
+    assert len(instrument.load_trace(str(tmp_path / "trace.jsonl"))) == 1 and os.path.isfile(str(tmp_path / "trace.jsonl.1"))
+
+def test_benchmark_synthetic_panel_and_regressions():
+    #arrange
+    config = {"n_tickers": 40, "n_days": 500}
+    baseline = {"config": config, "results": {"fit_s": 1.0, "load_s": 0.001, "predict_p50_ms": 10.0}}
+
+    #act
+    prices = benchmark.synthetic_price_panel(40, 500, seed=1, nan_density=0.02, delisted=0.25)
+    regressions = benchmark.detect_regressions({"config": config, "results": {"fit_s": 1.5, "load_s": 0.003, "predict_p50_ms": 11.0}}, baseline, 0.25)
+    other_data = benchmark.detect_regressions({"config": {"n_tickers": 80, "n_days": 500}, "results": {"fit_s": 9.0}}, baseline, 0.25)
+
+    #assert
+    assert prices.shape == (500, 40) and (prices.stack() > 0).all()
+    assert prices.isna().all(axis=0).sum() == 0 and prices.iloc[:50].isna().all(axis=0).sum() + prices.iloc[-50:].isna().all(axis=0).sum() == 10
+    assert 0.02 < prices.isna().to_numpy().mean() < 0.2
+    assert [regression["metric"] for regression in regressions] == ["fit_s"] and other_data == []
+
+def test_api_predict_batch():
+    #arrange
+    x_train = pd.DataFrame({"^JKSE": [1.0, 2.0, 3.0, 4.0], "^JKII": [0.0, 1.0, 0.0, 1.0]})
+    y_train = pd.Series([2.0, 4.0, 6.0, 8.0])
+    api.production_cache.swap("test", {"model_data": {"model_name": "LinearRegression", "model_object": LinearRegression().fit(x_train, y_train), "model_uid": ""}})
+    client = TestClient(api.app)
+
+    #act
+    response = client.post("/predict/", json={"rows": [{"^JKSE": 5.0, "^JKII": 0.0}, {"^JKII": 1.0, "^JKSE": 6.0}]}).json()
+    invalid = client.post("/predict/", json={"rows": [{"^JKSE": 5.0, "^JKII": 0.0}, {"^JKSE": 6.0}]}).json()
+    empty = client.post("/predict/", json={"rows": []}).json()
+    metrics = client.get("/metrics").text
+
+    #assert
+    assert response["res"] == pytest.approx([10.0, 12.0])
+    assert 'stock_span_seconds_count{span="predict"}' in metrics
+    assert response["error_msg"] == ""
+    assert invalid["res"] == []
+    assert invalid["error_msg"].startswith("1 of 2 row(s)")
+    assert empty["res"] == [] and empty["error_msg"].startswith("No rows to predict")
+
+def test_multi_target_models_served_by_ticker(tmp_path, monkeypatch):
+    #arrange
+    config = utils.load_config()
+    config.update({"model_registry_dir": str(tmp_path / "registry"), "training_log_path": str(tmp_path / "training_log.db"),
+                   "multi_target_models": ["LinearRegression", "Ridge"], "multi_target_workers": 2, "feature_top_k": 2})
+    prices = pd.DataFrame(1000 * np.exp(np.cumsum(np.random.default_rng(0).normal(0, 0.02, size=(120, 4)), axis=0)),
+                          index=pd.date_range(start="2023-01-02", periods=120, freq="B"), columns=["AAA.JK", "BBB.JK", "CCC.JK", "DDD.JK"])
+    prices.iloc[10, 3] = 0.0
+    monkeypatch.setitem(api.config_data, "model_registry_dir", config["model_registry_dir"])
+    api.ticker_caches.clear()
+    client = TestClient(api.app)
+
+    #act
+    best = multi_target.train_targets(config, prices, (prices.index[79], prices.index[99]), ["AAA.JK", "CCC.JK", "DDD.JK"])
+    features = list(best["CCC.JK"]["model_data"]["model_object"].feature_names_in_)
+    response = client.post("/predict/", json={"rows": [{feature: 1.0 for feature in features}], "ticker": "CCC.JK"}).json()
+    missing = client.post("/predict/", json={"rows": [{feature: 1.0 for feature in features}], "ticker": "BBB.JK"})
+    traversal = client.post("/predict/", json={"rows": [{feature: 1.0 for feature in features}], "ticker": "../stages/production"})
+
+    #assert
+    assert sorted(best) == ["AAA.JK", "CCC.JK"]
+    assert features == best["CCC.JK"]["model_log"]["features"] and len(features) == 2
+    assert registry.ModelRegistry(config["model_registry_dir"]).stage_uid("production-CCC.JK") == best["CCC.JK"]["model_data"]["model_uid"]
+    assert response["res"] == pytest.approx(best["CCC.JK"]["model_data"]["model_object"].predict(pd.DataFrame([[1.0, 1.0]], columns=features)).tolist())
+    assert missing.status_code == 404 and missing.json()["error_msg"] == "No model has been promoted for ticker BBB.JK."
+    assert traversal.status_code == 404 and sorted(api.ticker_caches) == ["CCC.JK"]
+    assert log_store.TrainingLogStore(config["training_log_path"]).count() == 4
+
+def test_micro_batcher_merges_concurrent_requests():
+    #arrange
+    calls = []
+    def predict_fn(data):
+        calls.append(len(data))
+        return data["x"].to_numpy() * 2
+
+    predict_batcher = batcher.MicroBatcher(predict_fn, max_batch_size=4, max_wait_ms=50)
+    requests = [pd.DataFrame({"x": [float(i)] * (1 + i % 2)}) for i in range(5)]
+
+    async def submit_all():
+        return await asyncio.gather(*[predict_batcher.submit(data) for data in requests])
+
+    #act
+    results = asyncio.run(submit_all())
+
+    #assert
+    assert calls == [4, 3]
+    assert [result.tolist() for result in results] == [[0.0], [2.0, 2.0], [4.0], [6.0, 6.0], [8.0]]
+
+def test_model_cache_hot_reload_and_rollback(tmp_path, monkeypatch):
+    #arrange
+    x_train = pd.DataFrame({"AAA.JK": [1.0, 2.0, 3.0, 4.0]})
+    y_train = pd.Series([2.0, 4.0, 6.0, 8.0])
+    model_registry = registry.ModelRegistry(str(tmp_path))
+    first = model_registry.register({"model_name": "LinearRegression", "model_object": LinearRegression().fit(x_train, y_train), "model_uid": "first"})
+    second = model_registry.register({"model_name": "Ridge", "model_object": Ridge().fit(x_train, y_train), "model_uid": "second"})
+    production_cache = model_cache.ModelCache(str(tmp_path), poll_interval=0)
+
+    #act
+    model_registry.promote(first)
+    served_first = production_cache.get()
+    model_registry.promote(second)
+    reloaded = production_cache.refresh()
+    served_second = production_cache.get()
+    reloads = []
+    reload = registry.ModelRegistry.reload
+    monkeypatch.setattr(registry.ModelRegistry, "reload", lambda self: reloads.append(self.root) or reload(self))
+    unchanged = production_cache.refresh()
+    reloads_on_refresh = list(reloads)
+    rolled_back = production_cache.rollback()
+    pointer = model_registry.stage_uid("production")
+    with open(model_registry.stage_path("production"), "w") as file:
+        file.write("missing")
+    production_cache.last_refresh = 0
+    served_after_error = production_cache.get(max_age=0)
+    production_cache.last_refresh = 0
+    production_cache.get(max_age=0)
+
+    #assert
+    assert served_first["model_data"]["model_name"] == "LinearRegression"
+    assert reloaded and served_second["model_data"]["model_name"] == "Ridge"
+    assert not unchanged and reloads_on_refresh == []
+    assert rolled_back == first and production_cache.get() is served_first
+    assert pointer == first
+    assert production_cache.status()["swaps"] == 3
+    assert served_after_error is served_first
+    assert production_cache.status()["reload_errors"] == 2 and "missing" in production_cache.status()["last_reload_error"]
@@ -1,7 +1,8 @@
 import yaml
-import joblib
 from datetime import datetime
 import pandas as pd
+import store as store
+import os
 
 config_dir = "config/config.yaml"
 
@@ -20,19 +21,80 @@ def load_config() -> dict:
     # Return params in dict format
     return config
 
-def pickle_load(file_path: str):
-    # Load and return pickle file
-    return joblib.load(file_path)
+def pickle_load(file_path: str, columns: list = None, start=None, end=None):
+    # Time every load with the size of what was read
+    import instrument as instrument
+
+    with instrument.span("pickle_load", path=file_path) as record:
+        data = read_artifact(file_path, columns, start, end)
+        record.update(instrument.shape(data))
+
+    return data
+
+def read_artifact(file_path: str, columns: list = None, start=None, end=None):
+    # Read only the requested columns and date range from the columnar store, unless the pickle is newer
+    if store.use_store(file_path):
+        return store.load_frame(file_path, columns, start, end)
+
+    # joblib is only imported when a pickle is actually read or written
+    import joblib
+
+    # Load pickle file and return the requested selection
+    return store.select_frame(joblib.load(file_path), columns, start, end)
 
 def pickle_dump(data, file_path: str) -> None:
+    # Time every dump with the size of what was written
+    import instrument as instrument
+
+    with instrument.span("pickle_dump", path=file_path, **instrument.shape(data)):
+        write_artifact(data, file_path)
+
+def write_artifact(data, file_path: str) -> None:
+    # Dump date indexed frames into the columnar store if configured
+    if STORAGE_FORMAT is None:
+        get_params()
+
+    # The other format is removed, so readers never get stale data from it
+    if STORAGE_FORMAT == "arrow" and store.is_frame(data):
+        store.dump_frame(data, file_path)
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+        return
+
     # Dump data into file
+    import joblib
     joblib.dump(data, file_path)
+    store.remove_store(file_path)
+
+def artifact_mtime(file_path: str) -> float:
+    # Modification time of an artifact, either its columnar store or its pickle, whichever is read
+    if store.use_store(file_path):
+        return os.path.getmtime(os.path.join(store.store_path(file_path), store.META_FILE))
+
+    return os.path.getmtime(file_path)
 
-params = load_config()
-PRINT_DEBUG = params["print_debug"]
+# Configuration is loaded on first use, not at import
+params = None
+PRINT_DEBUG = None
+STORAGE_FORMAT = None
+
+def get_params() -> dict:
+    # Load configuration once per process
+    global params, PRINT_DEBUG, STORAGE_FORMAT
+    if params is None:
+        params = load_config()
+        if PRINT_DEBUG is None:
+            PRINT_DEBUG = params["print_debug"]
+        if STORAGE_FORMAT is None:
+            STORAGE_FORMAT = params.get("storage_format", "pickle")
+
+    return params
 
 def print_debug(messages: str) -> None:
     # Check whether user wants to use print
+    if PRINT_DEBUG is None:
+        get_params()
+
     if PRINT_DEBUG == True:
         print(time_stamp(), messages)
 